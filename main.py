@@ -1,8 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import json
 import pydirectinput
-import pyautogui
 import time
 import random
 import pygetwindow as gw
@@ -10,67 +8,264 @@ import cv2
 import numpy as np
 from PIL import Image, ImageTk, ImageSequence
 import threading
-from pynput import mouse, keyboard as pynput_keyboard
-from pynput.keyboard import Key, Controller as KeyboardController
+from concurrent.futures import ThreadPoolExecutor
+from pynput import keyboard as pynput_keyboard
+from pynput.keyboard import Key
 import os
 import re
-import easyocr
 from datetime import datetime
 from modules.ui import setup_ui
-
-try:
-    import pytesseract
-except ImportError:
-    pytesseract = None
-
-
-# --- Helper for key conversion during playback ---
-def convert_key_str(key_str):
-    """
-    Converts a stored key string back to a key value.
-    For special keys, returns the appropriate pynput Key value.
-    For normal keys, returns the character.
-    """
-    if key_str.startswith("Key."):
-        key_name = key_str.split(".")[1]
-        try:
-            return getattr(Key, key_name)
-        except AttributeError:
-            return key_str
-    else:
-        return key_str.strip("'")
+from modules.capture import RegionFrame, create_frame_source
+from modules.frame_bus import FrameBus, crop_frame
+from modules.macro import MOVE, CompiledMacro, load_macro, save_macro
+from modules.convert import BufferPool
+from modules.optimizer import format_report, optimize_macro
+from modules.conditions import ConditionEngine
+from modules.dispatch import ABORT_EXCEPTIONS, create_input_backend
+from modules.playback import PlaybackClock, run_macro
+from modules.recorder import MacroRecorder
+from modules.sessions import OCRWorker, SessionManager
+from modules.matching import CompiledTemplate, Match, TemplateMatcher, TiledDetector
+from modules.template_store import TemplateStore
+from modules.ocr import OCRCache, OCRReader
+from modules.ocr_engines import EasyOCREngine, GlyphEngine, OCRRouter, TesseractEngine
+from modules.resources import ResourceTracker
+from modules.tesseract import TesseractPool
+
+TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+SQUAD_PATTERN = r"(\d)/5"  # Squad counter, e.g. "3/5"
 
 
 # --- Macro System (for automation) ---
 class ImageMacroSystem:
-    def __init__(self, templates, log_message, reader):
+    def __init__(
+        self,
+        templates,
+        log_message,
+        reader,
+        frame_source=None,
+        detect_workers=None,
+        tesseract_cmd=None,
+    ):
         self.templates = templates
         self.log_message = log_message
         self.reader = reader
+        self.frame_source = frame_source or create_frame_source("pyautogui")
+        self.frame_buses = {}  # One capture loop per window
+        self._bus_lock = threading.Lock()
+        self.roi_only = False  # Capture only registered regions
+        self.buffers = BufferPool()  # Match result maps and frame pyramids
+        self.matcher = TemplateMatcher(self.buffers, workers=detect_workers)
+        # Splits full-resolution searches of large windows across threads
+        self.detector = TiledDetector(self.matcher, workers=detect_workers)
+        # Full searches (no known location, or confirming a weak pyramid
+        # match) of match_template and detect_many run tiled as well
+        self.matcher.full_search = self.detector.match_full
+        self.compiled = {}  # Template name -> CompiledTemplate
+        self.ocr_cache = OCRCache()  # Results of every OCR engine by crop hash
+        # Tesseract workers stay alive between calls; tesseract_cmd()
+        # returns the configured executable
+        self.tesseract = TesseractPool(
+            tesseract_cmd or (lambda: TESSERACT_CMD), log_message=log_message
+        )
+        # Each read goes to the cheapest engine able to answer it; digit
+        # glyphs are added once sample crops are loaded. All reads, from
+        # every window's session, are queued to one OCR worker thread
+        self.ocr = OCRWorker(
+            OCRRouter(
+                [EasyOCREngine(reader), TesseractEngine(self.tesseract)],
+                self.ocr_cache,
+            )
+        )
 
-    def detect_template(self, game_window, template_name):
-        template = self.templates.get(template_name)
+    def match_template(self, game_window, template_name):
+        """
+        Best match of a template in the latest frame of the window.
+        Returns (score, (x, y)) with the top-left corner in window coordinates,
+        or None. The last known location is searched first, and results are
+        reused while the searched region is unchanged.
+        """
+        template = self.get_compiled_template(template_name)
         if template is None:
             self.log_message(f"Template '{template_name}' not found.", "ERROR")
-            return False
-        #     return False
-        screenshot = self.get_screenshot(game_window)
-        result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-        return np.max(result) > 0.8
+            return None
+        bus = self.get_frame_bus(game_window)
+        context = self.window_key(game_window)
+        key = ("match", template_name)
+
+        # Look where the template was last seen first
+        rect = self.matcher.search_window(
+            template, context, (game_window.width, game_window.height)
+        )
+        if rect is not None:
+            # Fetch the frame first so the change tracker has seen it
+            window = bus.crop(rect, max_age=0.25)
+            match = bus.results.get(key, rect)
+            if match is None and window is not None:
+                match = self.matcher.match_window(
+                    window.image, template, context, rect[:2]
+                )
+                if match is not None:
+                    bus.results.put(key, rect, window.frame_id, match)
+            if match is not None:
+                self.track_search_window(game_window, template)
+                return match
+
+        # Fall back to searching the whole window
+        frame = self.latest_frame(game_window)
+        if frame is None:
+            return None
+        match = bus.results.get(key, None)
+        if match is None:
+            match = self.matcher.match_tracked(
+                frame.image, template, frame.frame_id, context
+            )
+            if match is None:
+                return None
+            bus.results.put(key, None, frame.frame_id, match)
+        self.track_search_window(game_window, template)
+        return match
+
+    def window_key(self, game_window):
+        return getattr(game_window, "_hWnd", None) or game_window.title
+
+    def track_search_window(self, game_window, template):
+        """
+        Keep the template's search window registered as a capture region,
+        so ROI-only capture still covers it.
+        """
+        rect = self.matcher.search_window(
+            template,
+            self.window_key(game_window),
+            (game_window.width, game_window.height),
+        )
+        self.set_capture_region(game_window, ("search", template.name), rect)
+
+    def log_tracking_stats(self):
+        """
+        Log how much full-window scanning the search windows avoided.
+        """
+        for name, stats in self.matcher.tracking_stats().items():
+            self.log_message(
+                f"Template '{name}': {stats['hits']} found in search window, "
+                f"{stats['misses']} missed, {stats['full']} full searches."
+            )
+
+    def log_ocr_stats(self):
+        stats = self.ocr_cache.stats()
+        self.log_message(
+            f"OCR cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['evictions']} evicted."
+        )
+
+    def detect_many(self, frame, template_names, game_window=None):
+        """
+        Evaluate many templates against a single frame in one pass.
+        frame is a Frame or a BGR image. Returns a dict of template name ->
+        Match(score, location, size), with locations in frame coordinates.
+        Pass the game_window the frame shows to use and update the templates'
+        last known locations in it.
+        """
+        templates = []
+        for name in template_names:
+            template = self.get_compiled_template(name)
+            if template is None:
+                self.log_message(f"Template '{name}' not found.", "ERROR")
+            else:
+                templates.append(template)
+        image = getattr(frame, "image", frame)
+        frame_key = getattr(frame, "frame_id", None)
+        context = self.window_key(game_window) if game_window else None
+        try:
+            return self.matcher.match_many(image, templates, frame_key, context)
+        except Exception as e:
+            self.log_message(f"Error during template detection: {str(e)}", "ERROR")
+            return {}
+
+    def find_all(self, game_window, template_name, threshold=0.8, frame=None):
+        """
+        Every instance of a template in a frame of the window (the latest
+        one by default), as a list of Match in window coordinates, best
+        first. Results are reused while the window is unchanged, so one
+        frame can drive several clicks.
+        """
+        template = self.get_compiled_template(template_name)
+        if template is None:
+            self.log_message(f"Template '{template_name}' not found.", "ERROR")
+            return []
+        if frame is not None:
+            return self._find_all(frame, template, threshold)
+
+        # Reuse the last result while the window shows the same thing;
+        # fetch the frame first so the change tracker has seen it
+        bus = self.get_frame_bus(game_window)
+        frame = self.latest_frame(game_window)
+        if frame is None:
+            return []
+        key = ("find_all", template_name)
+        cached = bus.results.get(key, None)
+        if cached is not None and cached[0] == threshold:
+            return cached[1]
+        matches = self._find_all(frame, template, threshold)
+        bus.results.put(key, None, frame.frame_id, (threshold, matches))
+        return matches
+
+    def _find_all(self, frame, template, threshold):
+        try:
+            return self.detector.find_all(frame.image, template, threshold)
+        except Exception as e:
+            self.log_message(f"Error during template detection: {str(e)}", "ERROR")
+            return []
+
+    def compile_template(self, template_name, image):
+        """
+        Precompute the matching pyramid of a template.
+        """
+        template = CompiledTemplate(template_name, image)
+        self.set_compiled_template(template_name, template)
+
+    def set_compiled_template(self, template_name, template):
+        self.compiled[template_name] = template
+        self.invalidate_template(template_name)
+
+    def get_compiled_template(self, template_name):
+        template = self.compiled.get(template_name)
+        image = self.templates.get(template_name)
+        if image is None:
+            return None
+        if template is None or template.image is not image:
+            # Added or replaced without load_templates, compile on demand
+            self.compile_template(template_name, image)
+            template = self.compiled[template_name]
+        return template
+
+    def invalidate_template(self, template_name):
+        """
+        Drop cached matches of a template that was reloaded or removed.
+        """
+        if template_name not in self.templates:
+            self.compiled.pop(template_name, None)
+        self.matcher.forget(template_name)
+        for bus in list(self.frame_buses.values()):
+            bus.results.invalidate(("match", template_name))
+            bus.results.invalidate(("find_all", template_name))
+
+    def detect_template(self, game_window, template_name):
+        match = self.match_template(game_window, template_name)
+        return match is not None and match[0] > 0.8
 
     def detect_text(self, image, pattern):
         """
-        Detect text in the given image using EasyOCR and match it against a regex pattern.
+        Detect text in the given image and match it against a regex pattern.
+        The cheapest OCR engine able to read what the pattern can match is
+        used, e.g. the digit glyphs for counters and EasyOCR for free text.
         """
         try:
             # Convert the image to grayscale (optional, but improves performance)
             gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
 
-            # Use EasyOCR to extract text
-            results = self.reader.readtext(gray)
-
-            # Combine all detected text into a single string
-            detected_text = " ".join([result[1] for result in results])
+            # Extract text, unless these pixels were read before
+            detected_text = self.ocr.read(gray, pattern=pattern) or ""
 
             # Log the detected text for debugging
             self.log_message(f"Detected text: {detected_text}")
@@ -90,47 +285,198 @@ class ImageMacroSystem:
             self.log_message(f"Error during text detection: {str(e)}", "ERROR")
             return None
 
-    def get_screenshot(self, game_window):
+    def grab_frame(self, region):
+        """
+        Grab a single Frame (BGR image, frame id, timestamp) of a screen region
+        given as (left, top, width, height), bypassing the frame bus.
+        """
         try:
-            img = pyautogui.screenshot(
-                region=(
+            frame = self.frame_source.grab(region)
+            if frame is None:
+                self.log_message("Frame source returned no frame.", "ERROR")
+            return frame
+        except Exception as e:
+            self.log_message(f"Error capturing screenshot: {str(e)}", "ERROR")
+            return None
+
+    def get_frame_bus(self, game_window):
+        """
+        Return the (started) frame bus capturing the given window.
+        """
+        key = self.window_key(game_window)
+        with self._bus_lock:
+            bus = self.frame_buses.get(key)
+            if bus is None:
+                bus = FrameBus(
+                    self.frame_source,
+                    lambda: (
+                        game_window.left,
+                        game_window.top,
+                        game_window.width,
+                        game_window.height,
+                    ),
+                    log_message=self.log_message,
+                )
+                bus.roi_only = self.roi_only
+                self.frame_buses[key] = bus
+            bus.start()
+        return bus
+
+    def set_roi_only(self, enabled):
+        """
+        Switch every frame bus between full-window and ROI-only capture.
+        """
+        self.roi_only = enabled
+        with self._bus_lock:
+            for bus in self.frame_buses.values():
+                bus.roi_only = enabled
+
+    def set_capture_region(self, game_window, key, region):
+        """
+        Register a window-relative (x, y, width, height) region that must be
+        captured every tick, or remove it with region=None.
+        """
+        self.get_frame_bus(game_window).set_region(key, region)
+
+    def latest_frame(self, game_window, max_age=0.25):
+        """
+        Latest frame of the whole window from its frame bus.
+        """
+        frame = self.get_frame_bus(game_window).latest(max_age)
+        if isinstance(frame, RegionFrame):
+            # ROI-only capture is on, full-window consumers grab for themselves
+            frame = self.grab_frame(
+                (
                     game_window.left,
                     game_window.top,
                     game_window.width,
                     game_window.height,
                 )
             )
-            return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        if frame is None:
+            self.log_message("No frame available for the game window.", "ERROR")
+        return frame
+
+    def crop_regions(self, game_window, regions, max_age=0.25):
+        """
+        Views of several window-relative (x, y, width, height) regions, all
+        from the same frame. Returns a list of images, or None.
+        """
+        frame = self.get_frame_bus(game_window).latest(max_age)
+        crops = [crop_frame(frame, region) for region in regions]
+        if frame is None or any(crop is None for crop in crops):
+            # Some region is not captured (ROI-only capture), grab it all
+            frame = self.latest_frame(game_window, max_age)
+            if frame is None:
+                return None
+            crops = [crop_frame(frame, region) for region in regions]
+        return [None if crop is None else crop.image for crop in crops]
+
+    def region_frame(self, game_window, region, max_age=0.25):
+        """
+        Latest zero-copy view of a window-relative (x, y, width, height) region.
+        """
+        try:
+            return self.get_frame_bus(game_window).crop(region, max_age)
         except Exception as e:
-            self.log_message(f"Error capturing screenshot: {str(e)}", "ERROR")
+            self.log_message(f"Error capturing region: {str(e)}", "ERROR")
             return None
 
+    def wait_for_settle(self, game_window, region, settle, timeout, running=None):
+        """
+        Block until the window-relative region has changed and then not
+        changed for `settle` seconds, driven by new frames from the frame
+        bus. Returns True once it settled, False after timeout seconds or
+        when running() turns false. A region that never changes (a static
+        loading screen, a transition that has not started) runs to the
+        timeout, as do ROI-only frames, which are not diffed.
+        """
+        bus = self.get_frame_bus(game_window)
+        deadline = time.perf_counter() + timeout
+        frame = bus.latest()
+        last_id = frame.frame_id if frame else 0
+        still_since = None  # Time of the last change
+        while True:
+            now = time.perf_counter()
+            if still_since is not None and now - still_since >= settle:
+                return True
+            if now >= deadline or (running is not None and not running()):
+                return False
+            frame = bus.next_frame(last_id, timeout=min(deadline - now, 0.5))
+            if frame is None:
+                continue
+            if bus.changes.changed_since(region, last_id):
+                still_since = time.perf_counter()
+            last_id = frame.frame_id
+
+    def get_screenshot(self, game_window):
+        frame = self.latest_frame(game_window)
+        return None if frame is None else frame.image
+
+    def close(self):
+        for bus in self.frame_buses.values():
+            bus.stop()
+        self.frame_buses.clear()
+        self.frame_source.close()
+        self.matcher.close()
+        self.detector.close()
+        self.ocr.close()
+        self.tesseract.close()
+
 
 # --- Main Application ---
 class AutoBotApp:
     def __init__(self, root):
+        self.started_at = time.perf_counter()
         self.root = root
         self.root.geometry("510x700")  # Adjusted for vertical layout
         self.running = threading.Event()  # Use threading.Event for thread safety
         self.recording = False
         self.preview_running = False
+        self.preview_frame_id = 0
+        self.preview_image = None
+        self.preview_window = None
+        self.preview_fps = 10  # Display rate
+        self.preview_ocr_interval = 1.0  # Seconds between OCR overlay passes
+        self.preview_ocr_at = 0.0
+        self.preview_ocr_future = None
+        self.preview_ocr_results = []
+        self.preview_shown_results = None
+        self.preview_ocr_dropped = 0
+        self.preview_executor = None
         self.game_window = None
         self.templates = {}
+        self.template_store = None
 
         # Macro Controls
         self.macro_system = None
-        self.k_listener = None
-        self.m_listener = None
-        self.recorded_macro = []
+        self.recorder = MacroRecorder(log_message=self.log_message)
+        self.recorded_macro = None  # CompiledMacro of the last recording
         self.loaded_macros = {}
-        self.record_start_time = None
+        self.compiled_macros = {}  # Macro name -> CompiledMacro
+        # Sends all macro and click input, without pyautogui's per-call pause
+        self.input = create_input_backend(os.environ.get("DLS_INPUT_BACKEND"))
         self.playback_speed = 1.0
         self.setup_kill_switch()
         self.repeat_count_var = tk.IntVar(value=1)  # Default to 1 repetition
         # Initialize the macro system
-        self.reader = easyocr.Reader(["en"])  # Add more languages if needed
+        # The EasyOCR models load in the background once the window is up;
+        # with DLS_OCR_DEFER=1 they load on the first OCR call instead
+        self.reader = OCRReader(
+            log_message=lambda *args: self.root.after(0, self.log_message, *args),
+            defer=os.environ.get("DLS_OCR_DEFER") == "1",
+        )
+        # Screen capture backend; DLS_FRAME_SOURCE may name a backend
+        # ("pyautogui", "raw") or point at a directory/video of recorded frames
+        self.frame_source = create_frame_source(os.environ.get("DLS_FRAME_SOURCE"))
+        # DLS_DETECT_WORKERS sets the detection thread count (default: cores)
         self.macro_system = ImageMacroSystem(
-            self.templates, self.log_message, self.reader
+            self.templates,
+            self.log_message,
+            self.reader,
+            self.frame_source,
+            detect_workers=int(os.environ.get("DLS_DETECT_WORKERS") or 0) or None,
+            tesseract_cmd=self.get_tesseract_cmd,
         )
 
         # Add ROI-related attributes
@@ -140,8 +486,12 @@ class AutoBotApp:
         self.selected_roi = None  # Stores the final ROI coordinates
 
         setup_ui(self)
+        self.tesseract_entry.insert(0, TESSERACT_CMD)
         self.load_config()
         self.update_window_list()
+        self.first_mapped = False
+        self.root.bind("<Map>", self.on_first_map, add="+")
+        self.root.bind("<Configure>", self.on_root_configure, add="+")
         self.resource_rois = {
             "food": None,  # Example: ROI for food tracking
             "wood": None,  # Example: ROI for wood tracking
@@ -150,8 +500,69 @@ class AutoBotApp:
             "food": None,
             "wood": None,
         }
+        # Reads every resource ROI from one frame in one OCR batch
+        self.resource_tracker = ResourceTracker(
+            lambda: self.resource_regions(self.game_window),
+            lambda regions: self.macro_system.crop_regions(self.game_window, regions),
+            self.macro_system.ocr,
+            lambda values: self.root.after(0, self.update_tracked_values, values),
+            log_message=self.log_message,
+        )
+        # Conditions of macro events, evaluated against the game window
+        self.conditions = ConditionEngine(
+            self.macro_system,
+            lambda: self.game_window,
+            lambda: self.resource_regions(self.game_window),
+            log_message=self.log_message,
+        )
+        # Macro and auto-farm sessions on other windows, run side by side
+        self.sessions = SessionManager(
+            self.macro_system,
+            self.input,
+            self.resource_regions,
+            log_message=self.log_message,
+        )
+        self.load_glyphs()
         # self.root.after(1000, self.check_game_status)
 
+    def get_tesseract_cmd(self):
+        """
+        Tesseract executable from the OCR settings, or the default path.
+        """
+        entry = getattr(self, "tesseract_entry", None)
+        cmd = entry.get().strip() if entry is not None else ""
+        return cmd or TESSERACT_CMD
+
+    def on_root_configure(self, event):
+        """
+        Keep the recorder's copy of the app window rect current, so clicks
+        on the app are skipped without enumerating windows in the hook.
+        """
+        if event.widget is not self.root:
+            return
+        root = self.root
+        self.recorder.ignore_rect = (
+            root.winfo_x(),
+            root.winfo_y(),  # Outer frame, including the title bar
+            root.winfo_rootx() + root.winfo_width(),
+            root.winfo_rooty() + root.winfo_height(),
+        )
+
+    def on_first_map(self, event):
+        """
+        Log the time to the first window, then start loading OCR.
+        """
+        if event.widget is not self.root or self.first_mapped:
+            return
+        self.first_mapped = True  # Playback iconifies the window, mapping it again
+        self.log_message(
+            f"Window ready after {time.perf_counter() - self.started_at:.2f}s."
+        )
+        if self.reader.defer:
+            self.log_message("OCR will load on first use.")
+        else:
+            self.reader.start()
+
     def show_splash_screen(self, macro_name):
         """
         Show the splash screen as a popup window with the same geometry as the main window.
@@ -277,6 +688,7 @@ class AutoBotApp:
         self.game_window = self.get_selected_window()
         if self.game_window:
             self.log_message(f"Selected window: {self.game_window.title}")
+            self.register_resource_rois()
 
     def toggle_preview(self):
         window = self.get_selected_window()
@@ -287,13 +699,33 @@ class AutoBotApp:
         self.preview_btn.config(
             text="Stop Preview" if self.preview_running else "Start Preview"
         )
+        # The preview needs the whole client area captured every tick
+        preview_region = self.get_client_rect(window) if self.preview_running else None
+        self.macro_system.set_capture_region(window, "preview", preview_region)
         if self.preview_running:
-            threading.Thread(target=self.update_preview, daemon=True).start()
+            self.preview_window = window
+            self.preview_ocr_results = []
+            self.preview_ocr_dropped = 0
+            self.root.after(0, self.update_preview)
+        else:
+            self.log_message(
+                f"Preview OCR skipped {self.preview_ocr_dropped} updates "
+                "while still busy."
+            )
+            self.macro_system.log_ocr_stats()
 
     def update_preview(self):
-        while self.preview_running:
-            self.capture_preview()
-            time.sleep(0.2)
+        """
+        Display stage, on the Tk main loop: show the freshest frame with the
+        latest OCR boxes, then schedule the next tick at the preview fps.
+        """
+        if not self.preview_running:
+            return
+        start = time.perf_counter()
+        self.capture_preview()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        delay = max(1, int(1000 / self.preview_fps - elapsed_ms))
+        self.root.after(delay, self.update_preview)
 
     def get_client_area(self, window):
         """
@@ -326,57 +758,196 @@ class AutoBotApp:
             self.log_message(f"Error calculating client area: {str(e)}", "ERROR")
             return left, top, width, height
 
-    def capture_preview(self):
+    def get_client_rect(self, window):
         """
-        Captures the game window screenshot, performs OCR using EasyOCR,
-        and displays the image with bounding boxes on the Canvas.
+        Client area as (x, y, width, height) relative to the window.
         """
-        window = self.get_selected_window()
-        if window:
-            try:
-                # Get the client area dimensions (excluding title bar and borders)
-                client_left, client_top, client_width, client_height = (
-                    self.get_client_area(window)
-                )
-                # Capture the full game window screenshot
-                img = pyautogui.screenshot(
-                    region=(client_left, client_top, client_width, client_height)
-                )
+        client_left, client_top, client_width, client_height = self.get_client_area(
+            window
+        )
+        return (
+            client_left - window.left,
+            client_top - window.top,
+            client_width,
+            client_height,
+        )
 
-                # Convert the image to OpenCV format for OCR processing
-                img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    def get_client_frame(self, window, frame=None):
+        """
+        Return the window's latest frame-bus frame (or the given one) cropped
+        to the client area. The crop is a read-only view, copy before drawing.
+        """
+        client_rect = self.get_client_rect(window)
+        if frame is not None:
+            client_frame = crop_frame(frame, client_rect)
+            if client_frame is not None:
+                return client_frame
+        return self.macro_system.region_frame(window, client_rect)
+
+    def resource_regions(self, window):
+        """
+        Resource ROIs (client coordinates x1, y1, x2, y2) as window-relative
+        (x, y, width, height) regions, None for unset ones.
+        """
+        if not window:
+            return {}
+        offset_x, offset_y = self.get_client_rect(window)[:2]
+        regions = {}
+        for name, roi in self.resource_rois.items():
+            region = None
+            if roi:
+                x1, y1, x2, y2 = roi
+                region = (offset_x + x1, offset_y + y1, x2 - x1, y2 - y1)
+            regions[name] = region
+        return regions
+
+    def register_resource_rois(self, window=None):
+        """
+        Register every resource ROI as a capture region on the window's
+        frame bus, and track their values while any is set.
+        """
+        window = window or self.game_window
+        if not window:
+            return
+        regions = self.resource_regions(window)
+        for name, region in regions.items():
+            self.macro_system.set_capture_region(window, f"roi:{name}", region)
+        if any(regions.values()):
+            self.resource_tracker.start()
+        else:
+            self.resource_tracker.stop()
 
-                # Perform OCR using EasyOCR
-                results = self.reader.readtext(img_cv)
+    def update_tracked_values(self, values):
+        """
+        Store values read by the resource tracker, logging the changes.
+        """
+        for name, value in values.items():
+            if self.tracked_values.get(name) != value:
+                self.tracked_values[name] = value
+                self.log_message(f"{name.capitalize()}: {value}")
+
+    def toggle_roi_capture(self):
+        enabled = self.roi_capture_var.get()
+        self.macro_system.set_roi_only(enabled)
+        self.log_message(
+            "ROI-only capture enabled." if enabled else "ROI-only capture disabled."
+        )
 
-                # Draw bounding boxes around detected text
+    def capture_preview(self):
+        """
+        Displays the freshest frame of the game window with the bounding
+        boxes of the last OCR pass on the Canvas, and requests a new OCR
+        pass when one is due. Runs on the Tk main loop and never waits for
+        capture or OCR.
+        """
+        window = self.preview_window
+        if window:
+            try:
+                bus = self.macro_system.get_frame_bus(window)
+                frame = bus.latest(timeout=0)
+                results = self.preview_ocr_results
+                if frame is None or (
+                    frame.frame_id == self.preview_frame_id
+                    and results is self.preview_shown_results
+                ):
+                    return  # Nothing new to show
+                self.preview_frame_id = frame.frame_id
+                self.preview_shown_results = results
+
+                # Crop to the client area (excluding title bar and borders)
+                client_frame = self.get_client_frame(window, frame)
+                if client_frame is None:
+                    return
+                self.request_preview_ocr(bus, window, client_frame)
+
+                # Downscale and convert into the bus' preallocated buffers;
+                # boxes are drawn on the thumbnail, not a full-size copy
+                thumb = bus.converter.thumbnail(client_frame.image, (460, 320))
+                scale = thumb.shape[1] / client_frame.image.shape[1]
                 for result in results:
                     bbox, text, confidence = result
-                    top_left = tuple(map(int, bbox[0]))
-                    bottom_right = tuple(map(int, bbox[2]))
-                    cv2.rectangle(img_cv, top_left, bottom_right, (0, 255, 0), 2)
-
-                # Convert the annotated image back to PIL format
-                img_annotated = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-
-                # Scale down the image for preview
-                img_annotated.thumbnail((460, 320))
-
-                # Update the preview canvas with the annotated image
-                self.preview_image = ImageTk.PhotoImage(img_annotated)
-                self.preview_canvas.delete("all")  # Clear previous content
-                self.preview_canvas.config(
-                    width=img_annotated.width, height=img_annotated.height
-                )  # Adjust Canvas size
-                self.preview_canvas.create_image(
-                    0, 0, anchor=tk.NW, image=self.preview_image
-                )  # Display image
+                    top_left = tuple(int(v * scale) for v in bbox[0])
+                    bottom_right = tuple(int(v * scale) for v in bbox[2])
+                    cv2.rectangle(thumb, top_left, bottom_right, (0, 255, 0), 2)
+                img_annotated = Image.fromarray(bus.converter.rgb(thumb))
+
+                # Reuse the Tk photo while the preview size stays the same
+                if (
+                    self.preview_image is not None
+                    and (
+                        self.preview_image.width(),
+                        self.preview_image.height(),
+                    )
+                    == img_annotated.size
+                ):
+                    self.preview_image.paste(img_annotated)
+                else:
+                    self.preview_image = ImageTk.PhotoImage(img_annotated)
+                    self.preview_canvas.delete("all")  # Clear previous content
+                    self.preview_canvas.config(
+                        width=img_annotated.width, height=img_annotated.height
+                    )  # Adjust Canvas size
+                    self.preview_canvas.create_image(
+                        0, 0, anchor=tk.NW, image=self.preview_image
+                    )  # Display image
 
             except Exception as e:
                 self.log_message(f"Preview error: {str(e)}", "ERROR")
         else:
             self.log_message("No game window selected for preview", "ERROR")
 
+    def request_preview_ocr(self, bus, window, client_frame):
+        """
+        Start an OCR pass of the client frame on the preview OCR thread if
+        one is due. While the previous pass is still running the request
+        is dropped rather than queued.
+        """
+        now = time.perf_counter()
+        if now - self.preview_ocr_at < self.preview_ocr_interval:
+            return
+        if self.preview_ocr_future is not None and not self.preview_ocr_future.done():
+            self.preview_ocr_dropped += 1
+            return
+        if not self.reader.ready():
+            # Show frames while the OCR models are still loading
+            self.reader.start()
+            return
+        self.preview_ocr_at = now
+        if self.preview_executor is None:
+            self.preview_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="preview-ocr"
+            )
+        client_rect = self.get_client_rect(window)
+        self.preview_ocr_future = self.preview_executor.submit(
+            self.preview_ocr, bus, client_rect, client_frame
+        )
+
+    def preview_ocr(self, bus, client_rect, client_frame):
+        """
+        OCR stage, on its own thread: read the client frame with EasyOCR
+        (queued to the shared OCR worker), unless the client area is unchanged, and publish the results for
+        the display stage.
+        """
+        try:
+            results = bus.results.get("preview_ocr", client_rect)
+            if results is None:
+                image = client_frame.image
+                # Detection with boxes, on the shared OCR worker; cached
+                # apart from the router's plain-text "easyocr" results
+                results = self.macro_system.ocr_cache.lookup(
+                    "easyocr-detail",
+                    image,
+                    lambda: self.macro_system.ocr.call(self.reader.readtext, image),
+                )
+                bus.results.put(
+                    "preview_ocr", client_rect, client_frame.frame_id, results
+                )
+            self.preview_ocr_results = results
+        except Exception as e:
+            self.root.after(
+                0, self.log_message, f"Preview OCR error: {str(e)}", "ERROR"
+            )
+
     # --- Macro Recording & Playback Functions ---
     def load_templates(self):
         """
@@ -393,120 +964,110 @@ class AutoBotApp:
             )
             return
 
-        # Get all supported image files in the folder
-        supported_extensions = [".png", ".jpg", ".jpeg"]
-        template_files = [
-            f
-            for f in os.listdir(templates_folder)
-            if os.path.isfile(os.path.join(templates_folder, f))
-            and os.path.splitext(f)[1].lower() in supported_extensions
-        ]
+        # Compiled templates come from the memory-mapped cache; only new or
+        # changed image files are decoded and compiled again
+        store = self.template_store
+        if store is None or store.folder != templates_folder:
+            if store is not None:
+                self.template_store.stop()
+            # The store's watcher thread logs too, so go through the Tk loop
+            self.template_store = TemplateStore(
+                templates_folder,
+                lambda *args: self.root.after(0, self.log_message, *args),
+            )
+        try:
+            changed, removed = self.template_store.load()
+        except Exception as e:
+            self.log_message(f"Error loading templates: {str(e)}", "ERROR")
+            return
+
+        # Drop templates deleted from disk (or left from another folder)
+        stale = set(self.templates) - set(self.template_store.templates)
+        self.apply_templates([], sorted(stale | set(removed)))
 
-        if not template_files:
+        if not self.template_store.templates:
             self.log_message(
                 "No template images found in the 'templates/' folder.", "ERROR"
             )
             return
 
-        # Load each template image
-        for file in template_files:
-            # Normalize the file name to lowercase
-            name = os.path.splitext(file)[0].lower()
-            file_path = os.path.join(templates_folder, file)
-            try:
-                # Attempt to load the image using OpenCV
-                template = cv2.imread(file_path)
-                if template is None:
-                    self.log_message(
-                        f"Failed to load template: {file} (invalid file or format)",
-                        "ERROR",
-                    )
-                    continue
-                # Store the template in the dictionary with its normalized name
-                self.templates[name] = template
+        self.apply_templates(list(self.template_store.templates), [])
+        self.log_message(
+            f"Loaded {len(self.template_store.templates)} templates "
+            f"({len(changed)} compiled, the rest from cache)."
+        )
+        # Keep picking up template edits while the app runs
+        self.template_store.watch(
+            lambda changed, removed: self.root.after(
+                0, self.apply_templates, changed, removed, True
+            )
+        )
+
+    def apply_templates(self, names, removed, log_each=False):
+        """
+        Publish compiled templates from the template store to the macro
+        system and the template list, without listing a name twice.
+        """
+        listed = list(self.template_list.get(0, tk.END))
+        for name in names:
+            template = self.template_store.templates.get(name)
+            if template is None:
+                continue
+            # Store the template in the dictionary with its normalized name
+            self.templates[name] = template.image
+            self.macro_system.set_compiled_template(name, template)
+            if name not in listed:
                 self.template_list.insert(tk.END, name)
+                listed.append(name)
+            if log_each:
                 self.log_message(f"Successfully loaded template: {name}")
-            except Exception as e:
-                self.log_message(f"Error loading template: {file} ({str(e)})", "ERROR")
+        for name in removed:
+            self.templates.pop(name, None)
+            self.macro_system.invalidate_template(name)
+            if name in listed:
+                self.template_list.delete(listed.index(name))
+                listed.remove(name)
+            self.log_message(f"Template file removed: {name}")
+
+    def load_glyphs(self):
+        """
+        Train the digit recognizer on the sample crops in 'glyphs/', if any.
+        """
+        glyphs_folder = "glyphs"
+        if not os.path.isfile(os.path.join(glyphs_folder, "samples.json")):
+            return
+        try:
+            engine = GlyphEngine.from_folder(glyphs_folder)
+        except Exception as e:
+            self.log_message(f"Error loading glyph samples: {str(e)}", "ERROR")
+            return
+        self.macro_system.ocr.add(engine)
+        self.log_message(
+            f"Digit recognizer trained on {engine.samples} samples "
+            f"({''.join(sorted(engine.charset))})."
+        )
 
     def remove_template(self):
         selection = self.template_list.curselection()
         if selection:
             name = self.template_list.get(selection[0])
             del self.templates[name]
+            self.macro_system.invalidate_template(name)
             self.template_list.delete(selection[0])
             self.log_message(f"Removed template: {name}")
 
     def start_recording_macro(self):
-        self.recorded_macro = []
-        self.record_start_time = time.time()
-
-        def on_press(key):
-            event = {
-                "type": "key_press",
-                "key": str(key),
-                "time": time.time() - self.record_start_time,
-            }
-            self.recorded_macro.append(event)
-
-        def on_release(key):
-            event = {
-                "type": "key_release",
-                "key": str(key),
-                "time": time.time() - self.record_start_time,
-            }
-            self.recorded_macro.append(event)
-
-        def on_click(x, y, button, pressed):
-            # Ignore clicks within the application window
-            app_window = gw.getWindowsWithTitle(self.root.title())
-            if app_window:
-                app_window = app_window[0]
-                if (
-                    app_window.left <= x <= app_window.left + app_window.width
-                    and app_window.top <= y <= app_window.top + app_window.height
-                ):
-                    return  # Ignore clicks within the app window
-
-            # Record valid clicks
-            event = {
-                "type": "mouse_click",
-                "x": x,
-                "y": y,
-                "button": str(button),
-                "pressed": pressed,
-                "time": time.time() - self.record_start_time,
-            }
-            self.recorded_macro.append(event)
-
-        def on_scroll(x, y, dx, dy):
-            event = {
-                "type": "mouse_scroll",
-                "x": x,
-                "y": y,
-                "dx": dx,
-                "dy": dy,
-                "time": time.time() - self.record_start_time,
-            }
-            self.recorded_macro.append(event)
-
-        self.k_listener = pynput_keyboard.Listener(
-            on_press=on_press, on_release=on_release
-        )
-        self.m_listener = mouse.Listener(on_click=on_click, on_scroll=on_scroll)
-        self.k_listener.start()
-        self.m_listener.start()
+        self.recorder.start()
         self.log_message("Macro recording started.")
 
     def stop_recording_macro(self):
-        if self.k_listener:
-            self.k_listener.stop()
-            self.k_listener = None
-        if self.m_listener:
-            self.m_listener.stop()
-            self.m_listener = None
+        if not self.recorder.recording():
+            return
+        self.recorded_macro = self.recorder.stop()
+        simplifier = self.recorder.simplifier
         self.log_message(
-            f"Macro recording stopped. {len(self.recorded_macro)} events recorded."
+            f"Macro recording stopped. {len(self.recorded_macro)} events recorded "
+            f"({simplifier.raw} mouse positions stored as {simplifier.kept})."
         )
 
     def toggle_recording(self):
@@ -518,29 +1079,39 @@ class AutoBotApp:
             self.record_btn.config(text="Record Macro")
             self.stop_recording_macro()
 
-    def play_macro(self):
+    def get_selected_macro(self):
+        """
+        (name, CompiledMacro) of the macro selected in the library, else of
+        the last recording, or None (logged) when there is none.
+        """
         sel = self.macro_listbox.curselection()
         if sel:
             macro_name = self.macro_listbox.get(sel[0])
-            events = self.loaded_macros.get(macro_name, [])
-            if not events:
+            compiled = self.compiled_macros.get(macro_name)
+            if compiled is None:
+                compiled = CompiledMacro.compile(self.loaded_macros.get(macro_name, []))
+                self.compiled_macros[macro_name] = compiled
+            if not len(compiled):
                 self.log_message("Selected macro is empty.", "ERROR")
-                return
-        elif self.recorded_macro:
-            events = self.recorded_macro
-            macro_name = "Current Recorded Macro"
-        else:
-            self.log_message(
-                "No macro available. Please record or load a macro.", "ERROR"
-            )
+                return None
+            return macro_name, compiled
+        if self.recorded_macro:
+            return "Current Recorded Macro", self.recorded_macro
+        self.log_message("No macro available. Please record or load a macro.", "ERROR")
+        return None
+
+    def play_macro(self):
+        selected = self.get_selected_macro()
+        if selected is None:
             return
+        macro_name, compiled = selected
 
         # Show splash screen
         self.show_splash_screen(macro_name)
         self.running.set()  # Set the running flag to True
         # Start macro playback in a thread
         threading.Thread(
-            target=self._play_macro_with_repeat, args=(events,), daemon=True
+            target=self._play_macro_with_repeat, args=(compiled,), daemon=True
         ).start()
 
     def stop_macro_playback(self):
@@ -548,82 +1119,165 @@ class AutoBotApp:
         Stop macro playback safely.
         """
         self.running.clear()  # Stop any running threads
+        self.sessions.stop_all(wait=False)
         self.preview_running = False
         self.recording = False
-        if self.k_listener:
-            self.k_listener.stop()
-        if self.m_listener:
-            self.m_listener.stop()
+        if self.recorder.recording():
+            self.root.after(0, self.stop_recording_macro)
         self.restore_main_frame()  # Restore the main application frame
 
-    def _play_macro_with_repeat(self, events):
+    def start_macro_session(self):
+        """
+        Play the selected macro on the selected window in a session of its
+        own, next to whatever runs on other windows. The app stays usable.
+        """
+        window = self.get_selected_window()
+        if not window:
+            self.log_message("No game window selected.", "ERROR")
+            return
+        selected = self.get_selected_macro()
+        if selected is None:
+            return
+        macro_name, compiled = selected
+        repeat = None if self.repeat_infinite_var.get() else self.repeat_count_var.get()
+        try:
+            self.sessions.start_macro(window, compiled, repeat, self.playback_speed)
+        except RuntimeError as e:
+            self.log_message(str(e), "ERROR")
+            return
+        self.log_message(f"Session on '{window.title}' playing {macro_name}.")
+
+    def start_farm_session(self):
+        """
+        Run the auto-farm preset on the selected window in a session of
+        its own, one pass every few seconds until stopped.
+        """
+        window = self.get_selected_window()
+        if not window:
+            self.log_message("No game window selected.", "ERROR")
+            return
+        try:
+            self.sessions.start_farm(
+                window,
+                lambda session: self.auto_farm_macro(
+                    session.window, session.input, session.log_message
+                ),
+            )
+        except RuntimeError as e:
+            self.log_message(str(e), "ERROR")
+            return
+        self.log_message(f"Auto-farm session started on '{window.title}'.")
+
+    def stop_sessions(self):
+        self.sessions.stop_all(wait=False)
+        status = self.sessions.status()
+        self.log_message("All sessions stopped." + (f"\n{status}" if status else ""))
+
+    def _play_macro_with_repeat(self, macro):
         """
-        Play back a macro with optional repetitions.
+        Play back a compiled macro with optional repetitions.
         Handles both finite and infinite repeats.
         """
         repeat_count = self.repeat_count_var.get()
-        for _ in range(repeat_count):
-            if not self.running.is_set():  # Check if playback should stop
-                break
-            self._play_macro_thread(events)
-        if self.repeat_infinite_var.get():
-            while self.running.is_set():
-                self._play_macro_thread(events)
+        try:
+            for _ in range(repeat_count):
+                if not self.running.is_set():  # Check if playback should stop
+                    break
+                self._play_macro_thread(macro)
+            if self.repeat_infinite_var.get():
+                while self.running.is_set():
+                    self._play_macro_thread(macro)
+        except ABORT_EXCEPTIONS as e:
+            # Cursor moved to a screen corner: stop every repetition
+            self.running.clear()
+            self.log_message(f"Macro playback aborted by fail-safe: {e}", "ERROR")
 
         # Restore the main frame after playback ends (TODO: test this)
         self.restore_main_frame()
 
-    def _play_macro_thread(self, events):
+    def _play_macro_thread(self, macro):
         """
-        Play back a macro with delays between actions.
-        Checks for the kill switch during playback.
+        Play back a compiled macro, each event at its recorded offset from
+        the start (scaled by the playback speed), then log how late the
+        events were. Checks for the kill switch during playback.
         """
-        kb = KeyboardController()
-        last_time = 0
-        for event in events:
-            if not self.running.is_set():  # Check if the kill switch was activated
-                self.log_message("Macro playback stopped by user.")
-                return
+        clock = PlaybackClock(self.playback_speed)
+        self.conditions.reset_stats()
+        clock.start()
+        result = run_macro(
+            macro,
+            self.input,
+            clock,
+            running=self.running.is_set,
+            speed=lambda: self.playback_speed,
+            wait=self.wait_for_screen,
+            condition=lambda spec: self.conditions.run(spec, self.running.is_set),
+            log_message=self.log_message,
+        )
+        if not result["completed"]:
+            self.log_message("Macro playback stopped by user.")
+            return
 
-            delay = event["time"] - last_time
-            if delay > 0:
-                time.sleep(delay / self.playback_speed)
-            last_time = event["time"]
+        self.log_message(
+            f"Macro playback finished. {len(macro)} stored events "
+            f"({macro.count(MOVE)} moves, {result['interpolated']} interpolated) "
+            f"in {result['batches']} input batches, "
+            f"CPU {1000 * result['cpu']:.1f} ms."
+        )
+        self.log_message(f"Timing: {clock.stats.format()}")
+        if macro.conditions:
+            stats = self.conditions.stats()
+            self.log_message(
+                f"Conditions: {stats['evaluations']} evaluations, "
+                f"{stats['memo_hits']} shared with an earlier check on the "
+                f"same frame, {stats['frames_waited']} frames waited on."
+            )
 
-            etype = event["type"]
-            if etype == "key_press":
-                key_val = convert_key_str(event["key"])
-                try:
-                    kb.press(key_val)
-                except Exception as e:
-                    self.log_message(
-                        f"Error playing key press {event['key']}: {e}", "ERROR"
-                    )
-            elif etype == "key_release":
-                key_val = convert_key_str(event["key"])
-                try:
-                    kb.release(key_val)
-                except Exception as e:
-                    self.log_message(
-                        f"Error playing key release {event['key']}: {e}", "ERROR"
-                    )
-            elif etype == "mouse_click":
-                x, y = event["x"], event["y"]
-                button_str = event["button"]
-                button = (
-                    "left"
-                    if "left" in button_str
-                    else "right" if "right" in button_str else "middle"
-                )
-                if event["pressed"]:
-                    pyautogui.mouseDown(x=x, y=y, button=button)
-                else:
-                    pyautogui.mouseUp(x=x, y=y, button=button)
-            elif etype == "mouse_scroll":
-                dy = event["dy"]
-                pyautogui.scroll(dy)
+    def wait_for_screen(self, x, y, timeout_ms, settle_ms):
+        """
+        Optimized macros wait for the game window around a click to settle
+        instead of replaying the recorded pause. Returns False without a
+        game window, keeping the recorded pause.
+        """
+        window = self.game_window
+        if window is None:
+            return False
+        size = 128
+        region = (x - window.left - size // 2, y - window.top - size // 2, size, size)
+        self.macro_system.wait_for_settle(
+            window,
+            region,
+            settle_ms / 1000 / self.playback_speed,
+            timeout_ms / 1000 / self.playback_speed,
+            self.running.is_set,
+        )
+        return True
 
-        self.log_message("Macro playback finished.")
+    def optimize_selected_macro(self):
+        """
+        Add an optimized copy of the selected (or last recorded) macro to
+        the library and log how much time it saves.
+        """
+        sel = self.macro_listbox.curselection()
+        if sel:
+            macro_name = self.macro_listbox.get(sel[0])
+            compiled = self.compiled_macros.get(macro_name)
+            if compiled is None:
+                compiled = CompiledMacro.compile(self.loaded_macros.get(macro_name, []))
+        elif self.recorded_macro:
+            compiled = self.recorded_macro
+            macro_name = "Recorded Macro"
+        else:
+            self.log_message("No macro to optimize.", "ERROR")
+            return
+        optimized, report = optimize_macro(compiled)
+        name = f"{os.path.splitext(macro_name)[0]} (optimized)"
+        self.loaded_macros[name] = optimized.to_events()
+        self.compiled_macros[name] = optimized
+        if name not in self.macro_listbox.get(0, tk.END):
+            self.macro_listbox.insert(tk.END, name)
+        for line in format_report(report).splitlines():
+            self.log_message(f"Optimizer: {line}")
 
     def setup_kill_switch(self):
         """
@@ -650,25 +1304,31 @@ class AutoBotApp:
         )
         if filename:
             try:
-                with open(filename, "w") as f:
-                    json.dump(self.recorded_macro, f, indent=2)
+                compiled = save_macro(filename, self.recorded_macro)
                 self.log_message(f"Macro saved to {filename}")
                 macro_name = os.path.basename(filename)
-                self.loaded_macros[macro_name] = self.recorded_macro.copy()
+                self.loaded_macros[macro_name] = compiled.to_events()
+                self.compiled_macros[macro_name] = compiled
                 self.macro_listbox.insert(tk.END, macro_name)
             except Exception as e:
                 self.log_message(f"Error saving macro: {e}", "ERROR")
 
     def load_macro_from_file(self):
         filename = filedialog.askopenfilename(
-            title="Select Macro File", filetypes=[("JSON Files", "*.json")]
+            title="Select Macro File",
+            filetypes=[
+                ("Macro Files", "*.json *.dlsm"),
+                ("JSON Files", "*.json"),
+                ("Compiled Macros", "*.dlsm"),
+            ],
         )
         if filename:
             try:
-                with open(filename, "r") as f:
-                    macro = json.load(f)
+                # The compiled .dlsm next to a JSON file is reused if current
+                macro, compiled = load_macro(filename)
                 macro_name = os.path.basename(filename)
                 self.loaded_macros[macro_name] = macro
+                self.compiled_macros[macro_name] = compiled
                 self.macro_listbox.insert(tk.END, macro_name)
                 self.log_message(f"Macro {macro_name} loaded.")
             except Exception as e:
@@ -676,61 +1336,70 @@ class AutoBotApp:
 
     def conditional_play_macro(self, events):
         """
-        Play a macro with conditional execution based on screen content.
+        Play a macro whose events may carry "condition" and "wait_until"
+        specs (see ConditionEngine), on the selected game window.
         """
-        for event in events:
-            if event.get("condition"):
-                template_name = event["condition"].get("template")
-                text_pattern = event["condition"].get("text")
-
-                screenshot = self.macro_system.get_screenshot(self.game_window)
-                if template_name and not self.macro_system.detect_template(
-                    screenshot, template_name
-                ):
-                    continue  # Skip this action if the template is not found
-                if text_pattern and not self.macro_system.detect_text(
-                    screenshot, text_pattern
-                ):
-                    continue  # Skip this action if the text pattern is not found
-
-            # Execute the action
-            self._execute_macro_event(event)
+        self.game_window = self.get_selected_window() or self.game_window
+        self.running.set()
+        threading.Thread(
+            target=self._play_macro_thread,
+            args=(CompiledMacro.compile(events),),
+            daemon=True,
+        ).start()
 
     def click_template(self, game_window, template_name):
         """
         Click on a detected template image.
         """
-        template = self.templates.get(template_name)
-        if not template:
-            self.log_message(f"Template '{template_name}' not found.", "ERROR")
+        match = self.macro_system.match_template(game_window, template_name)
+        if match is None:
             return False
 
-        screenshot = self.macro_system.get_screenshot(game_window)
-        result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
-
-        if max_val > 0.8:  # Confidence threshold
-            x = game_window.left + max_loc[0] + template.shape[1] // 2
-            y = game_window.top + max_loc[1] + template.shape[0] // 2
-            pyautogui.click(x, y)
+        max_val, max_loc = match
+        template = self.templates[template_name]
+        size = (template.shape[1], template.shape[0])
+        if self.click_match(game_window, Match(max_val, max_loc, size)):
             return True
 
         self.log_message(f"Failed to click template '{template_name}'.")
         return False
 
+    def click_all_templates(self, game_window, template_name, limit=None):
+        """
+        Click every visible instance of a template, best match first, all
+        found in a single frame. Returns the number of clicks.
+        """
+        matches = self.macro_system.find_all(game_window, template_name)
+        clicks = 0
+        for match in matches[:limit]:
+            if self.click_match(game_window, match):
+                clicks += 1
+        return clicks
+
+    def click_match(self, game_window, match, backend=None):
+        """
+        Click the center of a match found by detect_many, without matching
+        again, through the given input backend or the app's.
+        """
+        if match is None or match.score <= 0.8:  # Confidence threshold
+            return False
+        x, y = match.center
+        (backend or self.input).click(game_window.left + x, game_window.top + y)
+        return True
+
     def get_arrow_region(self, game_window):
         """
         Calculate the region near the arrow image for OCR.
         """
         arrow_template = "arrow"
-        screenshot = self.macro_system.get_screenshot(game_window)
-        template = self.templates.get(arrow_template)
-        if template is None:
+        if self.templates.get(arrow_template) is None:
             self.log_message("Arrow template not loaded.", "ERROR")
             return None
 
-        result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-        _, _, _, max_loc = cv2.minMaxLoc(result)
+        match = self.macro_system.match_template(game_window, arrow_template)
+        if match is None:
+            return None
+        _, max_loc = match
 
         # Define a region around the arrow (adjust offsets as needed)
         arrow_x, arrow_y = max_loc
@@ -744,92 +1413,128 @@ class AutoBotApp:
             region_height,
         )
 
-    def auto_farm_macro(self):
+    def auto_farm_macro(self, game_window=None, backend=None, log_message=None):
         """
-        Auto-farm macro preset using OCR and image recognition.
+        Auto-farm macro preset using OCR and image recognition. Runs on the
+        selected window unless a session passes its own window, input
+        queue and log.
         """
-        self.log_message("Starting auto-farm macro...")
-        game_window = self.get_selected_window()
+        log = log_message or self.log_message
+        log("Starting auto-farm macro...")
+        game_window = game_window or self.get_selected_window()
         if not game_window:
-            self.log_message("No game window selected.", "ERROR")
+            log("No game window selected.", "ERROR")
             return
 
-        # Step 1: Check for the arrow image
+        # Match every template this pass needs against one frame
         arrow_template = "arrow"  # Template name for the arrow image
-        if not self.macro_system.detect_template(game_window, arrow_template):
-            self.log_message("Arrow image not found. Stopping macro.")
+        region_image_template = "region_image"  # Template name for the region image
+        frame = self.macro_system.latest_frame(game_window)
+        if frame is None:
             return
-        self.log_message(
-            "Arrow image detected. Capturing game window for text extraction..."
+        detections = self.macro_system.detect_many(
+            frame, [arrow_template, region_image_template], game_window
         )
 
-        # Step 2: Capture the entire game window (excluding title bar and borders)
-        try:
-            # Get the client area dimensions (excluding title bar and borders)
-            client_left, client_top, client_width, client_height = self.get_client_area(
-                game_window
-            )
+        # Step 1: Check for the arrow image
+        arrow = detections.get(arrow_template)
+        if arrow is None or arrow.score <= 0.8:
+            log("Arrow image not found. Stopping macro.")
+            return
+        log("Arrow image detected. Capturing game window for text extraction...")
 
-            # Capture the screenshot of the client area
-            screenshot = pyautogui.screenshot(
-                region=(client_left, client_top, client_width, client_height)
-            )
-            # export screenshot for debugging
-            gray = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2GRAY)
-
-            # Save the screenshot for debugging with the bounding box on text region
-            cv2.imwrite("screenshot.png", gray)
-            cv2.rectangle(
-                gray,
-                (client_left, client_top),
-                (client_left + client_width, client_top + client_height),
-                (0, 255, 0),
-                2,
-            )
-            cv2.imwrite("screenshot_bbox.png", gray)
+        # Step 2: Read the squad count, from the "squads" ROI when one is set
+        # (usually by the digit glyphs), else from the whole client area
+        try:
+            text = self.read_squad_roi(game_window, frame)
+            if text is None:
+                # Get the client area dimensions (excluding title bar and borders)
+                client_left, client_top, client_width, client_height = (
+                    self.get_client_area(game_window)
+                )
 
-            # Perform OCR on the screenshot
-            pytesseract.pytesseract.tesseract_cmd = (
-                r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-            )
-            text = pytesseract.image_to_string(gray)
+                # Take the client area from the frame the templates were matched on
+                frame = self.get_client_frame(game_window, frame)
+                if frame is None:
+                    return
+                # export screenshot for debugging
+                converter = self.macro_system.get_frame_bus(game_window).converter
+                gray = converter.gray(frame.image)
+
+                # Save the screenshot for debugging with the bounding box on
+                # text region; not from sessions, which would all write the
+                # same files at once
+                if backend is None:
+                    cv2.imwrite("screenshot.png", gray)
+                    cv2.rectangle(
+                        gray,
+                        (client_left, client_top),
+                        (client_left + client_width, client_top + client_height),
+                        (0, 255, 0),
+                        2,
+                    )
+                    cv2.imwrite("screenshot_bbox.png", gray)
+
+                # Perform OCR on the screenshot with a pooled Tesseract
+                # worker, queued to the shared OCR worker
+                text = self.macro_system.ocr.call(
+                    self.macro_system.ocr_cache.lookup,
+                    "tesseract",
+                    gray,
+                    lambda: self.macro_system.tesseract.read(gray),
+                )
             match = re.search(
-                r"(\d)/5", text
+                SQUAD_PATTERN, text
             )  # Look for patterns like "1/5", "2/5", etc.
 
             if not match:
-                self.log_message("No squad count text detected in the game window.")
+                log("No squad count text detected in the game window.")
                 return
 
             current_squads, total_squads = int(match.group(1)), 5
             available_squads = total_squads - current_squads
 
             if available_squads <= 0:
-                self.log_message(
+                log(
                     f"No squads available for farming ({current_squads}/5). Stopping macro."
                 )
                 return
 
-            self.log_message(f"{available_squads} squads available for farming.")
+            log(f"{available_squads} squads available for farming.")
         except Exception as e:
-            self.log_message(f"Error during text detection: {str(e)}", "ERROR")
+            log(f"Error during text detection: {str(e)}", "ERROR")
             return
 
         # Step 3: Check for the region image and click if it exists
-        region_image_template = "region_image"  # Template name for the region image
-        if self.macro_system.detect_template(game_window, region_image_template):
-            self.log_message("Region image detected. Clicking...")
-            self.click_template(game_window, region_image_template)
+        region_image = detections.get(region_image_template)
+        if region_image is not None and region_image.score > 0.8:
+            log("Region image detected. Clicking...")
+            self.click_match(game_window, region_image, backend)
         else:
-            self.log_message("Region image not found. Skipping click.")
+            log("Region image not found. Skipping click.")
 
         # Step 4: Perform farming actions (e.g., repeat based on available squads)
         for i in range(available_squads):
-            self.log_message(f"Farming with squad {i + 1}...")
+            log(f"Farming with squad {i + 1}...")
             # Simulate farming actions here (e.g., clicks, key presses)
             time.sleep(1)  # Simulate delay between actions
 
-        self.log_message("Auto-farm macro completed.")
+        self.macro_system.log_tracking_stats()
+        self.macro_system.log_ocr_stats()
+        log("Auto-farm macro completed.")
+
+    def read_squad_roi(self, game_window, frame):
+        """
+        Text of the "squads" resource ROI in the given window frame, or
+        None when that ROI is not set or could not be read.
+        """
+        region = self.resource_regions(game_window).get("squads")
+        if not region:
+            return None
+        crop = crop_frame(frame, region)
+        if crop is None:
+            return None
+        return self.macro_system.ocr.read(crop.image, pattern=SQUAD_PATTERN)
 
     def start_roi_selection(self, event):
         """Start selecting the ROI."""
@@ -879,17 +1584,24 @@ class AutoBotApp:
             window = self.get_selected_window()
             if window:
                 try:
-                    img = pyautogui.screenshot(
-                        region=(
-                            window.left + roi_x1,
-                            window.top + roi_y1,
+                    # The ROI was drawn on the client-area image
+                    offset_x, offset_y = self.get_client_rect(window)[:2]
+                    frame = self.macro_system.region_frame(
+                        window,
+                        (
+                            offset_x + roi_x1,
+                            offset_y + roi_y1,
                             roi_x2 - roi_x1,
                             roi_y2 - roi_y1,
-                        )
+                        ),
                     )
-                    img.thumbnail((480, 480))  # Resize for display
-                    self.roi_image = ImageTk.PhotoImage(img)
-                    self.roi_display_label.config(image=self.roi_image)
+                    if frame is not None:
+                        img = Image.fromarray(
+                            cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+                        )
+                        img.thumbnail((480, 480))  # Resize for display
+                        self.roi_image = ImageTk.PhotoImage(img)
+                        self.roi_display_label.config(image=self.roi_image)
                 except Exception as e:
                     self.log_message(f"Error capturing ROI image: {str(e)}", "ERROR")
 
@@ -908,9 +1620,10 @@ class AutoBotApp:
         client_left, client_top, client_width, client_height = self.get_client_area(
             self.game_window
         )
-        img = pyautogui.screenshot(
-            region=(client_left, client_top, client_width, client_height)
-        )
+        frame = self.get_client_frame(self.game_window)
+        if frame is None:
+            return
+        img = Image.fromarray(cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB))
 
         # Create a popup window
         self.roi_popup = tk.Toplevel(self.root)
@@ -974,6 +1687,7 @@ class AutoBotApp:
             )
             if resource:
                 self.resource_rois[resource.lower()] = self.selected_roi
+                self.register_resource_rois()
                 self.log_message(f"ROI for '{resource}' set: {self.selected_roi}")
             else:
                 self.log_message("ROI selection canceled.")
@@ -985,6 +1699,14 @@ class AutoBotApp:
 
     def on_closing(self):
         # self.stop_automation()
+        self.preview_running = False
+        if self.preview_executor:
+            self.preview_executor.shutdown(wait=False)
+        if self.template_store:
+            self.template_store.stop()
+        self.resource_tracker.stop()
+        self.sessions.close()
+        self.macro_system.close()
         self.root.destroy()
 
 
@@ -0,0 +1,520 @@
+"""
+Headless benchmarks for the capture and detection pipeline.
+
+Usage:
+    python -m modules.bench --source recordings/ capture
+    python -m modules.bench --source recordings/ detect --templates templates/
+    python -m modules.bench --source synthetic alloc
+    python -m modules.bench ocr --samples glyphs/
+    python -m modules.bench macro --macro macros/farm.json
+    python -m modules.bench playback --speeds 1,3
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from modules.capture import IMAGE_EXTENSIONS, create_frame_source
+from modules.change import ChangeTracker
+from modules.convert import BufferPool, FrameConverter, fit_size
+from modules.macro import (
+    KEY_PRESS,
+    KEY_RELEASE,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    SCROLL,
+    BUTTON_NAMES,
+    CompiledMacro,
+    binary_path,
+    convert_key_str,
+    load_macro,
+    save_macro,
+)
+from modules.matching import CompiledTemplate, TemplateMatcher, TiledDetector
+from modules.ocr_engines import GlyphEngine
+from modules.dispatch import RecordingBackend
+from modules.paths import PathSimplifier
+from modules.playback import PlaybackClock, run_macro
+
+
+def load_template_dir(path):
+    """
+    Load every image in a folder as a BGR template keyed by lowercase name.
+    """
+    templates = {}
+    for file in sorted(os.listdir(path)):
+        name, ext = os.path.splitext(file)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(os.path.join(path, file))
+        if image is not None:
+            templates[name.lower()] = image
+    return templates
+
+
+def report(label, count, elapsed):
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"{label}: {count} in {elapsed:.3f}s ({rate:.1f}/s, {1000 / rate:.3f} ms each)"
+    )
+
+
+def bench_capture(args):
+    source = create_frame_source(args.source)
+    try:
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            source.grab(args.region)
+        report(f"capture [{source.name}]", args.frames, time.perf_counter() - start)
+    finally:
+        source.close()
+
+
+def bench_detect(args):
+    source = create_frame_source(args.source)
+    templates = load_template_dir(args.templates)
+    if not templates:
+        raise SystemExit(f"No templates found in '{args.templates}'.")
+    compiled = [CompiledTemplate(name, image) for name, image in templates.items()]
+    matcher = TemplateMatcher(threshold=args.threshold)
+    try:
+        frames = [source.grab(args.region) for _ in range(args.frames)]
+        frames = [f for f in frames if f is not None]
+        hits = {}
+        for label, match in (
+            ("full search", lambda f, t: matcher.match_full(f.image, t)),
+            ("pyramid", lambda f, t: matcher.match(f.image, t, f.frame_id)),
+        ):
+            hits[label] = []
+            start = time.perf_counter()
+            for frame in frames:
+                for template in compiled:
+                    result = match(frame, template)
+                    hit = result is not None and result[0] > args.threshold
+                    hits[label].append(hit)
+            report(label, len(frames) * len(compiled), time.perf_counter() - start)
+            print(f"  hits above {args.threshold}: {sum(hits[label])}")
+        agree = sum(a == b for a, b in zip(hits["full search"], hits["pyramid"]))
+        print(f"pyramid agrees with full search on {agree}/{len(hits['pyramid'])}")
+
+        found = 0
+        start = time.perf_counter()
+        for frame in frames:
+            for template in compiled:
+                found += len(matcher.find_all(frame.image, template, args.threshold))
+        report("find all", len(frames) * len(compiled), time.perf_counter() - start)
+        print(f"  instances above {args.threshold}: {found}")
+
+        # Latency of the tiled executor as the thread count grows
+        for workers in args.workers:
+            detector = TiledDetector(matcher, workers=workers)
+            start = time.perf_counter()
+            for frame in frames:
+                detector.match_many(frame.image, compiled)
+            report(
+                f"tiled, {workers} threads", len(frames), time.perf_counter() - start
+            )
+            detector.close()
+    finally:
+        source.close()
+
+
+def _naive_pipeline(source, region, templates, tracker):
+    # The pre-pool path: every stage returns a freshly allocated array
+    frame = source.grab(region)
+    image = frame.image.copy()
+    tracker.update(image, frame.frame_id)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    size = fit_size(image.shape[1], image.shape[0], 460, 320)
+    thumb = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB)
+    for template in templates:
+        cv2.minMaxLoc(cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED))
+    return gray, rgb
+
+
+def _pooled_pipeline(source, region, templates, tracker, pool, converter):
+    frame = source.grab(region, out=pool)
+    tracker.update(frame.image, frame.frame_id)
+    gray = converter.gray(frame.image)
+    rgb = converter.rgb(converter.thumbnail(frame.image, (460, 320)))
+    height, width = frame.image.shape[:2]
+    for template in templates:
+        result = pool.acquire(
+            (height - template.shape[0] + 1, width - template.shape[1] + 1),
+            np.float32,
+        )
+        cv2.matchTemplate(frame.image, template, cv2.TM_CCOEFF_NORMED, result=result)
+        cv2.minMaxLoc(result)
+    return gray, rgb
+
+
+def bench_alloc(args):
+    """
+    Measure the peak memory allocated per frame by the capture, change
+    tracking, conversion and matching stages, with and without pooling.
+    """
+    source = create_frame_source(args.source)
+    sample = source.grab(args.region).image
+    # Small crops of the first frame stand in for real templates
+    templates = [
+        sample[y : y + 40, x : x + 60].copy() for x, y in ((50, 50), (400, 200))
+    ]
+
+    pool = BufferPool()
+    stages = {
+        "naive": lambda tracker: _naive_pipeline(
+            source, args.region, templates, tracker
+        ),
+        "pooled": lambda tracker: _pooled_pipeline(
+            source, args.region, templates, tracker, pool, FrameConverter(pool)
+        ),
+    }
+    try:
+        for label, run in stages.items():
+            tracker = ChangeTracker()
+            for _ in range(5):  # Warm up buffers and OpenCV internals
+                run(tracker)
+            allocations = pool.allocations
+            worst = 0
+            tracemalloc.start()
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                run(tracker)
+                worst = max(worst, tracemalloc.get_traced_memory()[1] - baseline)
+            elapsed = time.perf_counter() - start
+            tracemalloc.stop()
+            report(f"{label} pipeline", args.frames, elapsed)
+            print(
+                f"  peak allocation per frame: {worst / 1024:.1f} KiB, "
+                f"new pool buffers: {pool.allocations - allocations}"
+            )
+    finally:
+        source.close()
+
+
+def _render_text(text):
+    # Stand-in for a game counter crop: light text on a dark background
+    image = np.full((28, 20 * len(text) + 10), 40, dtype=np.uint8)
+    cv2.putText(
+        image, text, (4, 21), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 230, 2, cv2.LINE_AA
+    )
+    return image
+
+
+def bench_ocr(args):
+    """
+    Time the digit glyph recognizer on counter readings. Without a samples
+    folder it trains on and reads rendered text.
+    """
+    if args.samples and os.path.isdir(args.samples):
+        engine = GlyphEngine.from_folder(args.samples)
+        with open(os.path.join(args.samples, "samples.json"), "r") as f:
+            labels = json.load(f)
+        crops = [
+            (cv2.imread(os.path.join(args.samples, file), cv2.IMREAD_GRAYSCALE), text)
+            for file, text in labels.items()
+        ]
+        crops = [(image, text) for image, text in crops if image is not None]
+    else:
+        engine = GlyphEngine()
+        engine.train([(_render_text(t), t) for t in ("0123456789", "3/5", "12,345")])
+        crops = [(_render_text(t), t) for t in ("3/5", "0/5", "4,210", "98765")]
+    print(f"glyphs: {''.join(sorted(engine.charset))} from {engine.samples} samples")
+
+    correct = 0
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        for image, text in crops:
+            correct += engine.read(image) == text.replace(" ", "")
+    report("glyph reads", args.frames * len(crops), time.perf_counter() - start)
+    print(f"  correct: {correct}/{args.frames * len(crops)}")
+
+
+def _synthetic_macro(count):
+    rng = random.Random(0)
+    events, t = [], 0.0
+    while len(events) < count:
+        t += rng.uniform(0.01, 0.2)
+        kind = rng.random()
+        if kind < 0.5:
+            key = rng.choice(["'a'", "'w'", "'1'", "Key.space", "Key.shift"])
+            events.append({"type": "key_press", "key": key, "time": t})
+            events.append({"type": "key_release", "key": key, "time": t + 0.05})
+        elif kind < 0.9:
+            x, y = rng.randrange(1920), rng.randrange(1080)
+            button = rng.choice(["Button.left", "Button.right"])
+            for pressed in (True, False):
+                events.append(
+                    {
+                        "type": "mouse_click",
+                        "x": x,
+                        "y": y,
+                        "button": button,
+                        "pressed": pressed,
+                        "time": t,
+                    }
+                )
+        else:
+            events.append(
+                {"type": "mouse_scroll", "x": 0, "y": 0, "dx": 0, "dy": -1, "time": t}
+            )
+    return events
+
+
+def _dispatch_events(events, sink):
+    # The per-event work playback did on the JSON form
+    for event in events:
+        etype = event["type"]
+        if etype in ("key_press", "key_release"):
+            sink(convert_key_str(event["key"]))
+        elif etype == "mouse_click":
+            button_str = event["button"]
+            button = (
+                "left"
+                if "left" in button_str
+                else "right" if "right" in button_str else "middle"
+            )
+            sink(button, event["x"], event["y"], event["pressed"])
+        elif etype == "mouse_scroll":
+            sink(event["dy"])
+
+
+def _dispatch_compiled(macro, sink):
+    keys = macro.keys
+    for op, _, x, y, arg, _ in macro.rows():
+        if op == KEY_PRESS or op == KEY_RELEASE:
+            sink(keys[arg])
+        elif op == MOUSE_DOWN or op == MOUSE_UP:
+            sink(BUTTON_NAMES[arg], x, y, op == MOUSE_DOWN)
+        elif op == SCROLL:
+            sink(arg)
+
+
+def bench_macro(args):
+    """
+    Compare loading and dispatching a macro from its JSON form against the
+    compiled form. Input is sent to a no-op sink, so the per-event numbers
+    are pure interpreter overhead.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        if args.macro:
+            with open(args.macro, "r") as f:
+                events = json.load(f)
+        else:
+            events = _synthetic_macro(args.events)
+        path = os.path.join(folder, "macro.json")
+        save_macro(path, events)
+        print(
+            f"macro: {len(events)} events, JSON {os.path.getsize(path)} bytes, "
+            f"compiled {os.path.getsize(binary_path(path))} bytes"
+        )
+
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            with open(path, "r") as f:
+                CompiledMacro.compile(json.load(f))
+        report("JSON load + compile", args.frames, time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            CompiledMacro.load(binary_path(path))
+        report("compiled load", args.frames, time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            load_macro(path)
+        report(
+            "load_macro (cache hit, events rebuilt)",
+            args.frames,
+            time.perf_counter() - start,
+        )
+
+    macro = CompiledMacro.compile(events)
+    macro.rows()  # Built once per macro, not per playback
+    sink = lambda *a: None
+    total = args.frames * len(events)
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        _dispatch_events(events, sink)
+    json_time = time.perf_counter() - start
+    report("JSON event dispatch", total, json_time)
+    print(f"  {1e6 * json_time / total:.3f} us per event")
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        _dispatch_compiled(macro, sink)
+    compiled_time = time.perf_counter() - start
+    report("compiled event dispatch", total, compiled_time)
+    print(f"  {1e6 * compiled_time / total:.3f} us per event")
+
+    _bench_mouse_path(args)
+
+
+def _synthetic_path(seconds, rng):
+    # 1 kHz cursor positions: eased strokes between random targets and rests
+    points, t = [], 0
+    x, y = 960.0, 540.0
+    while t < seconds * 1e9:
+        tx, ty = rng.randrange(1920), rng.randrange(1080)
+        steps = rng.randrange(150, 600)
+        for i in range(1, steps + 1):
+            ease = 0.5 - 0.5 * np.cos(np.pi * i / steps)
+            wobble = 3 * np.sin(i / 15)
+            points.append(
+                (t, round(x + (tx - x) * ease + wobble), round(y + (ty - y) * ease))
+            )
+            t += 1_000_000
+        x, y = tx, ty
+        t += rng.randrange(200, 1500) * 1_000_000  # Rest
+    return points
+
+
+def _bench_mouse_path(args):
+    """
+    Path compression of recorded mouse moves: stored points, replay error
+    against the raw path and the CPU cost of generating the replay.
+    """
+    raw = _synthetic_path(60, random.Random(1))
+    simplifier = PathSimplifier()
+    start = time.perf_counter()
+    kept = []
+    for point in raw:
+        kept.extend(simplifier.add(*point))
+    kept.extend(simplifier.flush())
+    elapsed = time.perf_counter() - start
+    print(
+        f"mouse path: {len(raw)} positions stored as {len(kept)} "
+        f"({len(raw) / len(kept):.0f}x), {1e6 * elapsed / len(raw):.2f} us per position"
+    )
+
+    macro = CompiledMacro.compile(
+        [
+            {"type": "mouse_move", "time": t / 1e9, "x": x, "y": y, "start": s}
+            for t, x, y, s in kept
+        ]
+    )
+    start = time.process_time()
+    replay = [row for row in macro.timeline(1_000_000)]
+    cpu = time.process_time() - start
+    replayed = {row[1]: (row[2], row[3]) for row in replay}
+    errors = [
+        np.hypot(x - replayed[t][0], y - replayed[t][1])
+        for t, x, y in raw
+        if t in replayed
+    ]
+    print(
+        f"  replay at 1 ms steps: {len(replay)} moves, {1000 * cpu:.1f} ms CPU, "
+        f"max error {max(errors):.1f} px, mean {np.mean(errors):.2f} px"
+    )
+
+
+def bench_playback(args):
+    """
+    Play a macro through the recording input backend: timing accuracy at
+    each playback speed and dispatch throughput with no waiting at all.
+    """
+    if args.macro:
+        with open(args.macro, "r") as f:
+            events = json.load(f)
+    else:
+        events = _synthetic_macro(args.events)
+        # Squeeze the synthetic macro into `duration` seconds
+        scale = args.duration / events[-1]["time"]
+        for event in events:
+            event["time"] *= scale
+    macro = CompiledMacro.compile(events)
+    print(f"macro: {len(macro)} events over {macro.duration:.1f}s")
+
+    for speed in args.speeds:
+        backend = RecordingBackend()
+        clock = PlaybackClock(speed)
+        clock.start()
+        start = time.perf_counter()
+        result = run_macro(macro, backend, clock)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{speed:g}x: {len(backend.actions)} inputs in {result['batches']} "
+            f"batches, {elapsed:.2f}s wall (expected {macro.duration / speed:.2f}s), "
+            f"{1000 * result['cpu']:.0f} ms CPU"
+        )
+        print(f"  {clock.stats.format()}")
+
+    backend = RecordingBackend()
+    clock = PlaybackClock(1e9)  # Every deadline is already due
+    clock.start()
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        run_macro(macro, backend, clock)
+        clock.start()
+    report("unthrottled dispatch", len(backend.actions), time.perf_counter() - start)
+
+
+def parse_region(value):
+    left, top, width, height = (int(v) for v in value.split(","))
+    return left, top, width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m modules.bench")
+    parser.add_argument(
+        "--source",
+        default="synthetic",
+        help="Frame source: pyautogui, raw, synthetic or a directory/video path",
+    )
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument(
+        "--region", type=parse_region, default=None, help="left,top,width,height"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("capture").set_defaults(func=bench_capture)
+
+    detect = sub.add_parser("detect")
+    detect.add_argument("--templates", default="templates")
+    detect.add_argument("--threshold", type=float, default=0.8)
+    detect.add_argument(
+        "--workers",
+        type=lambda v: [int(n) for n in v.split(",")],
+        default=[1, os.cpu_count() or 1],
+        help="Comma-separated thread counts for the tiled detector",
+    )
+    detect.set_defaults(func=bench_detect)
+
+    sub.add_parser("alloc").set_defaults(func=bench_alloc)
+
+    ocr = sub.add_parser("ocr")
+    ocr.add_argument("--samples", default="glyphs")
+    ocr.set_defaults(func=bench_ocr)
+
+    macro = sub.add_parser("macro")
+    macro.add_argument("--macro", help="Recorded macro JSON (default: synthetic)")
+    macro.add_argument("--events", type=int, default=2000)
+    macro.set_defaults(func=bench_macro)
+
+    playback = sub.add_parser("playback")
+    playback.add_argument("--macro", help="Recorded macro JSON (default: synthetic)")
+    playback.add_argument("--events", type=int, default=2000)
+    playback.add_argument(
+        "--duration", type=float, default=5.0, help="Synthetic macro length (s)"
+    )
+    playback.add_argument(
+        "--speeds",
+        type=lambda v: [float(n) for n in v.split(",")],
+        default=[1.0, 3.0],
+        help="Comma-separated playback speeds",
+    )
+    playback.set_defaults(func=bench_playback)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+try:
+    import pyautogui
+except Exception:  # pyautogui fails to import on headless machines
+    pyautogui = None
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+# A captured frame: BGR image, monotonically increasing id and the
+# time.perf_counter() timestamp at which it was grabbed.
+Frame = namedtuple("Frame", ["image", "frame_id", "timestamp"])
+
+# A frame made of separately captured rectangles of a window. patches is a
+# list of ((x, y, width, height), image) in window coordinates and size is
+# the (width, height) of the whole window.
+RegionFrame = namedtuple("RegionFrame", ["patches", "frame_id", "timestamp", "size"])
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+
+class FrameSource:
+    """
+    Base class for everything that produces frames.
+    Subclasses implement _grab(region, out) and return a BGR numpy array.
+    A region is (left, top, width, height) in screen coordinates, or None
+    for the whole source. `out` is an optional BufferPool; when given the
+    BGR image is written into a pooled buffer instead of a new array.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._frame_id = 0
+        self._id_lock = threading.Lock()
+
+    def grab(self, region=None, out=None):
+        """
+        Grab a frame and return it as a Frame, or None if the grab failed.
+        """
+        image = self._grab(region, out)
+        if image is None:
+            return None
+        return self._stamp(image)
+
+    def grab_regions(self, regions, out=None):
+        """
+        Grab several regions belonging to the same tick. Returns a Frame
+        whose image is a list of BGR images (None where a grab failed).
+        """
+        return self._stamp(self._grab_many(regions, out))
+
+    def _stamp(self, image):
+        with self._id_lock:
+            self._frame_id += 1
+            frame_id = self._frame_id
+        return Frame(image, frame_id, time.perf_counter())
+
+    def _grab(self, region, out):
+        raise NotImplementedError
+
+    def _grab_many(self, regions, out):
+        return [self._grab(region, out) for region in regions]
+
+    def close(self):
+        pass
+
+
+class PyAutoGUIFrameSource(FrameSource):
+    """
+    The original capture path: pyautogui screenshot -> PIL -> numpy -> BGR.
+    """
+
+    name = "pyautogui"
+
+    def __init__(self):
+        super().__init__()
+        if pyautogui is None:
+            raise RuntimeError("pyautogui is not available on this machine.")
+
+    def _grab(self, region, out):
+        rgb = np.asarray(pyautogui.screenshot(region=region))
+        dst = out.acquire(rgb.shape) if out is not None else None
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=dst)
+
+
+class RawBufferFrameSource(FrameSource):
+    """
+    Grabs the screen with mss and converts its raw BGRA buffer straight to
+    BGR, skipping the PIL round trip. mss handles are not thread safe, so
+    each capturing thread gets its own.
+    """
+
+    name = "raw"
+
+    def __init__(self):
+        super().__init__()
+        if mss is None:
+            raise RuntimeError("mss is not installed (pip install mss).")
+        self._local = threading.local()
+
+    def _get_sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def _grab(self, region, out):
+        sct = self._get_sct()
+        if region is None:
+            monitor = sct.monitors[0]  # All monitors combined
+        else:
+            left, top, width, height = region
+            monitor = {"left": left, "top": top, "width": width, "height": height}
+        shot = sct.grab(monitor)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(
+            shot.height, shot.width, 4
+        )
+        dst = out.acquire((shot.height, shot.width, 3)) if out is not None else None
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=dst)
+
+    def close(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class _OffscreenFrameSource(FrameSource):
+    """
+    Shared region handling for sources that are not backed by the screen.
+    The stored frame is assumed to sit at `origin` in screen coordinates,
+    so regions are translated into frame coordinates and clipped.
+    """
+
+    def __init__(self, origin=(0, 0)):
+        super().__init__()
+        self.origin = origin
+
+    def _crop(self, image, region, out=None):
+        if region is not None:
+            left, top, width, height = region
+            x1 = max(0, left - self.origin[0])
+            y1 = max(0, top - self.origin[1])
+            x2 = min(image.shape[1], left - self.origin[0] + width)
+            y2 = min(image.shape[0], top - self.origin[1] + height)
+            if x2 <= x1 or y2 <= y1:
+                return None
+            image = image[y1:y2, x1:x2]
+        if out is None:
+            return image
+        dst = out.acquire(image.shape)
+        np.copyto(dst, image)
+        return dst
+
+
+class FileFrameSource(_OffscreenFrameSource):
+    """
+    Replays recorded frames from a directory of images or a video file.
+    Images are played back in sorted file name order. With loop=True the
+    source restarts at the first frame once it runs out, otherwise grab()
+    returns None.
+    """
+
+    name = "file"
+
+    def __init__(self, path, loop=True, origin=(0, 0)):
+        super().__init__(origin)
+        self.path = path
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._files = None
+        self._video = None
+        self._index = 0
+
+        if os.path.isdir(path):
+            self._files = sorted(
+                os.path.join(path, f)
+                for f in os.listdir(path)
+                if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS
+            )
+            if not self._files:
+                raise ValueError(f"No frame images found in '{path}'.")
+        elif os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+            self._video = cv2.VideoCapture(path)
+            if not self._video.isOpened():
+                raise ValueError(f"Could not open video '{path}'.")
+        else:
+            raise ValueError(f"Unsupported frame source path '{path}'.")
+
+    def _next_image(self):
+        if self._files is not None:
+            if self._index >= len(self._files):
+                if not self.loop:
+                    return None
+                self._index = 0
+            image = cv2.imread(self._files[self._index])
+            self._index += 1
+            return image
+
+        ok, image = self._video.read()
+        if not ok and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._video.read()
+        return image if ok else None
+
+    def _grab(self, region, out):
+        with self._lock:
+            image = self._next_image()
+        if image is None:
+            return None
+        return self._crop(image, region, out)
+
+    def _grab_many(self, regions, out):
+        # All regions of a tick come from the same recorded frame
+        with self._lock:
+            image = self._next_image()
+        if image is None:
+            return [None] * len(regions)
+        return [self._crop(image, region, out) for region in regions]
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+
+
+class SyntheticFrameSource(_OffscreenFrameSource):
+    """
+    Generates frames without any capture: a seeded noise background with
+    optional sprites (e.g. template images) pasted at fixed positions.
+    Useful for benchmarking detection when no recording is at hand.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, width=1280, height=720, sprites=None, seed=0, origin=(0, 0)):
+        super().__init__(origin)
+        rng = np.random.default_rng(seed)
+        self.background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for image, (x, y) in (sprites or {}).values():
+            h = min(image.shape[0], height - y)
+            w = min(image.shape[1], width - x)
+            self.background[y : y + h, x : x + w] = image[:h, :w]
+
+    def _grab(self, region, out):
+        image = self._crop(self.background, region, out)
+        if image is None or out is not None:
+            return image
+        return image.copy()
+
+
+def _union(a, b):
+    x1, y1 = min(a[0], b[0]), min(a[1], b[1])
+    x2 = max(a[0] + a[2], b[0] + b[2])
+    y2 = max(a[1] + a[3], b[1] + b[3])
+    return x1, y1, x2 - x1, y2 - y1
+
+
+def merge_regions(regions, grab_cost=64 * 64):
+    """
+    Reduce a list of (x, y, width, height) rectangles to a small covering
+    set. Two rectangles are merged whenever their bounding box costs no
+    more pixels than capturing both separately plus grab_cost, the pixel
+    equivalent of the fixed overhead of one extra grab.
+    """
+    rects = [tuple(r) for r in regions if r and r[2] > 0 and r[3] > 0]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                union = _union(a, b)
+                if union[2] * union[3] <= a[2] * a[3] + b[2] * b[3] + grab_cost:
+                    rects[i] = union
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+FRAME_SOURCES = {
+    "pyautogui": PyAutoGUIFrameSource,
+    "raw": RawBufferFrameSource,
+    "file": FileFrameSource,
+    "synthetic": SyntheticFrameSource,
+}
+
+
+def create_frame_source(kind=None, **kwargs):
+    """
+    Build a frame source by name. With no name, prefer the raw buffer
+    backend and fall back to pyautogui when mss is missing. A path to a
+    directory or video file selects the file backend.
+    """
+    if not kind:
+        kind = "raw" if mss is not None else "pyautogui"
+    elif kind not in FRAME_SOURCES and os.path.exists(kind):
+        return FileFrameSource(kind, **kwargs)
+    try:
+        source_class = FRAME_SOURCES[kind]
+    except KeyError:
+        raise ValueError(f"Unknown frame source '{kind}'.")
+    return source_class(**kwargs)
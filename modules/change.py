@@ -0,0 +1,145 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class ChangeTracker:
+    """
+    Cheap tile-level frame differencer. Each frame is downscaled to gray,
+    diffed against the previous one and reduced to a per-tile maximum. For
+    every tile it remembers the id of the last frame in which it changed, so
+    consumers can ask whether a region changed since the frame they last
+    processed. All working buffers are preallocated per frame size.
+    """
+
+    def __init__(self, tile_size=64, scale=4, threshold=12):
+        self.tile_size = tile_size  # In full-resolution pixels
+        self.scale = scale  # Downscale factor before diffing
+        self.threshold = threshold  # Per-pixel gray difference that counts
+        self._shape = None
+        self._primed = False
+        self._last_changed = None
+        self._lock = threading.Lock()
+
+    def _allocate(self, height, width, frame_id):
+        small_w, small_h = max(1, width // self.scale), max(1, height // self.scale)
+        cell = max(1, self.tile_size // self.scale)
+        rows, cols = -(-small_h // cell), -(-small_w // cell)
+
+        self._shape = (height, width)
+        self._cell = cell
+        self._small = np.empty((small_h, small_w, 3), dtype=np.uint8)
+        self._gray = [np.empty((small_h, small_w), dtype=np.uint8) for _ in range(2)]
+        self._current = 0
+        # Diffs are written into the top-left of a zero-padded whole-tile grid
+        self._padded = np.zeros((rows * cell, cols * cell), dtype=np.uint8)
+        self._diff = self._padded[:small_h, :small_w]
+        self._tile_max = np.empty((rows, cols), dtype=np.uint8)
+        self._changed = np.empty((rows, cols), dtype=bool)
+        self._last_changed = np.full((rows, cols), frame_id, dtype=np.int64)
+
+    def reset(self, frame_id=0):
+        """
+        Forget the previous frame and mark everything as changed at frame_id.
+        """
+        with self._lock:
+            self._primed = False
+            if self._last_changed is not None:
+                self._last_changed[:] = frame_id
+
+    def update(self, image, frame_id):
+        """
+        Feed a new BGR frame. Returns the boolean grid of tiles that changed;
+        the grid is reused by the next update.
+        """
+        height, width = image.shape[:2]
+        with self._lock:
+            if self._shape != (height, width):
+                self._allocate(height, width, frame_id)
+                self._primed = False
+
+            cv2.resize(
+                image,
+                (self._small.shape[1], self._small.shape[0]),
+                dst=self._small,
+                interpolation=cv2.INTER_AREA,
+            )
+            current = self._gray[self._current]
+            cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=current)
+            self._current = 1 - self._current
+
+            if not self._primed:
+                self._primed = True
+                self._last_changed[:] = frame_id
+                self._changed[:] = True
+                return self._changed
+
+            previous = self._gray[self._current]
+            cv2.absdiff(current, previous, dst=self._diff)
+            rows, cols = self._tile_max.shape
+            self._padded.reshape(rows, self._cell, cols, self._cell).max(
+                axis=(1, 3), out=self._tile_max
+            )
+            np.greater(self._tile_max, self.threshold, out=self._changed)
+            np.putmask(self._last_changed, self._changed, frame_id)
+            return self._changed
+
+    def changed_since(self, region, frame_id):
+        """
+        True if any tile overlapping the (x, y, width, height) region (or
+        the whole frame when region is None) changed after frame_id.
+        """
+        with self._lock:
+            if self._last_changed is None:
+                return True
+            if region is None:
+                return bool(self._last_changed.max() > frame_id)
+            x, y, width, height = region
+            tx1, ty1 = max(0, x // self.tile_size), max(0, y // self.tile_size)
+            tx2 = -(-(x + width) // self.tile_size)
+            ty2 = -(-(y + height) // self.tile_size)
+            tiles = self._last_changed[ty1:ty2, tx1:tx2]
+            return tiles.size == 0 or bool(tiles.max() > frame_id)
+
+
+class RegionCache:
+    """
+    Results computed on a region of a frame (OCR text, template matches),
+    reused for as long as the ChangeTracker reports no change in that region.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, region):
+        """
+        Return the cached value for key, or None if the region changed since
+        it was computed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            cached_region, frame_id, value = entry
+            if cached_region == region and not self.tracker.changed_since(
+                region, frame_id
+            ):
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, region, frame_id, value):
+        with self._lock:
+            self._entries[key] = (region, frame_id, value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,220 @@
+import re
+import time
+
+import cv2
+
+from modules.frame_bus import crop_frame
+from modules.ocr_engines import DIGITS
+from modules.resources import parse_number
+
+
+class ConditionEngine:
+    """
+    Evaluates macro event conditions against frames of the game window.
+
+    A condition is a dict; every test it names must pass:
+      "template": name, "threshold": 0.8   the template is visible
+      "text": regex, "roi": name           OCR text (of the ROI, or the whole
+                                           frame without one) matches
+      "roi": name, "min"/"max"/"equals"    the number read in the ROI
+      "not": true                          negates the result
+
+    Results are memoized per frame id, so all conditions due at the same
+    tick are evaluated against one shared frame and each template or ROI
+    is read at most once per frame. wait_until() re-evaluates only when the
+    frame bus reports a change in the regions the condition looks at.
+
+    get_window() returns the game window; get_rois() returns
+    {name: (x, y, width, height)} in window coordinates.
+    """
+
+    def __init__(
+        self, macro_system, get_window, get_rois, max_age=0.1, log_message=None
+    ):
+        self.macro_system = macro_system
+        self.get_window = get_window
+        self.get_rois = get_rois
+        self.max_age = max_age  # Frames this fresh are shared between checks
+        self.log_message = log_message
+        self.evaluations = 0
+        self.memo_hits = 0
+        self.frames_waited = 0
+        self._memo_frame = None
+        self._memo = {}
+        self._grab_key = None  # Bus tick the ad-hoc full frame was taken at
+        self._grab = None
+
+    def frame(self):
+        """
+        Latest full frame of the window. With ROI-only capture the bus
+        ticks carry only the regions, so a full frame is grabbed and then
+        reused until the bus ticks again; conditions due at the same tick
+        still share one frame.
+        """
+        window = self.get_window()
+        if window is None:
+            return None
+        tick = self.macro_system.get_frame_bus(window).latest(self.max_age)
+        if tick is not None and hasattr(tick, "image"):
+            return tick
+        key = (self.macro_system.window_key(window), getattr(tick, "frame_id", None))
+        if tick is not None and key == self._grab_key:
+            return self._grab
+        frame = self.macro_system.latest_frame(window, self.max_age)
+        self._grab_key, self._grab = key, frame
+        return frame
+
+    def _memoized(self, frame, key, compute):
+        if frame.frame_id != self._memo_frame:
+            self._memo_frame = frame.frame_id
+            self._memo = {}
+        if key in self._memo:
+            self.memo_hits += 1
+            return self._memo[key]
+        value = self._memo[key] = compute()
+        return value
+
+    def _roi_image(self, frame, name):
+        region = self.get_rois().get(name)
+        if region is None:
+            raise KeyError(f"ROI '{name}' is not set")
+        crop = crop_frame(frame, region)
+        return None if crop is None else crop.image
+
+    def _template_score(self, frame, name):
+        window = self.get_window()
+        match = self.macro_system.detect_many(frame, [name], window).get(name)
+        return match.score if match is not None else 0.0
+
+    def _read(self, frame, roi, pattern=None, charset=None):
+        image = frame.image if roi is None else self._roi_image(frame, roi)
+        if image is None or not image.size:
+            return ""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.macro_system.ocr.read(gray, pattern=pattern, charset=charset) or ""
+
+    def evaluate(self, condition, frame):
+        """
+        True if every test in the condition passes on this frame.
+        """
+        self.evaluations += 1
+        result = True
+        name = condition.get("template")
+        if name:
+            score = self._memoized(
+                frame,
+                ("template", name),
+                lambda: self._template_score(frame, name),
+            )
+            result = score > condition.get("threshold", 0.8)
+
+        roi = condition.get("roi")
+        pattern = condition.get("text")
+        if result and pattern:
+            text = self._memoized(
+                frame,
+                ("text", roi, pattern),
+                lambda: self._read(frame, roi, pattern=pattern),
+            )
+            result = re.search(pattern, text) is not None
+        elif result and roi:
+            value = self._memoized(
+                frame,
+                ("value", roi),
+                lambda: parse_number(self._read(frame, roi, charset=DIGITS)),
+            )
+            result = value is not None
+            if result and "min" in condition:
+                result = value >= condition["min"]
+            if result and "max" in condition:
+                result = value <= condition["max"]
+            if result and "equals" in condition:
+                result = value == condition["equals"]
+
+        return result != bool(condition.get("not"))
+
+    def regions(self, condition):
+        """
+        Window regions the condition depends on; None means the whole frame.
+        """
+        if condition.get("template") or (
+            condition.get("text") and not condition.get("roi")
+        ):
+            return None
+        roi = condition.get("roi")
+        return [self.get_rois().get(roi)] if roi else None
+
+    def check(self, condition):
+        frame = self.frame()
+        if frame is None:
+            if self.log_message:
+                self.log_message("No game window frame for a condition.", "ERROR")
+            return False
+        return self.evaluate(condition, frame)
+
+    def wait_until(self, condition, timeout, running=None):
+        """
+        Block until the condition holds, re-evaluating it on each new frame
+        in which its regions changed. Returns False after timeout seconds or
+        when running() turns false.
+        """
+        window = self.get_window()
+        frame = self.frame()
+        if frame is None:
+            return False
+        if self.evaluate(condition, frame):
+            return True
+        bus = self.macro_system.get_frame_bus(window)
+        regions = self.regions(condition) or [None]
+        last_id = frame.frame_id
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or (running is not None and not running()):
+                return False
+            new = bus.next_frame(last_id, timeout=min(remaining, 0.5))
+            if new is None:
+                continue
+            self.frames_waited += 1
+            changed = any(bus.changes.changed_since(r, last_id) for r in regions)
+            last_id = new.frame_id
+            if not changed:
+                continue
+            if not hasattr(new, "image"):
+                new = self.frame()  # ROI-only capture, take a full frame
+                if new is None:
+                    continue
+            if self.evaluate(condition, new):
+                return True
+
+    def run(self, spec, running=None):
+        """
+        Handle an event's condition spec: wait for its "wait_until"
+        condition (up to its "timeout", 10 s by default), then check its
+        "condition". Returns True if the event should be played.
+        """
+        wait = spec.get("wait_until")
+        try:
+            if wait and not self.wait_until(wait, wait.get("timeout", 10.0), running):
+                if self.log_message:
+                    self.log_message(f"Timed out waiting for {wait}, skipping event.")
+                return False
+            condition = spec.get("condition")
+            return not condition or self.check(condition)
+        except Exception as e:
+            if self.log_message:
+                self.log_message(f"Error evaluating condition: {str(e)}", "ERROR")
+            return False
+
+    def reset_stats(self):
+        """Zero the counters, so stats() covers a single run."""
+        self.evaluations = 0
+        self.memo_hits = 0
+        self.frames_waited = 0
+
+    def stats(self):
+        return {
+            "evaluations": self.evaluations,
+            "memo_hits": self.memo_hits,
+            "frames_waited": self.frames_waited,
+        }
@@ -0,0 +1,95 @@
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+
+class BufferPool:
+    """
+    Preallocated numpy buffers reused across frames. A buffer is handed out
+    again only once nothing outside the pool references it any more (no
+    Frame, view or consumer holds it), so consumers that keep a frame
+    around never see it overwritten. At steady state no new memory is
+    allocated; the pool only grows while consumers hold more buffers.
+    """
+
+    # References held by the pool list, the loop variable and getrefcount()
+    _IDLE_REFS = 3
+
+    def __init__(self, max_shapes=16):
+        self.max_shapes = max_shapes
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        Return a writable buffer of the given shape and dtype.
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers is None:
+                if len(self._buffers) >= self.max_shapes:
+                    self._buffers.clear()  # Window resized too often, start over
+                buffers = self._buffers[key] = []
+            for buf in buffers:
+                if sys.getrefcount(buf) <= self._IDLE_REFS:
+                    buf.setflags(write=True)  # The frame bus marks them read-only
+                    return buf
+            buf = np.empty(shape, dtype=dtype)
+            buffers.append(buf)
+            self.allocations += 1
+            return buf
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+
+def fit_size(width, height, max_width, max_height):
+    """
+    Largest (width, height) with the same aspect ratio that fits in the box,
+    never upscaling (like PIL's thumbnail).
+    """
+    scale = min(1.0, max_width / width, max_height / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+class FrameConverter:
+    """
+    Per-window conversion stage writing gray, RGB and downscaled versions
+    of frames into pooled buffers instead of allocating new arrays.
+    Returned arrays stay valid for as long as the caller holds them.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or BufferPool()
+
+    def gray(self, image):
+        dst = self.pool.acquire(image.shape[:2])
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+    def rgb(self, image):
+        dst = self.pool.acquire(image.shape)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=dst)
+
+    def resize(self, image, size):
+        """
+        Resize to size=(width, height) with area interpolation.
+        """
+        width, height = size
+        if (width, height) == (image.shape[1], image.shape[0]):
+            dst = self.pool.acquire(image.shape, image.dtype)
+            np.copyto(dst, image)
+            return dst
+        dst = self.pool.acquire((height, width) + image.shape[2:], image.dtype)
+        return cv2.resize(image, (width, height), dst=dst, interpolation=cv2.INTER_AREA)
+
+    def thumbnail(self, image, max_size):
+        """
+        Downscale to fit in max_size=(width, height), keeping aspect ratio.
+        """
+        size = fit_size(image.shape[1], image.shape[0], *max_size)
+        return self.resize(image, size)
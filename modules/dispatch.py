@@ -0,0 +1,323 @@
+import time
+
+from modules.macro import (
+    BUTTON_NAMES,
+    KEY_PRESS,
+    KEY_RELEASE,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    MOVE,
+    SCROLL,
+)
+
+try:
+    import pyautogui
+except Exception:  # pyautogui fails to import on headless machines
+    pyautogui = None
+
+try:
+    import pydirectinput
+except Exception:  # Windows only
+    pydirectinput = None
+
+try:
+    from pynput import keyboard as pynput_keyboard, mouse as pynput_mouse
+except Exception:  # No display or pynput missing (headless benchmarks)
+    pynput_keyboard = pynput_mouse = None
+
+# Raised by the input libraries' fail-safe (cursor moved to a screen
+# corner); they must stop playback rather than be logged and skipped
+ABORT_EXCEPTIONS = tuple(
+    exc
+    for exc in (
+        getattr(pyautogui, "FailSafeException", None),
+        getattr(pydirectinput, "FailSafeException", None),
+    )
+    if exc is not None
+)
+
+
+class SendError(Exception):
+    """
+    An action of a batch failed. `sent` actions before it were injected;
+    `error` is the original exception.
+    """
+
+    def __init__(self, sent, error):
+        super().__init__(f"action {sent} of the batch failed: {error}")
+        self.sent = sent
+        self.error = error
+
+
+# pynput Key names that differ from pyautogui/pydirectinput key names
+_KEY_NAMES = {
+    "ctrl_l": "ctrlleft",
+    "ctrl_r": "ctrlright",
+    "alt_l": "altleft",
+    "alt_r": "altright",
+    "alt_gr": "altright",
+    "shift_l": "shiftleft",
+    "shift_r": "shiftright",
+    "cmd": "win",
+    "cmd_l": "winleft",
+    "cmd_r": "winright",
+}
+
+
+def key_name(key):
+    """
+    pyautogui-style name of a pynput key value ("a", Key.space...).
+    """
+    name = getattr(key, "name", None)
+    if name is None:
+        return str(getattr(key, "char", key)).lower()
+    return _KEY_NAMES.get(name, name.replace("_", ""))
+
+
+class InputBackend:
+    """
+    Base class for everything that sends input. Subclasses implement the
+    per-action methods; send() dispatches a batch of compiled macro rows
+    (op, x, y, arg, arg2) with key indexes already resolved to key values,
+    and backends that can inject several inputs in one call override it
+    (keeping its SendError contract).
+    """
+
+    name = "base"
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def mouse_down(self, x, y, button="left"):
+        raise NotImplementedError
+
+    def mouse_up(self, x, y, button="left"):
+        raise NotImplementedError
+
+    def move(self, x, y):
+        raise NotImplementedError
+
+    def scroll(self, dy, dx=0):
+        raise NotImplementedError
+
+    def click(self, x, y, button="left"):
+        self.mouse_down(x, y, button)
+        self.mouse_up(x, y, button)
+
+    def send(self, actions):
+        """
+        Inject the actions in order. If one fails, raises SendError with
+        the number sent before it, so callers can go on with the rest
+        without repeating any; fail-safe aborts are raised as they are.
+        """
+        for sent, (op, x, y, arg, arg2) in enumerate(actions):
+            try:
+                if op == KEY_PRESS:
+                    self.key_down(arg)
+                elif op == KEY_RELEASE:
+                    self.key_up(arg)
+                elif op == MOUSE_DOWN:
+                    self.mouse_down(x, y, BUTTON_NAMES[arg])
+                elif op == MOUSE_UP:
+                    self.mouse_up(x, y, BUTTON_NAMES[arg])
+                elif op == MOVE:
+                    self.move(x, y)
+                elif op == SCROLL:
+                    self.scroll(arg, arg2)
+            except ABORT_EXCEPTIONS:
+                raise
+            except Exception as e:
+                raise SendError(sent, e) from e
+
+    def close(self):
+        pass
+
+
+class PynputBackend(InputBackend):
+    """
+    Keyboard and mouse through pynput controllers, built once.
+    """
+
+    name = "pynput"
+
+    def __init__(self):
+        if pynput_keyboard is None:
+            raise RuntimeError("pynput is not available.")
+        self.keyboard = pynput_keyboard.Controller()
+        self.mouse = pynput_mouse.Controller()
+        self._buttons = {
+            name: getattr(pynput_mouse.Button, name) for name in BUTTON_NAMES
+        }
+
+    def key_down(self, key):
+        self.keyboard.press(key)
+
+    def key_up(self, key):
+        self.keyboard.release(key)
+
+    def mouse_down(self, x, y, button="left"):
+        self.mouse.position = (x, y)
+        self.mouse.press(self._buttons[button])
+
+    def mouse_up(self, x, y, button="left"):
+        self.mouse.position = (x, y)
+        self.mouse.release(self._buttons[button])
+
+    def move(self, x, y):
+        self.mouse.position = (x, y)
+
+    def scroll(self, dy, dx=0):
+        self.mouse.scroll(dx, dy)
+
+
+class PyAutoGUIBackend(InputBackend):
+    """
+    Mouse through pyautogui with its global PAUSE (a 0.1 s sleep after
+    every call) disabled; the fail-safe corner check stays on. Keys go
+    through a pynput controller when pynput is available, since pynput
+    takes the recorded key values as they are.
+    """
+
+    name = "pyautogui"
+
+    def __init__(self):
+        if pyautogui is None:
+            raise RuntimeError("pyautogui is not available.")
+        pyautogui.PAUSE = 0
+        self.keyboard = pynput_keyboard.Controller() if pynput_keyboard else None
+
+    def key_down(self, key):
+        if self.keyboard is not None:
+            self.keyboard.press(key)
+        else:
+            pyautogui.keyDown(key_name(key), _pause=False)
+
+    def key_up(self, key):
+        if self.keyboard is not None:
+            self.keyboard.release(key)
+        else:
+            pyautogui.keyUp(key_name(key), _pause=False)
+
+    def mouse_down(self, x, y, button="left"):
+        pyautogui.mouseDown(x=x, y=y, button=button, _pause=False)
+
+    def mouse_up(self, x, y, button="left"):
+        pyautogui.mouseUp(x=x, y=y, button=button, _pause=False)
+
+    def move(self, x, y):
+        pyautogui.moveTo(x, y, _pause=False)
+
+    def scroll(self, dy, dx=0):
+        if dy:
+            pyautogui.scroll(dy, _pause=False)
+        if dx:
+            pyautogui.hscroll(dx, _pause=False)
+
+    def click(self, x, y, button="left"):
+        pyautogui.click(x, y, button=button, _pause=False)
+
+
+class DirectInputBackend(InputBackend):
+    """
+    Keyboard and mouse through pydirectinput (scan codes, for games that
+    ignore virtual-key input) with its global PAUSE disabled. pydirectinput
+    cannot scroll, so scrolls go through pyautogui.
+    """
+
+    name = "directinput"
+
+    def __init__(self):
+        if pydirectinput is None:
+            raise RuntimeError("pydirectinput is not available.")
+        pydirectinput.PAUSE = 0
+        if pyautogui is not None:
+            pyautogui.PAUSE = 0
+
+    def key_down(self, key):
+        pydirectinput.keyDown(key_name(key), _pause=False)
+
+    def key_up(self, key):
+        pydirectinput.keyUp(key_name(key), _pause=False)
+
+    def mouse_down(self, x, y, button="left"):
+        pydirectinput.mouseDown(x=x, y=y, button=button, _pause=False)
+
+    def mouse_up(self, x, y, button="left"):
+        pydirectinput.mouseUp(x=x, y=y, button=button, _pause=False)
+
+    def move(self, x, y):
+        pydirectinput.moveTo(x, y, _pause=False)
+
+    def scroll(self, dy, dx=0):
+        if pyautogui is not None and dy:
+            pyautogui.scroll(dy, _pause=False)
+
+    def click(self, x, y, button="left"):
+        pydirectinput.click(x, y, button=button, _pause=False)
+
+
+class RecordingBackend(InputBackend):
+    """
+    Injects nothing: every action is appended to `actions` as
+    (time.perf_counter_ns(), op, x, y, arg, arg2), so playback throughput
+    and timing can be measured on a headless machine. A batch is stamped
+    once, the way a real batched injection would land at once.
+    """
+
+    name = "recording"
+
+    def __init__(self):
+        self.actions = []
+
+    def _record(self, op, x=0, y=0, arg=0, arg2=0):
+        self.actions.append((time.perf_counter_ns(), op, x, y, arg, arg2))
+
+    def key_down(self, key):
+        self._record(KEY_PRESS, arg=key)
+
+    def key_up(self, key):
+        self._record(KEY_RELEASE, arg=key)
+
+    def mouse_down(self, x, y, button="left"):
+        self._record(MOUSE_DOWN, x, y, BUTTON_NAMES.index(button))
+
+    def mouse_up(self, x, y, button="left"):
+        self._record(MOUSE_UP, x, y, BUTTON_NAMES.index(button))
+
+    def move(self, x, y):
+        self._record(MOVE, x, y)
+
+    def scroll(self, dy, dx=0):
+        self._record(SCROLL, arg=dy, arg2=dx)
+
+    def send(self, actions):
+        now = time.perf_counter_ns()
+        self.actions.extend((now,) + tuple(action) for action in actions)
+
+    def clear(self):
+        self.actions = []
+
+
+INPUT_BACKENDS = {
+    backend.name: backend
+    for backend in (
+        PynputBackend,
+        PyAutoGUIBackend,
+        DirectInputBackend,
+        RecordingBackend,
+    )
+}
+
+
+def create_input_backend(kind=None):
+    """
+    Build an input backend by name, defaulting to pyautogui.
+    """
+    try:
+        backend_class = INPUT_BACKENDS[kind or "pyautogui"]
+    except KeyError:
+        raise ValueError(f"Unknown input backend '{kind}'.")
+    return backend_class()
@@ -0,0 +1,267 @@
+import threading
+import time
+from collections import deque
+
+from modules.capture import Frame, RegionFrame, merge_regions
+from modules.change import ChangeTracker, RegionCache
+from modules.convert import BufferPool, FrameConverter
+
+
+class FrameBus:
+    """
+    One capture loop per window publishing frames into a small ring buffer.
+    Every consumer (preview, detection, OCR) reads from the same buffer, so
+    a tick costs one grab no matter how many consumers there are.
+
+    Published images are marked read-only and handed out without copying;
+    consumers that want to draw on a frame must copy it first.
+
+    With roi_only enabled and regions registered via set_region(), each
+    tick grabs only the merged bounding set of those regions and publishes
+    a RegionFrame instead of the full window.
+
+    Every full frame is fed to a ChangeTracker; `results` caches work done
+    on regions of this window and reuses it while they stay unchanged.
+    """
+
+    def __init__(
+        self,
+        frame_source,
+        get_region,
+        fps=10,
+        size=4,
+        idle_timeout=2.0,
+        log_message=None,
+    ):
+        self.frame_source = frame_source
+        self.get_region = get_region  # Called every tick, windows can move
+        self.period = 1.0 / fps
+        self.idle_timeout = idle_timeout
+        self.log_message = log_message
+
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_read = time.perf_counter()
+        self._thread = None
+        self.frames_captured = 0
+        self.pixels_captured = 0
+        self.changes = ChangeTracker()
+        self.results = RegionCache(self.changes)
+        # Frames are captured into pooled buffers, see BufferPool
+        self.buffers = BufferPool()
+        self.converter = FrameConverter(BufferPool())
+
+        # ROI-restricted capture
+        self.roi_only = False
+        self._regions = {}
+        self._capture_rects = []
+        self._region_lock = threading.Lock()
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        failing = False
+        while not self._stop.is_set():
+            # Pause capturing while nobody is reading
+            if time.perf_counter() - self._last_read > self.idle_timeout:
+                self._wake.clear()
+                self._wake.wait()
+                next_tick = time.perf_counter()
+                continue
+
+            try:
+                frame = self.capture()
+                failing = False
+            except Exception as e:
+                frame = None
+                # Only log the first error of a streak, not every tick
+                if self.log_message and not failing:
+                    self.log_message(f"Frame bus capture error: {str(e)}", "ERROR")
+                failing = True
+            if frame is not None:
+                self.publish(frame)
+
+            next_tick += self.period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_tick = time.perf_counter()  # Fell behind, don't burst
+
+    def capture(self):
+        """
+        Grab one frame: the full window, or only the registered regions when
+        roi_only is enabled.
+        """
+        window_region = self.get_region()
+        with self._region_lock:
+            rects = list(self._capture_rects) if self.roi_only else []
+        if not rects:
+            return self.frame_source.grab(window_region, out=self.buffers)
+
+        left, top, width, height = window_region
+        clipped = []
+        for x, y, w, h in rects:
+            # Clip to the window, regions may outlive a resize
+            x1, y1 = max(0, x), max(0, y)
+            x2, y2 = min(width, x + w), min(height, y + h)
+            if x2 > x1 and y2 > y1:
+                clipped.append((x1, y1, x2 - x1, y2 - y1))
+        if not clipped:
+            return None
+
+        grabbed = self.frame_source.grab_regions(
+            [(left + x, top + y, w, h) for x, y, w, h in clipped], out=self.buffers
+        )
+        patches = [
+            (rect, image)
+            for rect, image in zip(clipped, grabbed.image)
+            if image is not None
+        ]
+        if not patches:
+            return None
+        return RegionFrame(
+            patches, grabbed.frame_id, grabbed.timestamp, (width, height)
+        )
+
+    def publish(self, frame):
+        """
+        Add a frame to the ring buffer and wake up waiting consumers.
+        """
+        if isinstance(frame, RegionFrame):
+            for _, image in frame.patches:
+                image.setflags(write=False)
+            pixels = sum(r[2] * r[3] for r, _ in frame.patches)
+            # Patches are not diffed, treat everything as changed
+            self.changes.reset(frame.frame_id)
+        else:
+            frame.image.setflags(write=False)
+            pixels = frame.image.shape[0] * frame.image.shape[1]
+            self.changes.update(frame.image, frame.frame_id)
+        with self._cond:
+            self._frames.append(frame)
+            self.frames_captured += 1
+            self.pixels_captured += pixels
+            self._cond.notify_all()
+
+    # --- Regions ---
+    def set_region(self, key, region):
+        """
+        Register (or with region=None, remove) a window-relative
+        (x, y, width, height) region that a consumer needs every tick.
+        """
+        with self._region_lock:
+            if region is None:
+                self._regions.pop(key, None)
+            else:
+                self._regions[key] = tuple(int(v) for v in region)
+            self._capture_rects = merge_regions(self._regions.values())
+
+    @property
+    def capture_rects(self):
+        with self._region_lock:
+            return list(self._capture_rects)
+
+    # --- Consumers ---
+    def _touch(self):
+        self._last_read = time.perf_counter()
+        if not self._wake.is_set():
+            self._wake.set()
+
+    def latest(self, max_age=None, timeout=1.0):
+        """
+        Return the newest frame. If it is older than max_age seconds (e.g.
+        because the loop was idle) wait up to timeout for a fresh one.
+        """
+        self._touch()
+        with self._cond:
+            frame = self._frames[-1] if self._frames else None
+        if frame is not None and (
+            max_age is None or time.perf_counter() - frame.timestamp <= max_age
+        ):
+            return frame
+        return self.next_frame(frame.frame_id if frame else 0, timeout) or frame
+
+    def next_frame(self, after_id, timeout=None):
+        """
+        Block until a frame with an id newer than after_id is available and
+        return it, or None on timeout.
+        """
+        self._touch()
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while not self._frames or self._frames[-1].frame_id <= after_id:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        return None
+                self._cond.wait(remaining)
+                if self._stop.is_set():
+                    return None
+            return self._frames[-1]
+
+    def frames(self):
+        """
+        Snapshot of the frames currently held in the ring buffer, oldest first.
+        """
+        with self._cond:
+            return list(self._frames)
+
+    def crop(self, region, max_age=None):
+        """
+        Latest view of a window-relative region. Falls back to grabbing just
+        that region when the latest frame does not cover it.
+        """
+        frame = self.latest(max_age)
+        sub = crop_frame(frame, region) if frame is not None else None
+        if sub is not None:
+            return sub
+        left, top = self.get_region()[:2]
+        x, y, width, height = region
+        return self.frame_source.grab((left + x, top + y, width, height))
+
+
+def crop_frame(frame, region):
+    """
+    Return a Frame holding a zero-copy view of (x, y, width, height) inside
+    the given frame, clipped to the frame bounds. For a RegionFrame the
+    region must lie inside one captured patch, otherwise None is returned.
+    """
+    x, y, width, height = region
+    if isinstance(frame, RegionFrame):
+        frame_width, frame_height = frame.size
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(frame_width, x + width), min(frame_height, y + height)
+        for (px, py, pw, ph), image in frame.patches:
+            if px <= x1 and py <= y1 and x2 <= px + pw and y2 <= py + ph:
+                view = image[y1 - py : y2 - py, x1 - px : x2 - px]
+                return Frame(view, frame.frame_id, frame.timestamp)
+        return None
+
+    image = frame.image
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(image.shape[1], x + width), min(image.shape[0], y + height)
+    return Frame(image[y1:y2, x1:x2], frame.frame_id, frame.timestamp)
@@ -0,0 +1,355 @@
+"""
+Compiled macros: recorded event dicts turned once into typed column arrays
+with keys and buttons already resolved, plus a compact binary file format.
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from modules.paths import interpolate
+
+try:
+    from pynput.keyboard import Key
+except Exception:  # No display or pynput missing (headless benchmarks)
+    Key = None
+
+# Opcodes
+KEY_PRESS = 0
+KEY_RELEASE = 1
+MOUSE_DOWN = 2
+MOUSE_UP = 3
+SCROLL = 4
+MOVE = 5  # arg is 1 for the first position of a stroke (after a rest)
+WAIT = 6  # Wait for the screen at x, y to settle: arg timeout, arg2 settle (ms)
+COND = 7  # Conditions of the next event: arg indexes CompiledMacro.conditions
+
+# Mouse buttons, indexes into BUTTON_NAMES
+LEFT = 0
+RIGHT = 1
+MIDDLE = 2
+BUTTON_NAMES = ("left", "right", "middle")
+
+MAGIC = b"DLSMACRO"
+FORMAT_VERSION = 3
+BINARY_EXTENSION = ".dlsm"
+
+# Column name -> dtype, in on-disk order
+COLUMNS = (
+    ("op", np.uint8),
+    ("time", np.int64),  # Nanoseconds since the start of the macro
+    ("x", np.int32),
+    ("y", np.int32),
+    ("arg", np.int32),  # Key table index, button, scroll dy, condition...
+    ("arg2", np.int32),  # Scroll dx, settle time
+)
+# One event as a packed little-endian record, used for streamed recordings
+ROW_DTYPE = np.dtype(
+    [(name, np.dtype(dtype).newbyteorder("<")) for name, dtype in COLUMNS]
+)
+
+
+def convert_key_str(key_str):
+    """
+    Converts a stored key string back to a key value.
+    For special keys, returns the appropriate pynput Key value.
+    For normal keys, returns the character.
+    """
+    if key_str.startswith("Key."):
+        key_name = key_str.split(".")[1]
+        try:
+            return getattr(Key, key_name)
+        except AttributeError:
+            return key_str
+    else:
+        return key_str.strip("'")
+
+
+def parse_button(button_str):
+    if "left" in button_str:
+        return LEFT
+    return RIGHT if "right" in button_str else MIDDLE
+
+
+class CompiledMacro:
+    """
+    A macro as parallel columns, one row per event: opcode, int64
+    nanosecond offset, x, y and two integer arguments. Key events point
+    into a key table holding the recorded key strings and their resolved
+    pynput values. Playback walks the columns as plain lists.
+
+    An event's "condition" and "wait_until" specs go to the `conditions`
+    table; a COND row pointing at them precedes the event.
+    """
+
+    def __init__(self, columns, key_strings, conditions=None):
+        self.columns = columns  # Column name -> numpy array
+        self.key_strings = list(key_strings)
+        self.conditions = list(conditions or [])
+        self.keys = [convert_key_str(k) for k in self.key_strings]
+        self.version = FORMAT_VERSION  # Format of the file it was loaded from
+        self.source = None  # source_stamp() of the JSON it was compiled from
+        self._rows = None
+
+    def __len__(self):
+        return len(self.columns["op"])
+
+    @property
+    def duration(self):
+        """
+        Recorded length in seconds.
+        """
+        times = self.columns["time"]
+        return float(times[-1]) / 1e9 if len(times) else 0.0
+
+    def rows(self):
+        """
+        (op, time_ns, x, y, arg, arg2) tuples, built once.
+        """
+        if self._rows is None:
+            self._rows = list(
+                zip(*(self.columns[name].tolist() for name, _ in COLUMNS))
+            )
+        return self._rows
+
+    def timeline(self, move_step_ns=8_000_000):
+        """
+        rows() with the mouse path filled in: between a position and the
+        next MOVE of the same stroke, extra MOVE rows (arg 2) are generated
+        every move_step_ns at constant speed. Recorded paths are simplified
+        so that this stays within the recording tolerance.
+        """
+        previous = None  # (time, x, y) of the last positioned event
+        for row in self.rows():
+            op, time_ns, x, y, arg, _ = row
+            if op == MOVE and not arg and previous is not None:
+                for point in interpolate(previous, (time_ns, x, y), move_step_ns):
+                    yield (MOVE, point[0], point[1], point[2], 2, 0)
+            if op == MOVE or op == MOUSE_DOWN or op == MOUSE_UP:
+                previous = (time_ns, x, y)
+            yield row
+
+    def count(self, op):
+        return int(np.count_nonzero(self.columns["op"] == op))
+
+    @classmethod
+    def compile(cls, events):
+        """
+        Compile recorded event dicts. Events of unknown types are skipped.
+        """
+        rows = []
+        key_index = {}
+        conditions = []
+        for event in events:
+            etype = event.get("type")
+            time_ns = int(round(event.get("time", 0) * 1e9))
+            if event.get("condition") or event.get("wait_until"):
+                spec = {
+                    name: event[name]
+                    for name in ("condition", "wait_until")
+                    if event.get(name)
+                }
+                rows.append((COND, time_ns, 0, 0, len(conditions), 0))
+                conditions.append(spec)
+            if etype in ("key_press", "key_release"):
+                key = event["key"]
+                index = key_index.setdefault(key, len(key_index))
+                op = KEY_PRESS if etype == "key_press" else KEY_RELEASE
+                rows.append((op, time_ns, 0, 0, index, 0))
+            elif etype == "mouse_click":
+                op = MOUSE_DOWN if event["pressed"] else MOUSE_UP
+                button = parse_button(event["button"])
+                rows.append((op, time_ns, event["x"], event["y"], button, 0))
+            elif etype == "mouse_scroll":
+                rows.append(
+                    (SCROLL, time_ns, event["x"], event["y"], event["dy"], event["dx"])
+                )
+            elif etype == "mouse_move":
+                start = int(event.get("start", False))
+                rows.append((MOVE, time_ns, event["x"], event["y"], start, 0))
+            elif etype == "wait_screen":
+                timeout = int(round(event["timeout"] * 1000))
+                settle = int(round(event["settle"] * 1000))
+                rows.append((WAIT, time_ns, event["x"], event["y"], timeout, settle))
+        columns = {
+            name: np.array([row[i] for row in rows], dtype=dtype)
+            for i, (name, dtype) in enumerate(COLUMNS)
+        }
+        return cls(columns, key_index, conditions)
+
+    @classmethod
+    def from_records(cls, records, key_strings, conditions=None):
+        """
+        Build from a structured array of ROW_DTYPE records.
+        """
+        columns = {
+            name: np.ascontiguousarray(records[name], dtype=dtype)
+            for name, dtype in COLUMNS
+        }
+        return cls(columns, key_strings, conditions)
+
+    def to_events(self):
+        """
+        The macro as JSON-ready event dicts.
+        """
+        events = []
+        spec = None
+        for op, time_ns, x, y, arg, arg2 in self.rows():
+            if op == COND:
+                spec = self.conditions[arg]
+                continue
+            event = {"time": time_ns / 1e9}
+            if spec is not None:
+                event.update(spec)
+                spec = None
+            if op in (KEY_PRESS, KEY_RELEASE):
+                event["type"] = "key_press" if op == KEY_PRESS else "key_release"
+                event["key"] = self.key_strings[arg]
+            elif op in (MOUSE_DOWN, MOUSE_UP):
+                event.update(
+                    type="mouse_click",
+                    x=x,
+                    y=y,
+                    button=f"Button.{BUTTON_NAMES[arg]}",
+                    pressed=op == MOUSE_DOWN,
+                )
+            elif op == SCROLL:
+                event.update(type="mouse_scroll", x=x, y=y, dx=arg2, dy=arg)
+            elif op == MOVE:
+                event.update(type="mouse_move", x=x, y=y, start=bool(arg))
+            elif op == WAIT:
+                event.update(
+                    type="wait_screen", x=x, y=y, timeout=arg / 1000, settle=arg2 / 1000
+                )
+            events.append(event)
+        return events
+
+    # --- Binary format ---
+    # MAGIC, then version, event count, key table length and condition
+    # table length (uint32 each), the size (uint64) and 16-byte hash of the
+    # JSON it was compiled from (zero when unknown), both tables as UTF-8
+    # JSON, then every column in COLUMNS order as little-endian raw arrays.
+    # Version 1 files have no condition table, version 2 no source stamp.
+    def save(self, path, source=None):
+        """
+        Write the compiled file; source is the source_stamp() of the JSON
+        it was compiled from, so load_macro() can tell when it is stale.
+        """
+        keys = json.dumps(self.key_strings).encode("utf-8")
+        conditions = json.dumps(self.conditions).encode("utf-8")
+        size, digest = source or (0, bytes(16))
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(
+                struct.pack(
+                    "<IIIIQ16s",
+                    FORMAT_VERSION,
+                    len(self),
+                    len(keys),
+                    len(conditions),
+                    size,
+                    digest,
+                )
+            )
+            f.write(keys)
+            f.write(conditions)
+            for name, dtype in COLUMNS:
+                f.write(self.columns[name].astype(np.dtype(dtype).newbyteorder("<")))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled macro")
+        offset = len(MAGIC)
+        version, count, keys_size = struct.unpack_from("<III", data, offset)
+        offset += 12
+        conditions_size, source = 0, None
+        if version >= 2:
+            (conditions_size,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+        if version == FORMAT_VERSION:
+            size, digest = struct.unpack_from("<Q16s", data, offset)
+            offset += 24
+            source = (size, digest) if size else None
+        elif version > FORMAT_VERSION or version < 1:
+            raise ValueError(f"Unsupported compiled macro version {version}")
+        key_strings = json.loads(data[offset : offset + keys_size].decode("utf-8"))
+        offset += keys_size
+        conditions = []
+        if conditions_size:
+            end = offset + conditions_size
+            conditions = json.loads(data[offset:end].decode("utf-8"))
+            offset = end
+        columns = {}
+        for name, dtype in COLUMNS:
+            dtype = np.dtype(dtype).newbyteorder("<")
+            columns[name] = np.frombuffer(data, dtype, count, offset)
+            offset += count * dtype.itemsize
+        macro = cls(columns, key_strings, conditions)
+        macro.version = version
+        macro.source = source
+        return macro
+
+
+def source_stamp(data):
+    """
+    (size, 16-byte hash) of a macro's JSON bytes.
+    """
+    return len(data), hashlib.blake2b(data, digest_size=16).digest()
+
+
+def binary_path(json_path):
+    return os.path.splitext(json_path)[0] + BINARY_EXTENSION
+
+
+def load_macro(path):
+    """
+    Load a macro from a JSON or compiled file. For a JSON file the compiled
+    file next to it is used instead when it is in the current format (older
+    formats dropped event conditions) and was compiled from exactly this
+    JSON (same size and hash), and written otherwise. Returns
+    (events, CompiledMacro).
+    """
+    compiled_path = binary_path(path)
+    if path == compiled_path:
+        macro = CompiledMacro.load(compiled_path)
+        return macro.to_events(), macro
+
+    with open(path, "rb") as f:
+        data = f.read()
+    stamp = source_stamp(data)
+    try:
+        macro = CompiledMacro.load(compiled_path)
+        if macro.version == FORMAT_VERSION and macro.source == stamp:
+            return macro.to_events(), macro
+    except (OSError, ValueError):
+        pass
+
+    events = json.loads(data)
+    macro = CompiledMacro.compile(events)
+    try:
+        macro.save(compiled_path, stamp)
+    except OSError:
+        pass  # Read-only folder, compile again next time
+    return events, macro
+
+
+def save_macro(path, macro):
+    """
+    Save a macro (event dicts or a CompiledMacro) as JSON plus its compiled
+    form. Returns the CompiledMacro.
+    """
+    if isinstance(macro, CompiledMacro):
+        events = macro.to_events()
+    else:
+        events, macro = macro, CompiledMacro.compile(macro)
+    data = json.dumps(events, indent=2).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+    macro.save(binary_path(path), source_stamp(data))
+    return macro
@@ -0,0 +1,514 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+
+from modules.convert import BufferPool
+
+
+class Match(namedtuple("Match", ["score", "location", "size"])):
+    """
+    A template match: TM_CCOEFF_NORMED score, top-left (x, y) location in
+    the matched image and template (width, height).
+    """
+
+    __slots__ = ()
+
+    @property
+    def center(self):
+        return (
+            self.location[0] + self.size[0] // 2,
+            self.location[1] + self.size[1] // 2,
+        )
+
+
+class CompiledTemplate:
+    """
+    A template plus everything precomputed for matching it: the BGR image
+    used for full-resolution scoring, a gray image pyramid for the coarse
+    search and the template's zero-mean norm (zero means a flat template
+    that TM_CCOEFF_NORMED cannot score). Level 0 is full size, each further
+    level halves it while the template stays at least min_size pixels on
+    its short side. Pass pyramid/norm to reuse precomputed data, e.g. from
+    a bundle.
+    """
+
+    def __init__(self, name, image, max_levels=3, min_size=16, pyramid=None, norm=None):
+        self.name = name
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        if pyramid is None:
+            pyramid = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)]
+            while (
+                len(pyramid) <= max_levels
+                and min(pyramid[-1].shape[:2]) // 2 >= min_size
+            ):
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+        self.pyramid = list(pyramid)
+        if norm is None:
+            _, stddev = cv2.meanStdDev(image)
+            norm = float(
+                np.sqrt((stddev.ravel() ** 2).sum() * self.width * self.height)
+            )
+        self.norm = norm
+
+    @property
+    def levels(self):
+        return len(self.pyramid) - 1
+
+
+def _suppress(result, x, y, width, height):
+    # Blank out a template-sized neighbourhood around a peak
+    x1, y1 = max(0, x - width // 2), max(0, y - height // 2)
+    result[y1 : y + height // 2 + 1, x1 : x + width // 2 + 1] = -1.0
+
+
+_NO_PEAKS = (np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0, np.float32))
+
+
+def non_max_suppression(xs, ys, scores, template, overlap=0.3, limit=None):
+    """
+    Greedy NMS over template-sized boxes at (xs, ys): keep the best peak,
+    drop every remaining peak overlapping it by more than `overlap` (IoU)
+    in one vectorized step, repeat. Returns a list of Match, best first.
+    """
+    order = np.argsort(-scores, kind="stable")
+    width, height = template.width, template.height
+    area = width * height
+    keep = []
+    while order.size and (limit is None or len(keep) < limit):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        inter_w = np.clip(width - np.abs(xs[rest] - xs[best]), 0, None)
+        inter_h = np.clip(height - np.abs(ys[rest] - ys[best]), 0, None)
+        inter = inter_w * inter_h
+        order = rest[inter <= overlap * (2 * area - inter)]
+    return [
+        Match(float(scores[i]), (int(xs[i]), int(ys[i])), (width, height)) for i in keep
+    ]
+
+
+class TemplateMatcher:
+    """
+    Coarse-to-fine TM_CCOEFF_NORMED matcher. The template is first matched
+    in gray at the coarsest pyramid level, then the best few candidates are
+    re-scored at full resolution in BGR inside a small window. Returned
+    scores are full-resolution scores, so the usual 0.8 threshold applies
+    unchanged. Results just below the threshold are confirmed with a full
+    search, so a weak coarse candidate does not turn a hit into a miss.
+    Templates too small for a pyramid are matched directly.
+    """
+
+    def __init__(
+        self, pool=None, candidates=5, pad=2, threshold=0.8, band=0.25, workers=None
+    ):
+        self.pool = pool or BufferPool()
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self.candidates = candidates  # Coarse peaks re-scored at full size
+        self.pad = pad  # Extra full-resolution pixels around each candidate
+        self.threshold = threshold
+        self.band = band  # Scores this far below threshold get a full search
+        self.track_padding = 32  # Pixels searched around the last known location
+        self._last_hits = {}  # (context, template name) -> (x, y)
+        self._stats = {}  # Template name -> [window hits, window misses, full]
+        self._stats_lock = threading.Lock()
+        self._pyramid_key = None
+        self._pyramid = []
+        self._lock = threading.Lock()
+        # Exhaustive searches of a whole frame go through this when set
+        # (a TiledDetector's match_full, to split them across threads)
+        self.full_search = None
+
+    def _match_into(self, image, template):
+        result = self.pool.acquire(
+            (
+                image.shape[0] - template.shape[0] + 1,
+                image.shape[1] - template.shape[1] + 1,
+            ),
+            np.float32,
+        )
+        return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED, result=result)
+
+    def frame_pyramid(self, image, levels, frame_key=None):
+        """
+        Gray pyramid of a frame with at least `levels` levels above full
+        size. The pyramid of the last frame_key is kept, so several
+        templates matched against one frame share it.
+        """
+        with self._lock:
+            if frame_key is None or frame_key != self._pyramid_key:
+                self._pyramid_key = frame_key
+                gray = self.pool.acquire(image.shape[:2])
+                self._pyramid = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)]
+            pyramid = self._pyramid
+            while len(pyramid) <= levels:
+                prev = pyramid[-1]
+                shape = ((prev.shape[0] + 1) // 2, (prev.shape[1] + 1) // 2)
+                pyramid.append(cv2.pyrDown(prev, dst=self.pool.acquire(shape)))
+            return pyramid[: levels + 1]
+
+    def match(self, image, template, frame_key=None):
+        """
+        Best match of a CompiledTemplate in a BGR image.
+        Returns (score, (x, y)) with the top-left corner of the match, or
+        None when the template does not fit in the image.
+        """
+        if image.shape[0] < template.height or image.shape[1] < template.width:
+            return None
+        level = template.levels
+        if level == 0:
+            return self.search_full(image, template)
+
+        pyramid = self.frame_pyramid(image, level, frame_key)
+        coarse_frame, coarse_template = pyramid[level], template.pyramid[level]
+        if (
+            coarse_frame.shape[0] < coarse_template.shape[0]
+            or coarse_frame.shape[1] < coarse_template.shape[1]
+        ):
+            return self.search_full(image, template)
+        coarse = self._match_into(coarse_frame, coarse_template)
+
+        scale = 1 << level
+        margin = scale + self.pad
+        best = None
+        for _ in range(self.candidates):
+            _, coarse_val, _, (cx, cy) = cv2.minMaxLoc(coarse)
+            if coarse_val < -0.5:
+                break  # Everything left was suppressed
+            _suppress(coarse, cx, cy, *coarse_template.shape[1::-1])
+
+            # Re-score the candidate at full resolution in a small window
+            x1 = max(0, cx * scale - margin)
+            y1 = max(0, cy * scale - margin)
+            x2 = min(image.shape[1], cx * scale + margin + template.width)
+            y2 = min(image.shape[0], cy * scale + margin + template.height)
+            window = image[y1:y2, x1:x2]
+            if window.shape[0] < template.height or window.shape[1] < template.width:
+                continue
+            _, max_val, _, (fx, fy) = cv2.minMaxLoc(
+                self._match_into(window, template.image)
+            )
+            if best is None or max_val > best[0]:
+                best = (max_val, (x1 + fx, y1 + fy))
+
+        if best is None or self.threshold - self.band <= best[0] <= self.threshold:
+            return self.search_full(image, template)
+        return best
+
+    # --- Temporal tracking ---
+    def _count(self, name, index):
+        with self._stats_lock:
+            self._stats.setdefault(name, [0, 0, 0])[index] += 1
+
+    def tracking_stats(self):
+        """
+        Per template: hits (found in its search window), misses (not found
+        there) and full (full searches, after a miss or with no known
+        location).
+        """
+        with self._stats_lock:
+            return {
+                name: {"hits": hits, "misses": misses, "full": full}
+                for name, (hits, misses, full) in self._stats.items()
+            }
+
+    def remember(self, template, context, result):
+        """
+        Store a full-search result as the template's last known location.
+        """
+        key = (context, template.name)
+        if result is not None and result[0] > self.threshold:
+            self._last_hits[key] = result[1]
+        else:
+            self._last_hits.pop(key, None)
+
+    def forget(self, template_name=None):
+        for key in list(self._last_hits):
+            if template_name is None or key[1] == template_name:
+                self._last_hits.pop(key, None)
+
+    def search_window(self, template, context, bounds):
+        """
+        Padded (x, y, width, height) around the last known location of a
+        template, clipped to bounds=(width, height), or None if unknown.
+        """
+        last = self._last_hits.get((context, template.name))
+        if last is None:
+            return None
+        pad = self.track_padding
+        x1, y1 = max(0, last[0] - pad), max(0, last[1] - pad)
+        x2 = min(bounds[0], last[0] + template.width + pad)
+        y2 = min(bounds[1], last[1] + template.height + pad)
+        if x2 - x1 < template.width or y2 - y1 < template.height:
+            return None
+        return x1, y1, x2 - x1, y2 - y1
+
+    def match_window(self, image, template, context, offset=(0, 0)):
+        """
+        Match inside a search window image whose top-left sits at offset.
+        Returns (score, (x, y)) in full-image coordinates on a hit above the
+        threshold, or None on a miss (which forgets the location).
+        """
+        result = self.match_full(image, template)
+        key = (context, template.name)
+        if result is None or result[0] <= self.threshold:
+            self._count(template.name, 1)
+            self._last_hits.pop(key, None)
+            return None
+        self._count(template.name, 0)
+        location = (offset[0] + result[1][0], offset[1] + result[1][1])
+        self._last_hits[key] = location
+        return result[0], location
+
+    def match_tracked(self, image, template, frame_key=None, context=None):
+        """
+        Like match(), but search around the last known location first.
+        """
+        rect = self.search_window(template, context, image.shape[1::-1])
+        if rect is not None:
+            x, y, width, height = rect
+            window = image[y : y + height, x : x + width]
+            result = self.match_window(window, template, context, (x, y))
+            if result is not None:
+                return result
+        self._count(template.name, 2)
+        result = self.match(image, template, frame_key)
+        self.remember(template, context, result)
+        return result
+
+    def match_many(self, image, templates, frame_key=None, context=None):
+        """
+        Match several CompiledTemplates against one image in parallel
+        (cv2.matchTemplate releases the GIL), each tracked as in
+        match_tracked(). The frame pyramid is built once up front and
+        shared by all templates. Returns a dict of
+        template name -> Match, leaving out templates that do not fit.
+        """
+        if not templates:
+            return {}
+        if frame_key is None:
+            frame_key = object()  # Still share one pyramid within this call
+        # Build the shared pyramid unless every template has a search window
+        bounds = image.shape[1::-1]
+        levels = max(template.levels for template in templates)
+        if levels and any(
+            self.search_window(t, context, bounds) is None for t in templates
+        ):
+            self.frame_pyramid(image, levels, frame_key)
+
+        def run(template):
+            return template, self.match_tracked(image, template, frame_key, context)
+
+        if len(templates) == 1 or self.workers == 1:
+            results = map(run, templates)
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="matcher"
+                )
+            results = self._executor.map(run, templates)
+
+        matches = {}
+        for template, result in results:
+            if result is not None:
+                score, location = result
+                matches[template.name] = Match(
+                    score, location, (template.width, template.height)
+                )
+        return matches
+
+    def find_all(self, image, template, threshold=None, overlap=0.3, limit=None):
+        """
+        Every match of a CompiledTemplate in a BGR image scoring above
+        threshold (the matcher's threshold by default), best first.
+        Peaks are the local maxima of the full-resolution result map; peaks
+        whose boxes overlap a better one by more than `overlap` (IoU) are
+        suppressed. Returns a list of Match, at most `limit` long.
+        """
+        if threshold is None:
+            threshold = self.threshold
+        xs, ys, scores = self.peaks(image, template, threshold)
+        return non_max_suppression(xs, ys, scores, template, overlap, limit)
+
+    def peaks(self, image, template, threshold):
+        """
+        Local maxima of the full-resolution result map scoring above
+        threshold, as (xs, ys, scores) arrays, before suppression.
+        """
+        if image.shape[0] < template.height or image.shape[1] < template.width:
+            return _NO_PEAKS
+        result = self._match_into(image, template.image)
+        if result.max() <= threshold:
+            return _NO_PEAKS
+
+        # Local maxima in a neighbourhood a quarter of the template's size
+        kernel = cv2.getStructuringElement(
+            cv2.MORPH_RECT,
+            (max(3, template.width // 4 | 1), max(3, template.height // 4 | 1)),
+        )
+        peaks = self.pool.acquire(result.shape, np.float32)
+        cv2.dilate(result, kernel, dst=peaks)
+        is_peak = self.pool.acquire(result.shape, bool)
+        np.equal(result, peaks, out=is_peak)
+        np.logical_and(is_peak, result > threshold, out=is_peak)
+        ys, xs = np.nonzero(is_peak)
+        return xs, ys, result[ys, xs]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def search_full(self, image, template):
+        """
+        match_full() of a whole frame, through full_search when it is set.
+        """
+        if self.full_search is not None:
+            return self.full_search(image, template)
+        return self.match_full(image, template)
+
+    def match_full(self, image, template):
+        """
+        Exhaustive full-resolution match, the reference the pyramid search
+        approximates.
+        """
+        if image.shape[0] < template.height or image.shape[1] < template.width:
+            return None
+        _, max_val, _, max_loc = cv2.minMaxLoc(self._match_into(image, template.image))
+        return max_val, max_loc
+
+
+class TiledDetector:
+    """
+    Detection executor for large windows. The search area is split into
+    tiles of roughly tile_size pixels, each extended by the template size
+    minus one so every placement of the template falls in exactly one tile.
+    All (tile, template) pairs run on a thread pool of `workers` threads
+    (cv2.matchTemplate releases the GIL) and the per-tile results are
+    merged. Results are exact full-resolution matches.
+    """
+
+    def __init__(self, matcher, workers=None, tile_size=512):
+        self.matcher = matcher
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        self._executor = None
+
+    def tiles(self, shape, template):
+        """
+        (x, y, width, height) tiles covering every placement of template in
+        an image of the given shape, or [] if the template does not fit.
+        """
+        height, width = shape[:2]
+        spots_x = width - template.width + 1  # Placements along each axis
+        spots_y = height - template.height + 1
+        if spots_x <= 0 or spots_y <= 0:
+            return []
+        # At least a template's worth of placements per tile, so the
+        # overlap stays small compared to the work each tile does
+        step_x = max(self.tile_size, template.width)
+        step_y = max(self.tile_size, template.height)
+        return [
+            (
+                x,
+                y,
+                min(step_x, spots_x - x) + template.width - 1,
+                min(step_y, spots_y - y) + template.height - 1,
+            )
+            for y in range(0, spots_y, step_y)
+            for x in range(0, spots_x, step_x)
+        ]
+
+    def _run(self, jobs):
+        if len(jobs) <= 1 or self.workers == 1:
+            return [job() for job in jobs]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="detector"
+            )
+        return list(self._executor.map(lambda job: job(), jobs))
+
+    def match_many(self, image, templates):
+        """
+        Best match of each CompiledTemplate in a BGR image. Returns a dict
+        of template name -> Match, leaving out templates that do not fit.
+        """
+        jobs, owners = [], []
+        for template in templates:
+            for x, y, w, h in self.tiles(image.shape, template):
+                tile = image[y : y + h, x : x + w]
+                jobs.append(partial(self.matcher.match_full, tile, template))
+                owners.append((template, x, y))
+
+        matches = {}
+        for (template, x, y), result in zip(owners, self._run(jobs)):
+            if result is None:
+                continue
+            score, (tx, ty) = result
+            best = matches.get(template.name)
+            if best is None or score > best.score:
+                matches[template.name] = Match(
+                    score, (x + tx, y + ty), (template.width, template.height)
+                )
+        return matches
+
+    def match_full(self, image, template):
+        """
+        Tiled TemplateMatcher.match_full(): the best placement over all
+        tiles, as (score, (x, y)) or None. Small images take one tile and
+        run directly, as does everything with a single worker.
+        """
+        tiles = self.tiles(image.shape, template)
+        if len(tiles) <= 1 or self.workers == 1:
+            return self.matcher.match_full(image, template)  # Tiling only adds overlap
+        jobs = [
+            partial(self.matcher.match_full, image[y : y + h, x : x + w], template)
+            for x, y, w, h in tiles
+        ]
+        best = None
+        for (x, y, _, _), result in zip(tiles, self._run(jobs)):
+            if result is not None and (best is None or result[0] > best[0]):
+                best = (result[0], (x + result[1][0], y + result[1][1]))
+        return best
+
+    def find_all(self, image, template, threshold=None, overlap=0.3, limit=None):
+        """
+        Tiled TemplateMatcher.find_all(): peaks are collected per tile in
+        parallel, then suppressed together across tile borders.
+        """
+        if threshold is None:
+            threshold = self.matcher.threshold
+        tiles = self.tiles(image.shape, template)
+        jobs = [
+            partial(
+                self.matcher.peaks, image[y : y + h, x : x + w], template, threshold
+            )
+            for x, y, w, h in tiles
+        ]
+        xs, ys, scores = [], [], []
+        for (x, y, _, _), (tile_xs, tile_ys, tile_scores) in zip(
+            tiles, self._run(jobs)
+        ):
+            xs.append(tile_xs + x)
+            ys.append(tile_ys + y)
+            scores.append(tile_scores)
+        if not xs:
+            return []
+        return non_max_suppression(
+            np.concatenate(xs),
+            np.concatenate(ys),
+            np.concatenate(scores),
+            template,
+            overlap,
+            limit,
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
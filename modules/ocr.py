@@ -0,0 +1,253 @@
+import bisect
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+def create_easyocr_reader(languages=("en",)):
+    """
+    Build an EasyOCR reader. easyocr (and torch) are imported here rather
+    than at startup, since the import alone takes seconds.
+    """
+    import easyocr
+
+    return easyocr.Reader(list(languages))
+
+
+class OCRReader:
+    """
+    An OCR reader built in the background. start() builds it on a worker
+    thread; `future` resolves to the reader (or its build error), and
+    get()/readtext() wait for it. With defer=True nothing is built until
+    the first get(), so users who never use OCR never pay for the models.
+    """
+
+    def __init__(self, factory=create_easyocr_reader, log_message=None, defer=False):
+        self.factory = factory
+        self.log_message = log_message
+        self.defer = defer
+        self.future = Future()
+        self.started_at = None
+        self.ready_after = None  # Seconds from start() to a usable reader
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Begin building the reader on a background thread (once).
+        """
+        with self._lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.perf_counter()
+        threading.Thread(target=self._build, name="ocr-init", daemon=True).start()
+
+    def _build(self):
+        try:
+            reader = self.factory()
+        except Exception as e:
+            self.future.set_exception(e)
+            if self.log_message:
+                self.log_message(f"OCR reader failed to load: {str(e)}", "ERROR")
+            return
+        self.ready_after = time.perf_counter() - self.started_at
+        self.future.set_result(reader)
+        if self.log_message:
+            self.log_message(f"OCR ready after {self.ready_after:.2f}s.")
+
+    def ready(self):
+        return self.future.done() and self.future.exception() is None
+
+    def get(self, timeout=None):
+        """
+        The reader, building it first if it was deferred. Raises
+        concurrent.futures.TimeoutError if it is not ready within timeout
+        seconds, or the error that stopped it from loading.
+        """
+        self.start()
+        return self.future.result(timeout)
+
+    def readtext(self, image, **kwargs):
+        return self.get().readtext(image, **kwargs)
+
+    def read_batch(self, crops, gap=8):
+        """
+        Read many single-line gray crops with one recognition call.
+        The crops are stacked into one image with `gap` rows between them
+        and each one is passed as a known text box, so EasyOCR skips text
+        detection and recognizes all of them as one batch. Returns the text
+        of each crop, in order.
+        """
+        if not crops:
+            return []
+        width = max(crop.shape[1] for crop in crops)
+        height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) - 1)
+        mosaic = np.zeros((height, width), dtype=np.uint8)
+        boxes, tops = [], []
+        y = 0
+        for crop in crops:
+            h, w = crop.shape[:2]
+            mosaic[y : y + h, :w] = crop
+            boxes.append([0, w, y, y + h])
+            tops.append(y)
+            y += h + gap
+
+        results = self.get().recognize(
+            mosaic,
+            horizontal_list=boxes,
+            free_list=[],
+            batch_size=len(crops),
+            detail=1,
+        )
+        texts = [[] for _ in crops]
+        for box, text, _ in results:
+            # Results come back with mosaic coordinates, map them to crops
+            index = bisect.bisect_right(tops, min(point[1] for point in box)) - 1
+            texts[max(0, index)].append(text)
+        return [" ".join(parts) for parts in texts]
+
+
+def content_hash(image):
+    """
+    Fast exact hash of an image's pixels, shape and dtype (xxh3 when
+    xxhash is installed, blake2b otherwise).
+    """
+    image = np.ascontiguousarray(image)
+    header = f"{image.shape}{image.dtype.str}".encode()
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(header + memoryview(image).cast("B"))
+    digest = hashlib.blake2b(header, digest_size=8)
+    digest.update(memoryview(image).cast("B"))
+    return int.from_bytes(digest.digest(), "little")
+
+
+def perceptual_hash(image):
+    """
+    64-bit difference hash: the image shrunk to 9x8 gray, one bit per
+    horizontally adjacent pixel pair. Similar images differ in few bits.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class OCRCache:
+    """
+    LRU cache of OCR results keyed by a hash of the (preprocessed) crop
+    handed to the engine, so re-reading identical pixels is free.
+
+    By default keys are exact content hashes. With perceptual=True keys
+    are difference hashes and any entry of the same engine and crop size
+    within `tolerance` differing bits counts as a hit, which absorbs
+    compression noise and flicker (at the risk of missing a one-digit
+    change in a tiny crop; keep the tolerance low for counters).
+
+    At most max_entries results are kept; the least recently used one is
+    evicted first. Results are small (text and boxes), so the entry count
+    bounds memory.
+    """
+
+    def __init__(self, max_entries=512, perceptual=False, tolerance=0):
+        self.max_entries = max_entries
+        self.perceptual = perceptual
+        self.tolerance = tolerance
+        self._entries = OrderedDict()  # (engine, shape, hash) -> result
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, engine, image):
+        if self.perceptual:
+            return engine, image.shape, perceptual_hash(image)
+        return engine, image.shape, content_hash(image)
+
+    def _find(self, key):
+        if key in self._entries:
+            return key
+        if not self.perceptual or not self.tolerance:
+            return None
+        engine, shape, value = key
+        for other in reversed(self._entries):
+            if (
+                other[:2] == (engine, shape)
+                and bin(other[2] ^ value).count("1") <= self.tolerance
+            ):
+                return other
+        return None
+
+    def lookup(self, engine, image, compute):
+        """
+        Cached result of compute() for this engine and image, calling it
+        (outside the lock) on a miss.
+        """
+        key = self._key(engine, image)
+        with self._lock:
+            found = self._find(key)
+            if found is not None:
+                self._entries.move_to_end(found)
+                self.hits += 1
+                return self._entries[found]
+            self.misses += 1
+        result = compute()
+        self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def lookup_many(self, engine, images, compute_many):
+        """
+        Like lookup() for a list of images: compute_many(missed_images) is
+        called once with every image not in the cache and must return
+        their results in order.
+        """
+        keys = [self._key(engine, image) for image in images]
+        results = [None] * len(images)
+        missed = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                found = self._find(key)
+                if found is None:
+                    missed.append(i)
+                    continue
+                self._entries.move_to_end(found)
+                results[i] = self._entries[found]
+            self.hits += len(images) - len(missed)
+            self.misses += len(missed)
+        if missed:
+            computed = compute_many([images[i] for i in missed])
+            for i, result in zip(missed, computed):
+                results[i] = result
+                self._store(keys[i], result)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,348 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+DIGITS = "0123456789"
+
+
+def pattern_charset(pattern):
+    """
+    Characters a regex can match, if it only uses literal characters, \\d,
+    character classes and grouping/repetition; None if it can match
+    arbitrary text (".", \\w, \\s, negated classes...).
+    """
+    chars = set()
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 1
+            if i >= len(pattern):
+                return None
+            escaped = pattern[i]
+            if escaped == "d":
+                chars.update(DIGITS)
+            elif escaped.isalnum():
+                return None  # \w, \s, \b, backreferences...
+            else:
+                chars.add(escaped)
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0 or pattern[i + 1] == "^":
+                return None
+            body = pattern[i + 1 : end].replace("\\d", DIGITS)
+            if "\\" in body:
+                return None
+            j = 0
+            while j < len(body):
+                if j + 2 < len(body) and body[j + 1] == "-":
+                    chars.update(
+                        chr(o) for o in range(ord(body[j]), ord(body[j + 2]) + 1)
+                    )
+                    j += 3
+                else:
+                    chars.add(body[j])
+                    j += 1
+            i = end
+        elif c == "{":
+            end = pattern.find("}", i)
+            if end < 0:
+                return None
+            i = end
+        elif c == ".":
+            return None
+        elif c not in "()?*+|^$":
+            chars.add(c)
+        i += 1
+    chars.discard(" ")  # Spaces are never read, only implied by gaps
+    return chars
+
+
+class OCREngine:
+    """
+    An OCR backend. `cost` orders engines from cheapest to most expensive,
+    `charset` is the set of characters the engine can read (None for any
+    text). read() returns the text in an image, or None when the engine
+    cannot read it confidently so the next engine should try.
+    """
+
+    name = "engine"
+    cost = 0
+    charset = None
+
+    def available(self):
+        """
+        False if the engine is not installed or not configured.
+        """
+        return True
+
+    def ready(self):
+        """
+        False while the engine is still loading.
+        """
+        return self.available()
+
+    def can_read(self, chars):
+        """
+        True if the engine can read every character in chars (None for
+        arbitrary text).
+        """
+        if self.charset is None:
+            return True
+        return chars is not None and chars <= self.charset
+
+    def read(self, image):
+        raise NotImplementedError
+
+    def read_batch(self, images):
+        return [self.read(image) for image in images]
+
+
+class EasyOCREngine(OCREngine):
+    """
+    General text through EasyOCR; batches go through a single
+    recognition call.
+    """
+
+    name = "easyocr"
+    cost = 100
+
+    def __init__(self, reader):
+        self.reader = reader  # OCRReader
+
+    def ready(self):
+        self.reader.start()
+        return self.reader.ready()
+
+    def read(self, image):
+        return " ".join(result[1] for result in self.reader.readtext(image))
+
+    def read_batch(self, images):
+        return self.reader.read_batch(images)
+
+
+class TesseractEngine(OCREngine):
+    """
+    General text through the long-lived workers of a TesseractPool.
+    """
+
+    name = "tesseract"
+    cost = 20
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def available(self):
+        return self.pool.available()
+
+    def read(self, image):
+        return self.pool.read(image)
+
+    def read_batch(self, images):
+        return self.pool.read_batch(images)
+
+
+class GlyphEngine(OCREngine):
+    """
+    Reads single lines of a fixed game font (counters such as "3/5" or
+    "12,345") by comparing each character against glyph templates learned
+    from a few labelled sample crops. A crop is binarized, split into
+    characters at empty columns and every character is scaled to a fixed
+    size, so all characters are scored against all glyphs with one
+    matrix product. Any character scoring below min_score makes the read
+    return None.
+    """
+
+    name = "glyphs"
+    cost = 1
+    size = (16, 16)  # Normalized glyph (width, height)
+    shape_weight = 0.5  # Weight of the shape features against the pixels
+
+    def __init__(self, glyphs=None, min_score=0.75):
+        self.min_score = min_score
+        self.samples = 0  # Sample crops trained on
+        self.glyphs = {}
+        self._labels = []
+        self._matrix = np.empty((0, self.size[0] * self.size[1] + 3), np.float32)
+        if glyphs:
+            self.set_glyphs(glyphs)
+
+    @property
+    def charset(self):
+        return set(self.glyphs)
+
+    def set_glyphs(self, glyphs):
+        self.glyphs = dict(glyphs)
+        self._labels = list(self.glyphs)
+        self._matrix = np.stack([self.glyphs[c] for c in self._labels])
+
+    def _binarize(self, image):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, binary = cv2.threshold(image, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if binary.mean() > 0.5:
+            binary = 1 - binary  # Ink is whatever there is less of
+        return binary
+
+    def segment(self, image):
+        """
+        Unit-length feature vectors of each character in a line, left to
+        right, the gap before each one and the typical character height in
+        pixels. Each character is cropped to its own box and scaled to
+        `size`; its aspect ratio, height and vertical position relative to
+        the other characters are appended, which keeps "," apart from "/"
+        and "1".
+        """
+        binary = self._binarize(image)
+        columns = binary.any(axis=0).astype(np.int8)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], columns, [0]))))
+        starts, ends = edges[::2], edges[1::2]
+        if starts.size == 0:
+            return [], [], 0
+
+        boxes = []
+        for start, end in zip(starts, ends):
+            rows = np.flatnonzero(binary[:, start:end].any(axis=1))
+            boxes.append((start, end, rows[0], rows[-1] + 1))
+        heights = np.array([bottom - top for _, _, top, bottom in boxes])
+        centers = np.array([(top + bottom) / 2 for _, _, top, bottom in boxes])
+        ref_height = float(np.median(heights))
+        ref_center = float(np.median(centers))
+
+        vectors, gaps = [], []
+        previous_end = starts[0]
+        for (start, end, top, bottom), center in zip(boxes, centers):
+            glyph = binary[top:bottom, start:end].astype(np.float32)
+            pixels = cv2.resize(glyph, self.size, interpolation=cv2.INTER_AREA)
+            pixels = pixels.ravel()
+            pixels -= pixels.mean()
+            pixels /= np.linalg.norm(pixels) or 1.0
+            shape = np.array(
+                [
+                    (end - start) / (bottom - top),
+                    (bottom - top) / ref_height,
+                    (center - ref_center) / ref_height,
+                ],
+                np.float32,
+            )
+            vector = np.concatenate((pixels, self.shape_weight * shape))
+            vectors.append(vector / np.linalg.norm(vector))
+            gaps.append(start - previous_end)
+            previous_end = end
+        return vectors, gaps, ref_height
+
+    def read(self, image):
+        if not self._labels:
+            return None
+        vectors, gaps, line_height = self.segment(image)
+        if not vectors:
+            return ""
+        scores = np.stack(vectors) @ self._matrix.T
+        best = scores.argmax(axis=1)
+        if scores[np.arange(len(best)), best].min() < self.min_score:
+            return None
+        text = []
+        for index, gap in zip(best, gaps):
+            # A gap wider than half a character height separates words
+            if text and gap > line_height / 2:
+                text.append(" ")
+            text.append(self._labels[index])
+        return "".join(text)
+
+    def train(self, samples):
+        """
+        Learn glyphs from (image, text) pairs. Spaces in text are ignored;
+        samples whose character count does not match the segmentation are
+        skipped. Returns the number of samples used.
+        """
+        learned = {}
+        used = 0
+        for image, text in samples:
+            chars = text.replace(" ", "")
+            vectors, _, _ = self.segment(image)
+            if len(vectors) != len(chars):
+                continue
+            used += 1
+            for char, vector in zip(chars, vectors):
+                learned.setdefault(char, []).append(vector)
+        self.samples += used
+        glyphs = dict(self.glyphs)
+        for char, vectors in learned.items():
+            mean = np.mean(vectors, axis=0)
+            glyphs[char] = mean / (np.linalg.norm(mean) or 1.0)
+        if glyphs:
+            self.set_glyphs(glyphs)
+        return used
+
+    @classmethod
+    def from_folder(cls, folder, **kwargs):
+        """
+        Train on the sample crops listed in <folder>/samples.json, a JSON
+        object mapping image file names to the text they show.
+        """
+        with open(os.path.join(folder, "samples.json"), "r") as f:
+            labels = json.load(f)
+        samples = []
+        for file, text in labels.items():
+            image = cv2.imread(os.path.join(folder, file), cv2.IMREAD_GRAYSCALE)
+            if image is not None:
+                samples.append((image, text))
+        engine = cls(**kwargs)
+        engine.train(samples)
+        return engine
+
+
+class OCRRouter:
+    """
+    Picks the cheapest ready engine able to answer each request and falls
+    back to the next one for images it cannot read. Results are cached per
+    engine in an OCRCache.
+    """
+
+    def __init__(self, engines, cache):
+        self.engines = sorted(engines, key=lambda engine: engine.cost)
+        self.cache = cache
+
+    def add(self, engine):
+        self.engines = [e for e in self.engines if e.name != engine.name]
+        self.engines.append(engine)
+        self.engines.sort(key=lambda e: e.cost)
+
+    def candidates(self, pattern=None, charset=None, wait=True):
+        """
+        Available engines able to read `charset` (or whatever `pattern`
+        can match), cheapest first. With wait=False engines that are still
+        loading are left out.
+        """
+        chars = set(charset) if charset is not None else None
+        if pattern is not None:
+            chars = pattern_charset(pattern)
+        return [
+            engine
+            for engine in self.engines
+            if engine.can_read(chars)
+            and engine.available()
+            and (wait or engine.ready())
+        ]
+
+    def read_batch(self, images, pattern=None, charset=None, wait=True):
+        """
+        Text of every image (None where no engine could read it).
+        """
+        texts = [None] * len(images)
+        pending = list(range(len(images)))
+        for engine in self.candidates(pattern, charset, wait):
+            if not pending:
+                break
+            results = self.cache.lookup_many(
+                engine.name, [images[i] for i in pending], engine.read_batch
+            )
+            for i, text in zip(pending, results):
+                texts[i] = text
+            pending = [i for i in pending if texts[i] is None]
+        return texts
+
+    def read(self, image, pattern=None, charset=None, wait=True):
+        return self.read_batch([image], pattern, charset, wait)[0]
@@ -0,0 +1,274 @@
+"""
+Offline macro optimizer: rewrites a compiled macro so it replays faster
+without changing what it does.
+
+Usage:
+    python -m modules.optimizer macros/farm.json [--max-gap 1.0] [--wait-gap 1.5]
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from modules.macro import (
+    COND,
+    KEY_PRESS,
+    KEY_RELEASE,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    MOVE,
+    ROW_DTYPE,
+    SCROLL,
+    WAIT,
+    CompiledMacro,
+    load_macro,
+    save_macro,
+)
+
+SECOND = 1_000_000_000
+MAX_SPEED = 3.0  # Top of the playback speed slider
+
+
+def drop_noops(rows, drop_key_repeats=False):
+    """
+    Remove events that change nothing: presses of a button that is already
+    down, releases of keys or buttons that are not down, empty scrolls and
+    moves to where the cursor already is (except the first move of a
+    stroke). Repeated presses of a held key are keyboard auto-repeat, which
+    the target does act on (text fields, movement), so they are only
+    dropped with drop_key_repeats. Events with conditions are always kept.
+    """
+    keys, buttons = set(), set()
+    position = None
+    out = []
+    for row in rows:
+        op, _, x, y, arg, arg2 = row
+        noop = False
+        if op == KEY_PRESS:
+            noop = drop_key_repeats and arg in keys
+            keys.add(arg)
+        elif op == KEY_RELEASE:
+            noop = arg not in keys
+            keys.discard(arg)
+        elif op == MOUSE_DOWN:
+            noop = arg in buttons
+            buttons.add(arg)
+            position = (x, y)
+        elif op == MOUSE_UP:
+            noop = arg not in buttons
+            buttons.discard(arg)
+            position = (x, y)
+        elif op == SCROLL:
+            noop = not arg and not arg2
+        elif op == MOVE:
+            # A stroke's first point stops playback interpolating from the
+            # previous position across the idle gap, so it is kept
+            noop = (x, y) == position and arg != 1
+            position = (x, y)
+        if noop and not (out and out[-1][0] == COND):
+            continue
+        out.append(row)
+    return out
+
+
+def merge_scrolls(rows, window_ns):
+    """
+    Merge runs of consecutive scrolls less than window_ns apart into one
+    scroll of the summed distance, sent at the time of the first.
+    Scrolls with conditions are not merged.
+    """
+    out = []
+    for row in rows:
+        guarded = len(out) >= 2 and out[-2][0] == COND
+        if row[0] == SCROLL and out and out[-1][0] == SCROLL and not guarded:
+            last = out[-1]
+            if row[1] - last[1] <= window_ns:
+                merged = last[:4] + (last[4] + row[4], last[5] + row[5])
+                out[-1] = merged
+                continue
+        out.append(row)
+    # Scrolls that cancelled out are no-ops
+    return [row for row in out if row[0] != SCROLL or row[4] or row[5]]
+
+
+def lead_ins(rows):
+    """
+    Map the index of the row that starts the approach to each click to the
+    index of its MOUSE_DOWN. The approach is the mouse stroke leading into
+    the click (back to its start-flagged first move) and any condition on
+    the click; without one it is the click itself.
+    """
+    out = {}
+    for i, row in enumerate(rows):
+        if row[0] != MOUSE_DOWN:
+            continue
+        start = i
+        while start > 0 and rows[start - 1][0] in (MOVE, COND):
+            start -= 1
+            if rows[start][0] == MOVE and rows[start][4] == 1:
+                break  # First point of the stroke, the cursor rested before it
+        out[start] = i
+    return out
+
+
+def retime(rows, max_gap_ns, wait_gap_ns, settle_ns, lead_ns):
+    """
+    Shorten idle gaps while no key or button is held. A gap longer than
+    wait_gap_ns before the approach to a click (the mouse stroke leading
+    into it, or the click itself) is treated as waiting for the screen: it
+    becomes a WAIT event (lead_ns after the previous event) that ends once
+    the screen around the click has changed and then been still for
+    settle_ns, or after the rest of the original gap. Other gaps are capped
+    at max_gap_ns. Returns the rows and the counts of (capped gaps, waits).
+    """
+    out = []
+    held = set()
+    shift = 0
+    previous = None
+    capped = waits = 0
+    clicks = lead_ins(rows)
+    for i, row in enumerate(rows):
+        op, time_ns = row[0], row[1]
+        if previous is not None and not held:
+            gap = time_ns - previous
+            if i in clicks and gap > wait_gap_ns:
+                click = rows[clicks[i]]
+                start = previous - shift + lead_ns
+                timeout = gap - lead_ns
+                out.append(
+                    (
+                        WAIT,
+                        start,
+                        click[2],
+                        click[3],
+                        timeout // 1_000_000,
+                        settle_ns // 1_000_000,
+                    )
+                )
+                waits += 1
+            elif gap > max_gap_ns:
+                shift += gap - max_gap_ns
+                capped += 1
+        previous = time_ns
+        if op == KEY_PRESS:
+            held.add(("key", row[4]))
+        elif op == KEY_RELEASE:
+            held.discard(("key", row[4]))
+        elif op == MOUSE_DOWN:
+            held.add(("button", row[4]))
+        elif op == MOUSE_UP:
+            held.discard(("button", row[4]))
+        out.append((op, time_ns - shift) + row[2:])
+    return out, capped, waits
+
+
+def projected_duration(macro, waits_at="timeout"):
+    """
+    Playback length in seconds at 1x, with every WAIT taking its timeout
+    or, with waits_at="settle", only its settle time.
+    """
+    duration = macro.duration
+    if waits_at == "settle":
+        for op, _, _, _, timeout, settle in macro.rows():
+            if op == WAIT:
+                duration -= (timeout - settle) / 1000
+    return duration
+
+
+def optimize_macro(
+    macro,
+    max_gap=1.0,
+    wait_gap=1.5,
+    settle=0.3,
+    lead=0.2,
+    scroll_window=0.25,
+    drop_key_repeats=False,
+):
+    """
+    Return (optimized CompiledMacro, report). Times are in seconds. The
+    report holds event counts and the projected durations before and
+    after, with waits taking their full timeout (worst case) or only their
+    settle time (best case).
+    """
+    rows = macro.rows()
+    cleaned = drop_noops(rows, drop_key_repeats)
+    merged = merge_scrolls(cleaned, int(scroll_window * SECOND))
+    retimed, capped, waits = retime(
+        merged,
+        int(max_gap * SECOND),
+        int(wait_gap * SECOND),
+        int(settle * SECOND),
+        int(lead * SECOND),
+    )
+    records = np.array(retimed, dtype=ROW_DTYPE)
+    optimized = CompiledMacro.from_records(records, macro.key_strings, macro.conditions)
+
+    before = macro.duration
+    worst = projected_duration(optimized)
+    best = projected_duration(optimized, "settle")
+    report = {
+        "events_before": len(rows),
+        "events_after": len(retimed),
+        "dropped": len(rows) - len(cleaned),
+        "merged_scrolls": len(cleaned) - len(merged),
+        "capped_gaps": capped,
+        "waits": waits,
+        "duration_before": before,
+        "duration_worst": worst,
+        "duration_best": best,
+    }
+    return optimized, report
+
+
+def format_report(report):
+    before = report["duration_before"]
+    worst, best = report["duration_worst"], report["duration_best"]
+    lines = [
+        f"{report['events_before']} -> {report['events_after']} events "
+        f"({report['dropped']} no-ops dropped, {report['merged_scrolls']} "
+        f"scrolls merged, {report['capped_gaps']} gaps capped, "
+        f"{report['waits']} explicit waits)",
+        f"1x: {before:.1f}s -> {best:.1f}-{worst:.1f}s "
+        f"(saves {before - worst:.1f}-{before - best:.1f}s per run)",
+    ]
+    if before > 0 and best > 0:
+        lines.append(
+            f"{MAX_SPEED:g}x: {3600 * MAX_SPEED / before:.0f} runs/hour -> "
+            f"{3600 * MAX_SPEED / worst:.0f}-{3600 * MAX_SPEED / best:.0f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m modules.optimizer")
+    parser.add_argument("macro", help="Macro .json or .dlsm file")
+    parser.add_argument(
+        "--output", help="Output .json (default: <name>.optimized.json)"
+    )
+    parser.add_argument("--max-gap", type=float, default=1.0)
+    parser.add_argument("--wait-gap", type=float, default=1.5)
+    parser.add_argument("--settle", type=float, default=0.3)
+    parser.add_argument(
+        "--drop-key-repeats",
+        action="store_true",
+        help="Also drop keyboard auto-repeat presses of held keys",
+    )
+    args = parser.parse_args(argv)
+
+    _, macro = load_macro(args.macro)
+    optimized, report = optimize_macro(
+        macro,
+        max_gap=args.max_gap,
+        wait_gap=args.wait_gap,
+        settle=args.settle,
+        drop_key_repeats=args.drop_key_repeats,
+    )
+    output = args.output or os.path.splitext(args.macro)[0] + ".optimized.json"
+    save_macro(output, optimized)
+    print(format_report(report))
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
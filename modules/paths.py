@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def simplify_path(times, points, tolerance):
+    """
+    Ramer-Douglas-Peucker on a timed path. Distances are synchronized
+    Euclidean distances: each point is compared with where the cursor
+    would be at that time moving at constant speed along the simplified
+    segment, so speed changes are kept as well as corners and replaying
+    the kept points with linear interpolation stays within `tolerance`
+    pixels of the recording. Returns the indexes of the kept points (the
+    first and last are always kept).
+    """
+    times = np.asarray(times, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    n = len(times)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        span = times[last] - times[first]
+        inner = slice(first + 1, last)
+        if span > 0:
+            ratio = (times[inner] - times[first]) / span
+        else:
+            ratio = np.zeros(last - first - 1)
+        expected = points[first] + ratio[:, None] * (points[last] - points[first])
+        distances = np.hypot(*(points[inner] - expected).T)
+        worst = int(distances.argmax())
+        if distances[worst] > tolerance:
+            middle = first + 1 + worst
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return np.flatnonzero(keep)
+
+
+class PathSimplifier:
+    """
+    Online version of simplify_path for a stream of cursor positions.
+
+    Points are buffered per stroke; every `window` points (and when the
+    stroke ends) the buffer is simplified, the kept points are emitted and
+    the last one stays as the start of the next buffer, so memory and
+    latency are bounded however long the mouse moves. A gap longer than
+    idle_ns between two positions ends the stroke; the first point of a
+    stroke is emitted with start=True, meaning the cursor was resting
+    before it and playback should not interpolate into it.
+
+    add() and flush() return lists of (time_ns, x, y, start) tuples.
+    """
+
+    def __init__(self, tolerance=2.0, window=256, idle_ns=100_000_000):
+        self.tolerance = tolerance
+        self.window = window
+        self.idle_ns = idle_ns
+        self.raw = 0  # Positions seen
+        self.kept = 0  # Positions emitted
+        self._buffer = []
+
+    def add(self, time_ns, x, y):
+        self.raw += 1
+        out = []
+        if self._buffer and time_ns - self._buffer[-1][0] > self.idle_ns:
+            out = self.flush()
+        if not self._buffer:
+            self._buffer.append((time_ns, x, y))
+            self.kept += 1
+            out.append((time_ns, x, y, True))
+            return out
+        self._buffer.append((time_ns, x, y))
+        if len(self._buffer) >= self.window:
+            out.extend(self._simplify())
+            self._buffer = self._buffer[-1:]
+        return out
+
+    def flush(self):
+        """
+        Emit what is buffered and end the stroke.
+        """
+        out = self._simplify() if len(self._buffer) > 1 else []
+        self._buffer = []
+        return out
+
+    def _simplify(self):
+        buffer = self._buffer
+        times = [p[0] for p in buffer]
+        points = [(p[1], p[2]) for p in buffer]
+        kept = simplify_path(times, points, self.tolerance)[1:]  # First is out
+        self.kept += len(kept)
+        return [buffer[i] + (False,) for i in kept]
+
+
+def interpolate(start, end, step):
+    """
+    Positions between two timed points (time, x, y), every `step` time
+    units after start and before end, moving at constant speed.
+    """
+    t0, x0, y0 = start
+    t1, x1, y1 = end
+    out = []
+    t = t0 + step
+    while t < t1:
+        ratio = (t - t0) / (t1 - t0)
+        out.append((t, round(x0 + (x1 - x0) * ratio), round(y0 + (y1 - y0) * ratio)))
+        t += step
+    return out
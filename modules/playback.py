@@ -0,0 +1,202 @@
+import time
+
+import numpy as np
+
+from modules.dispatch import SendError
+from modules.macro import COND, KEY_PRESS, KEY_RELEASE, MOVE, WAIT
+
+
+class LatenessStats:
+    """
+    How late each event was dispatched relative to its deadline, in
+    seconds (negative would mean early, which the scheduler never is).
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    def record(self, lateness):
+        self.samples.append(lateness)
+
+    def summary(self):
+        if not self.samples:
+            return {"events": 0}
+        ms = np.array(self.samples) * 1000
+        return {
+            "events": len(ms),
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+            "final_ms": float(ms[-1]),  # Drift at the end of the run
+        }
+
+    def format(self):
+        s = self.summary()
+        if not s["events"]:
+            return "no events"
+        return (
+            f"{s['events']} events, lateness mean {s['mean_ms']:.2f} ms, "
+            f"p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, "
+            f"p99 {s['p99_ms']:.2f} ms, max {s['max_ms']:.2f} ms, "
+            f"final {s['final_ms']:.2f} ms"
+        )
+
+
+class PlaybackClock:
+    """
+    Schedules events at absolute deadlines on time.perf_counter, so sleep
+    overshoot and time spent sending input never accumulate into drift.
+
+    Event times are offsets in seconds from the start of the macro and are
+    divided by `speed`. wait_until() sleeps until `spin` seconds before the
+    deadline and busy-waits the rest, since OS sleeps can overshoot by a
+    timer tick (about 15 ms on Windows). Changing the speed mid-run keeps
+    the current position in the macro and rescales only what is left.
+    """
+
+    def __init__(self, speed=1.0, spin=0.001, max_sleep=0.05):
+        self.speed = speed
+        self.spin = spin
+        self.max_sleep = max_sleep  # Longest sleep between running() checks
+        self.stats = LatenessStats()
+        self._origin = None
+        self._base = 0.0  # Macro offset at _origin
+
+    def start(self):
+        self._origin = time.perf_counter()
+        self._base = 0.0
+        self.stats = LatenessStats()
+
+    def set_speed(self, speed):
+        if speed == self.speed:
+            return
+        if self._origin is not None:
+            now = time.perf_counter()
+            self._base += (now - self._origin) * self.speed
+            self._origin = now
+        self.speed = speed
+
+    def skip_to(self, offset):
+        """
+        Continue the schedule from `offset` now, e.g. after a wait that
+        ended before its timeout; later events move up accordingly.
+        """
+        self._origin = time.perf_counter()
+        self._base = offset
+
+    def deadline(self, offset):
+        return self._origin + (offset - self._base) / self.speed
+
+    def wait_until(self, offset, running=None, speed=None):
+        """
+        Block until the event at `offset` is due and record its lateness.
+        running() is checked first (so a stopped run sends no backlog of
+        late events) and between sleeps, where speed() (the current
+        playback speed) is applied. Returns False if running() is false.
+        """
+        if running is not None and not running():
+            return False
+        while True:
+            if speed is not None:
+                self.set_speed(speed())
+            deadline = self.deadline(offset)
+            remaining = deadline - time.perf_counter()
+            if remaining <= self.spin:
+                break
+            if running is not None and not running():
+                return False
+            time.sleep(min(remaining - self.spin, self.max_sleep))
+        while time.perf_counter() < deadline:
+            pass
+        self.stats.record(time.perf_counter() - deadline)
+        return True
+
+
+def run_macro(
+    macro,
+    backend,
+    clock,
+    running=None,
+    speed=None,
+    wait=None,
+    condition=None,
+    log_message=None,
+    batch_ns=500_000,
+):
+    """
+    Play a CompiledMacro through an InputBackend on a started PlaybackClock.
+
+    Events due within batch_ns of each other are sent with one
+    backend.send() call after a single wait. WAIT events call
+    wait(x, y, timeout_ms, settle_ms), which returns True if it waited for
+    the screen (the schedule then continues from the end of the recorded
+    pause) or False to keep the recorded pause. COND rows call
+    condition(spec) with the event's entry in macro.conditions; the event
+    is skipped when it returns False, and the schedule continues from the
+    event once a "wait_until" has passed. running() and speed() are passed
+    to the clock. An event that fails is logged and skipped; fail-safe
+    aborts (dispatch.ABORT_EXCEPTIONS) propagate and end the run. Returns
+    a dict with "completed", "batches", "interpolated" moves and the
+    playback thread's "cpu" seconds.
+    """
+    keys = macro.keys
+    cpu_start = time.thread_time()
+    result = {"completed": False, "batches": 0, "interpolated": 0, "cpu": 0.0}
+    batch, batch_time = [], 0
+    skip = False
+
+    def send():
+        if not clock.wait_until(batch_time / 1e9, running, speed):
+            return False
+        result["batches"] += 1
+        pending = batch
+        while pending:
+            try:
+                backend.send(pending)
+                break
+            except SendError as e:
+                # Report the failing event and go on after it; the ones
+                # before it were sent already
+                if log_message:
+                    log_message(
+                        f"Error playing event {pending[e.sent]}: {e.error}", "ERROR"
+                    )
+                pending = pending[e.sent + 1 :]
+        batch.clear()
+        return True
+
+    for op, time_ns, x, y, arg, arg2 in macro.timeline():
+        if skip:
+            # Skip the guarded event, with the positions leading up to it
+            skip = op == MOVE and arg == 2
+            continue
+        if batch and (op in (WAIT, COND) or time_ns - batch_time > batch_ns):
+            if not send():
+                break
+        if op == COND:
+            if not clock.wait_until(time_ns / 1e9, running, speed):
+                break
+            spec = macro.conditions[arg]
+            skip = condition is not None and not condition(spec)
+            if "wait_until" in spec:
+                clock.skip_to(time_ns / 1e9)
+            continue
+        if op == WAIT:
+            if not clock.wait_until(time_ns / 1e9, running, speed):
+                break
+            if wait is not None and wait(x, y, arg, arg2):
+                clock.skip_to((time_ns + arg * 1_000_000) / 1e9)
+            continue
+        if op == KEY_PRESS or op == KEY_RELEASE:
+            arg = keys[arg]
+        elif op == MOVE and arg == 2:
+            result["interpolated"] += 1
+        if not batch:
+            batch_time = time_ns
+        batch.append((op, x, y, arg, arg2))
+    else:
+        result["completed"] = not batch or send()
+    result["cpu"] = time.thread_time() - cpu_start
+    return result
@@ -0,0 +1,210 @@
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from modules.macro import (
+    KEY_PRESS,
+    KEY_RELEASE,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    MOVE,
+    ROW_DTYPE,
+    SCROLL,
+    CompiledMacro,
+    parse_button,
+)
+from modules.paths import PathSimplifier
+
+try:
+    from pynput import keyboard as pynput_keyboard, mouse
+except Exception:  # No display or pynput missing (headless benchmarks)
+    pynput_keyboard = mouse = None
+
+
+class MacroRecorder:
+    """
+    Records keyboard and mouse input to a journal file while it happens.
+
+    The input hooks only push a small tuple with a time.perf_counter_ns
+    timestamp onto a deque (appends are atomic, so no lock is taken in the
+    hook). A writer thread drains the deque every flush_interval seconds,
+    resolves keys and buttons and appends the events to the journal as
+    packed ROW_DTYPE records; new key strings go to a small ".keys" file
+    next to it. Memory stays flat however long the recording runs, and
+    stop() loads the journal back as a CompiledMacro in one read.
+
+    With record_moves, cursor positions are recorded too: the writer runs
+    them through a PathSimplifier, so only the points needed to replay the
+    path within move_tolerance pixels are stored.
+
+    Clicks inside `ignore_rect` (left, top, right, bottom in screen
+    coordinates, normally the app's own window) are not recorded.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        flush_interval=0.05,
+        record_moves=True,
+        move_tolerance=2.0,
+        log_message=None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.record_moves = record_moves
+        self.move_tolerance = move_tolerance
+        self.log_message = log_message
+        self.simplifier = PathSimplifier(move_tolerance)
+        self.ignore_rect = None
+        self.count = 0  # Events written so far
+        self._queue = collections.deque()
+        self._stop = threading.Event()
+        self._writer = None
+        self._listeners = []
+        self._start_ns = 0
+
+    # --- Input hooks (called on the listener threads) ---
+    def on_press(self, key):
+        self._queue.append((KEY_PRESS, time.perf_counter_ns(), 0, 0, key, 0))
+
+    def on_release(self, key):
+        self._queue.append((KEY_RELEASE, time.perf_counter_ns(), 0, 0, key, 0))
+
+    def on_click(self, x, y, button, pressed):
+        rect = self.ignore_rect
+        if rect and rect[0] <= x <= rect[2] and rect[1] <= y <= rect[3]:
+            return  # Ignore clicks within the app window
+        op = MOUSE_DOWN if pressed else MOUSE_UP
+        self._queue.append((op, time.perf_counter_ns(), x, y, button, 0))
+
+    def on_move(self, x, y):
+        self._queue.append((MOVE, time.perf_counter_ns(), x, y, 0, 0))
+
+    def on_scroll(self, x, y, dx, dy):
+        self._queue.append((SCROLL, time.perf_counter_ns(), x, y, dy, dx))
+
+    # --- Lifecycle ---
+    def recording(self):
+        return self._writer is not None
+
+    def start(self, listen=True):
+        """
+        Start the writer and, with listen=True, the pynput listeners.
+        Hooks can also be called directly (listen=False) to feed events.
+        """
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(prefix="dls-recording-", suffix=".rec")
+            os.close(fd)
+        self._journal = open(self.path, "wb")
+        self._keys_file = open(self.path + ".keys", "w", encoding="utf-8")
+        self._key_index = {}
+        self._buttons = {}
+        self.simplifier = PathSimplifier(self.move_tolerance)
+        self.count = 0
+        self._queue.clear()
+        self._stop.clear()
+        self._start_ns = time.perf_counter_ns()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="macro-writer", daemon=True
+        )
+        self._writer.start()
+        if listen:
+            self._listeners = [
+                pynput_keyboard.Listener(
+                    on_press=self.on_press, on_release=self.on_release
+                ),
+                mouse.Listener(
+                    on_click=self.on_click,
+                    on_scroll=self.on_scroll,
+                    on_move=self.on_move if self.record_moves else None,
+                ),
+            ]
+            for listener in self._listeners:
+                listener.start()
+
+    def stop(self, keep_journal=False):
+        """
+        Stop listening, write out what is queued and return the recording
+        as a CompiledMacro. The journal is deleted unless keep_journal.
+        """
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners = []
+        if self._writer is None:
+            return None
+        self._stop.set()
+        self._writer.join()
+        self._writer = None
+        self._journal.close()
+        self._keys_file.close()
+
+        records = np.fromfile(self.path, dtype=ROW_DTYPE)
+        macro = CompiledMacro.from_records(records, self._key_index)
+        if not keep_journal:
+            for path in (self.path, self.path + ".keys"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.path = None
+        return macro
+
+    # --- Writer thread ---
+    def _key(self, key):
+        key_str = str(key)
+        index = self._key_index.get(key_str)
+        if index is None:
+            index = self._key_index[key_str] = len(self._key_index)
+            self._keys_file.write(json.dumps(key_str) + "\n")
+        return index
+
+    def _button(self, button):
+        code = self._buttons.get(button)
+        if code is None:
+            code = self._buttons[button] = parse_button(str(button))
+        return code
+
+    def _drain(self, final=False):
+        rows = []
+        queue = self._queue
+        simplifier = self.simplifier
+        while queue:
+            op, time_ns, x, y, arg, arg2 = queue.popleft()
+            time_ns -= self._start_ns
+            if op == MOVE:
+                for t, px, py, start in simplifier.add(time_ns, x, y):
+                    rows.append((MOVE, t, px, py, int(start), 0))
+                continue
+            # Emit the buffered path first so rows stay in time order
+            for t, px, py, start in simplifier.flush():
+                rows.append((MOVE, t, px, py, int(start), 0))
+            if op == KEY_PRESS or op == KEY_RELEASE:
+                arg = self._key(arg)
+            elif op == MOUSE_DOWN or op == MOUSE_UP:
+                arg = self._button(arg)
+            rows.append((op, time_ns, x, y, arg, arg2))
+        if final:
+            for t, px, py, start in simplifier.flush():
+                rows.append((MOVE, t, px, py, int(start), 0))
+        if rows:
+            self._journal.write(np.array(rows, dtype=ROW_DTYPE).tobytes())
+            self._journal.flush()
+            self._keys_file.flush()
+            self.count += len(rows)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain_safely()
+        self._drain_safely(final=True)
+
+    def _drain_safely(self, final=False):
+        try:
+            self._drain(final)
+        except Exception as e:
+            if self.log_message:
+                self.log_message(f"Macro recorder error: {str(e)}", "ERROR")
@@ -0,0 +1,131 @@
+import re
+import threading
+import time
+
+import cv2
+
+from modules.ocr_engines import DIGITS
+
+_NUMBER = re.compile(r"(\d+(?:[.,]\d+)*)\s*([KMB])?", re.IGNORECASE)
+_SUFFIXES = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}
+
+
+def parse_number(text):
+    """
+    First number in an OCR reading, e.g. "12,345" -> 12345 and
+    "1.2K" -> 1200. Returns an int, or None when there is no number.
+    """
+    match = _NUMBER.search(text or "")
+    if match is None:
+        return None
+    digits, suffix = match.groups()
+    if suffix:
+        # With a suffix a single separator is the decimal point ("1.2K")
+        value = float(digits.replace(",", "."))
+        return int(round(value * _SUFFIXES[suffix.lower()]))
+    return int(re.sub(r"[.,]", "", digits))
+
+
+class ResourceTracker:
+    """
+    Samples every resource ROI on a schedule. Each tick crops all ROIs from
+    one frame, converts them to gray and reads them with one batched call
+    through the OCR router, which uses the cheapest engine that can read
+    digits and the cache in front of it. Parsed values are passed to
+    on_values({name: value}) from the tracker thread.
+
+    get_rois() returns {name: (x, y, width, height)} in window coordinates;
+    crop_regions(regions) returns one BGR crop per region from one frame,
+    or None when no frame is available.
+    """
+
+    def __init__(
+        self,
+        get_rois,
+        crop_regions,
+        ocr,
+        on_values,
+        interval=5.0,
+        log_message=None,
+    ):
+        self.get_rois = get_rois
+        self.crop_regions = crop_regions
+        self.ocr = ocr  # OCRRouter
+        self.on_values = on_values
+        self.interval = interval
+        self.log_message = log_message
+        self.samples = 0  # ROI readings taken
+        self.batches = 0  # Batched OCR calls made
+        self.read_time = 0.0  # Seconds spent cropping and reading
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="resource-tracker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        errors = 0
+        while not self._stop.is_set():
+            try:
+                values = self.sample()
+                errors = 0
+            except Exception as e:
+                values = None
+                errors += 1
+                if errors == 1 and self.log_message:
+                    self.log_message(f"Resource tracking error: {str(e)}", "ERROR")
+            if values:
+                self.on_values(values)
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        """
+        Read every ROI once. Returns {name: value} for the ROIs that
+        contained a number.
+        """
+        rois = {name: roi for name, roi in self.get_rois().items() if roi}
+        if not rois:
+            return {}
+        start = time.perf_counter()
+        crops = self.crop_regions(list(rois.values()))
+        if crops is None:
+            return {}
+        names, grays = [], []
+        for name, crop in zip(rois, crops):
+            if crop is not None and crop.size:
+                names.append(name)
+                grays.append(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY))
+        # Engines still loading are skipped, the next tick tries again
+        texts = self.ocr.read_batch(grays, charset=DIGITS, wait=False)
+        self.batches += 1
+        self.samples += len(names)
+        self.read_time += time.perf_counter() - start
+
+        values = {}
+        for name, text in zip(names, texts):
+            value = parse_number(text)
+            if value is not None:
+                values[name] = value
+        return values
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "batches": self.batches,
+            "ms_per_roi": 1000 * self.read_time / self.samples if self.samples else 0.0,
+        }
@@ -0,0 +1,545 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from modules.conditions import ConditionEngine
+from modules.dispatch import ABORT_EXCEPTIONS, InputBackend, SendError
+from modules.macro import (
+    BUTTON_NAMES,
+    KEY_PRESS,
+    KEY_RELEASE,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    MOVE,
+    SCROLL,
+)
+from modules.playback import PlaybackClock, run_macro
+
+
+class OCRWorker:
+    """
+    Runs every OCR request of the process on one thread, in front of an
+    OCRRouter. Callers from any thread (sessions, the resource tracker,
+    the preview) queue their images and block on the result, so however
+    many windows are automated there is one set of OCR models and one OCR
+    call running at a time instead of several competing for the CPU.
+
+    Requests waiting when the worker picks up the next one are answered
+    together: requests for the same pattern/charset are merged into a
+    single read_batch call.
+
+    Takes the OCRRouter's read()/read_batch() arguments, so it can stand
+    in for the router. Other OCR work (EasyOCR detection with boxes, a
+    Tesseract pass over a whole frame) goes through call(), so it takes
+    its turn on the same thread.
+    """
+
+    def __init__(self, router, max_batch=32):
+        self.router = router
+        self.max_batch = max_batch
+        self.requests = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def engines(self):
+        return self.router.engines
+
+    def add(self, engine):
+        self.router.add(engine)
+
+    def candidates(self, pattern=None, charset=None, wait=True):
+        return self.router.candidates(pattern, charset, wait)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="ocr-worker", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, images, pattern=None, charset=None, wait=True):
+        """
+        Queue images for reading; returns a Future of their texts.
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Called from an engine on the worker itself, read in place
+            future.set_result(self.router.read_batch(images, pattern, charset, wait))
+            return future
+        self.start()
+        self._queue.put(("read", list(images), pattern, charset, wait, future))
+        return future
+
+    def call(self, fn, *args):
+        """
+        Run fn(*args) on the worker thread and return its result.
+        """
+        if threading.current_thread() is self._thread:
+            return fn(*args)
+        future = Future()
+        self.start()
+        self._queue.put(("call", fn, args, future))
+        return future.result()
+
+    def read_batch(self, images, pattern=None, charset=None, wait=True):
+        return self.submit(images, pattern, charset, wait).result()
+
+    def read(self, image, pattern=None, charset=None, wait=True):
+        return self.read_batch([image], pattern, charset, wait)[0]
+
+    def stats(self):
+        return {"requests": self.requests, "batches": self.batches}
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            pending = [request]
+            while len(pending) < self.max_batch:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)  # Finish this round, then stop
+                    break
+                pending.append(request)
+            self.requests += len(pending)
+
+            groups = {}
+            for request in pending:
+                if request[0] == "call":
+                    _, fn, args, future = request
+                    try:
+                        future.set_result(fn(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+                    continue
+                groups.setdefault(request[2:5], []).append(request)
+            for (pattern, charset, wait), requests in groups.items():
+                images = [image for request in requests for image in request[1]]
+                self.batches += 1
+                try:
+                    texts = self.router.read_batch(images, pattern, charset, wait)
+                except Exception as e:
+                    for request in requests:
+                        request[5].set_exception(e)
+                    continue
+                start = 0
+                for request in requests:
+                    end = start + len(request[1])
+                    request[5].set_result(texts[start:end])
+                    start = end
+
+
+class SessionInput(InputBackend):
+    """
+    Input queue of one session. Actions are queued and sent by the
+    session's own input thread, which brings the session's window to the
+    front first. Mouse and keyboard are shared by the whole desktop, so
+    the input threads of all sessions take turns through `focus_lock`:
+    each holds it for one drained queue at a time, and keeps holding it
+    (without refocusing) while any key or button it pressed is still down,
+    so a held key or a drag is never split by another session bringing
+    its own window to the front.
+    """
+
+    name = "session"
+
+    def __init__(self, backend, window, focus_lock, log_message=None):
+        self.backend = backend
+        self.window = window
+        self.focus_lock = focus_lock
+        self.log_message = log_message
+        self.batches = 0
+        self.focus_switches = 0
+        self._held = set()  # (op, key or button) pressed and not released
+        self._locked = False
+        self._position = (0, 0)  # Last position sent, for releases
+        self.aborted = None  # Fail-safe exception that stopped the input
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._loop, name="session-input", daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item):
+        if self.aborted is not None:
+            raise self.aborted
+        self._queue.put(item)
+
+    def key_down(self, key):
+        self._put(("send", [(KEY_PRESS, 0, 0, key, 0)]))
+
+    def key_up(self, key):
+        self._put(("send", [(KEY_RELEASE, 0, 0, key, 0)]))
+
+    def mouse_down(self, x, y, button="left"):
+        self._put(("send", [(MOUSE_DOWN, x, y, BUTTON_NAMES.index(button), 0)]))
+
+    def mouse_up(self, x, y, button="left"):
+        self._put(("send", [(MOUSE_UP, x, y, BUTTON_NAMES.index(button), 0)]))
+
+    def move(self, x, y):
+        self._put(("send", [(MOVE, x, y, 0, 0)]))
+
+    def scroll(self, dy, dx=0):
+        self._put(("send", [(SCROLL, 0, 0, dy, dx)]))
+
+    def click(self, x, y, button="left"):
+        self._put(("click", (x, y, button)))
+
+    def send(self, actions):
+        self._put(("send", list(actions)))
+
+    def release_all(self):
+        """
+        Queue releases of every key and button still held, e.g. after a
+        macro was stopped halfway, so the focus lock is given back.
+        """
+        self._queue.put(("release", None))
+
+    def drain(self):
+        """
+        Block until everything queued has been sent.
+        """
+        self._queue.join()
+
+    def close(self):
+        self.release_all()
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _focus(self):
+        try:
+            if not self.window.isActive:
+                self.window.activate()
+                self.focus_switches += 1
+        except Exception as e:
+            if self.log_message:
+                self.log_message(f"Could not focus the window: {str(e)}", "ERROR")
+
+    def _track(self, actions):
+        for op, x, y, arg, arg2 in actions:
+            if op == KEY_PRESS:
+                self._held.add((KEY_PRESS, arg))
+            elif op == KEY_RELEASE:
+                self._held.discard((KEY_PRESS, arg))
+            elif op == MOUSE_DOWN:
+                self._held.add((MOUSE_DOWN, arg))
+            elif op == MOUSE_UP:
+                self._held.discard((MOUSE_DOWN, arg))
+            if op in (MOUSE_DOWN, MOUSE_UP, MOVE):
+                self._position = (x, y)
+
+    def _releases(self):
+        x, y = self._position
+        return [
+            (KEY_RELEASE, 0, 0, arg, 0) if op == KEY_PRESS else (MOUSE_UP, x, y, arg, 0)
+            for op, arg in self._held
+        ]
+
+    def _send_actions(self, actions):
+        while actions:
+            try:
+                self.backend.send(actions)
+                self._track(actions)
+                return
+            except SendError as e:
+                # The actions before the failing one went out; skip it only
+                self._track(actions[: e.sent])
+                if self.log_message:
+                    self.log_message(
+                        f"Error sending {actions[e.sent]}: {e.error}", "ERROR"
+                    )
+                actions = actions[e.sent + 1 :]
+
+    def _send(self, items):
+        if not self._locked:
+            self.focus_lock.acquire()
+            self._locked = True
+            self._focus()
+        for kind, payload in items:
+            if kind == "click":
+                self.backend.click(*payload)
+                continue
+            if kind == "release":
+                payload = self._releases()
+            self._send_actions(payload)
+            self.batches += 1
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            items = [item]
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    self._queue.task_done()
+                    break
+                items.append(item)
+            try:
+                if self.aborted is None:
+                    self._send(items)
+            except ABORT_EXCEPTIONS as e:
+                # Fail-safe: drop what is queued and fail the producer's
+                # next call, so the session stops
+                self.aborted = e
+                if self.log_message:
+                    self.log_message(f"Input aborted: {str(e)}", "ERROR")
+            except Exception as e:
+                if self.log_message:
+                    self.log_message(f"Error sending input: {str(e)}", "ERROR")
+            finally:
+                if self._locked and not self._held:
+                    self._locked = False
+                    self.focus_lock.release()
+                for _ in items:
+                    self._queue.task_done()
+        if self._locked:
+            self._locked = False
+            self.focus_lock.release()
+
+
+class Session:
+    """
+    Macro playback or auto-farm against one window, on its own thread.
+
+    A session has the window's own frame bus (capture loop), its own input
+    queue and its own condition engine; OCR goes through the macro
+    system's shared worker. Messages are logged prefixed with the name.
+    """
+
+    def __init__(
+        self,
+        name,
+        window,
+        macro_system,
+        backend,
+        focus_lock,
+        get_rois,
+        log_message=None,
+    ):
+        self.name = name
+        self.window = window
+        self.macro_system = macro_system
+        self._log = log_message
+        self.bus = macro_system.get_frame_bus(window)
+        self.input = SessionInput(backend, window, focus_lock, self.log_message)
+        self.conditions = ConditionEngine(
+            macro_system,
+            lambda: window,
+            lambda: get_rois(window),
+            log_message=self.log_message,
+        )
+        self.running = threading.Event()
+        self.speed = 1.0
+        self.task = None  # Description of what the session runs
+        self.runs = 0
+        self._thread = None
+
+    def log_message(self, message, level="INFO"):
+        if self._log:
+            self._log(f"[{self.name}] {message}", level)
+
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self, task, target, *args):
+        if self.active():
+            raise RuntimeError(f"Session '{self.name}' is already running.")
+        self.task = task
+        self.runs = 0
+        self.input.aborted = None
+        self.running.set()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(target,) + args,
+            name=f"session-{self.name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            self.log_message(f"Session error: {str(e)}", "ERROR")
+        finally:
+            self.input.release_all()
+            self.input.drain()
+            self.running.clear()
+
+    def play(self, macro, repeat=1, speed=1.0):
+        """
+        Play a CompiledMacro `repeat` times (forever with repeat=None).
+        """
+        self.speed = speed
+        self._start(f"macro x{repeat or 'inf'}", self._play, macro, repeat)
+
+    def farm(self, step, interval=5.0):
+        """
+        Call step(session) every `interval` seconds until stopped.
+        """
+        self._start("auto-farm", self._farm, step, interval)
+
+    def stop(self, timeout=5.0):
+        self.running.clear()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.input.close()
+
+    def _play(self, macro, repeat):
+        while self.running.is_set() and (repeat is None or self.runs < repeat):
+            clock = PlaybackClock(self.speed)
+            self.conditions.reset_stats()
+            clock.start()
+            result = run_macro(
+                macro,
+                self.input,
+                clock,
+                running=self.running.is_set,
+                wait=self.wait_for_screen,
+                condition=lambda spec: self.conditions.run(spec, self.running.is_set),
+                log_message=self.log_message,
+            )
+            if not result["completed"]:
+                break
+            self.runs += 1
+            self.log_message(
+                f"Macro run {self.runs} finished. Timing: {clock.stats.format()}"
+            )
+
+    def _farm(self, step, interval):
+        while self.running.is_set():
+            started = time.perf_counter()
+            step(self)
+            self.runs += 1
+            self.input.drain()
+            remaining = interval - (time.perf_counter() - started)
+            deadline = time.perf_counter() + max(remaining, 0)
+            while self.running.is_set() and time.perf_counter() < deadline:
+                time.sleep(min(0.1, deadline - time.perf_counter()))
+
+    def wait_for_screen(self, x, y, timeout_ms, settle_ms):
+        """
+        WAIT events: let the queued input land, then wait for the window
+        around the click to settle.
+        """
+        self.input.drain()
+        window = self.window
+        size = 128
+        region = (x - window.left - size // 2, y - window.top - size // 2, size, size)
+        self.macro_system.wait_for_settle(
+            window,
+            region,
+            settle_ms / 1000 / self.speed,
+            timeout_ms / 1000 / self.speed,
+            self.running.is_set,
+        )
+        return True
+
+    def status(self):
+        state = "running" if self.active() else "idle"
+        return (
+            f"{self.name}: {self.task or '-'} {state}, {self.runs} runs, "
+            f"{self.input.batches} input batches, "
+            f"{self.input.focus_switches} focus switches"
+        )
+
+
+class SessionManager:
+    """
+    Independent sessions against several game windows at once, one per
+    window. All sessions share one input backend (through one focus lock)
+    and the macro system's OCR worker.
+
+    get_rois(window) returns {name: (x, y, width, height)} for a window.
+    """
+
+    def __init__(self, macro_system, backend, get_rois, log_message=None):
+        self.macro_system = macro_system
+        self.backend = backend
+        self.get_rois = get_rois
+        self.log_message = log_message
+        self.focus_lock = threading.Lock()
+        self.sessions = {}  # Window key -> Session
+
+    def session(self, window):
+        """
+        The session of a window, created on first use.
+        """
+        key = self.macro_system.window_key(window)
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = Session(
+                window.title or str(key),
+                window,
+                self.macro_system,
+                self.backend,
+                self.focus_lock,
+                self.get_rois,
+                log_message=self.log_message,
+            )
+        return session
+
+    def start_macro(self, window, macro, repeat=1, speed=1.0):
+        session = self.session(window)
+        session.play(macro, repeat, speed)
+        return session
+
+    def start_farm(self, window, step, interval=5.0):
+        session = self.session(window)
+        session.farm(step, interval)
+        return session
+
+    def running(self):
+        return [session for session in self.sessions.values() if session.active()]
+
+    def stop_all(self, wait=True):
+        """
+        Stop every session; with wait, block until their threads end.
+        """
+        for session in self.sessions.values():
+            session.running.clear()
+        if wait:
+            for session in self.sessions.values():
+                session.stop()
+
+    def status(self):
+        lines = [session.status() for session in self.sessions.values()]
+        stats = getattr(self.macro_system.ocr, "stats", None)
+        if stats is not None:
+            ocr = stats()
+            lines.append(
+                f"Shared OCR: {ocr['requests']} requests in {ocr['batches']} batches"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        self.stop_all()
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
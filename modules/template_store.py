@@ -0,0 +1,236 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from modules.capture import IMAGE_EXTENSIONS
+from modules.matching import CompiledTemplate
+
+BUNDLE_VERSION = 2
+ALIGNMENT = 64  # Byte alignment of every array inside the bundle
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+class TemplateStore:
+    """
+    Compiled template cache for a templates folder.
+
+    Every template is stored with its gray pyramid and normalization term
+    in one binary bundle plus a JSON index, under `<folder>/.cache/`.
+    Loading memory-maps the bundle and reads the index; only files whose
+    size/mtime changed are hashed, and only files whose content hash
+    changed are decoded and compiled again. watch() polls the folder and
+    applies the same incremental refresh while the app runs.
+    """
+
+    def __init__(self, folder, log_message, max_levels=3, min_size=16):
+        self.folder = folder
+        self.log_message = log_message
+        self.params = [max_levels, min_size]
+        self.cache_dir = os.path.join(folder, ".cache")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.templates = {}  # Template name -> CompiledTemplate
+        self._entries = {}  # Template name -> index entry
+        self._generation = 0
+        self._bundles = []  # Open memmaps, kept alive while arrays use them
+        self._opened = False
+        self._lock = threading.RLock()
+        self._watch_thread = None
+        self._stop = threading.Event()
+
+    # --- Loading ---
+    def _scan(self):
+        files = {}
+        for entry in sorted(os.scandir(self.folder), key=lambda e: e.name):
+            name, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext.lower() in IMAGE_EXTENSIONS:
+                files[name.lower()] = (entry.path, entry.stat())
+        return files
+
+    def _read_bundle(self):
+        """
+        Memory-map the bundle described by the index. Any problem just
+        means everything gets compiled again.
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index["version"] != BUNDLE_VERSION or index["params"] != self.params:
+                return
+            bundle = np.memmap(
+                os.path.join(self.cache_dir, index["bundle"]), dtype=np.uint8, mode="r"
+            )
+            templates = {}
+            for name, entry in index["entries"].items():
+                arrays = [
+                    np.ndarray(
+                        tuple(shape), np.dtype(dtype), buffer=bundle, offset=offset
+                    )
+                    for offset, shape, dtype in entry["arrays"]
+                ]
+                templates[name] = CompiledTemplate(
+                    name,
+                    arrays[0],
+                    pyramid=arrays[1:],
+                    norm=entry["norm"],
+                )
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log_message(f"Template cache unreadable, rebuilding: {e}", "WARNING")
+            return
+        self._bundles.append(bundle)
+        self._generation = index["generation"]
+        self._entries = index["entries"]
+        self.templates = templates
+
+    def load(self):
+        """
+        Bring the store up to date with the folder.
+        Returns (changed, removed) lists of template names.
+        """
+        with self._lock:
+            if not self._opened:
+                self._opened = True
+                self._read_bundle()
+
+            files = self._scan()
+            changed = []
+            removed = [name for name in self._entries if name not in files]
+            dirty = bool(removed)
+            for name, (path, stat) in files.items():
+                entry = self._entries.get(name)
+                file = os.path.basename(path)
+                if (
+                    entry is not None
+                    and entry["file"] == file
+                    and entry["size"] == stat.st_size
+                    and entry["mtime_ns"] == stat.st_mtime_ns
+                ):
+                    continue
+
+                try:
+                    digest = _hash_file(path)
+                except OSError as e:
+                    self.log_message(f"Error loading template: {file} ({e})", "ERROR")
+                    continue
+                if entry is not None and entry["hash"] == digest:
+                    # Touched but identical, just refresh the stat
+                    entry.update(
+                        file=file, size=stat.st_size, mtime_ns=stat.st_mtime_ns
+                    )
+                    dirty = True
+                    continue
+
+                image = cv2.imread(path)
+                if image is None:
+                    self.log_message(
+                        f"Failed to load template: {file} (invalid file or format)",
+                        "ERROR",
+                    )
+                    continue
+                template = CompiledTemplate(name, image, *self.params)
+                if template.norm == 0:
+                    self.log_message(
+                        f"Template '{name}' is a flat color and cannot be matched.",
+                        "WARNING",
+                    )
+                self.templates[name] = template
+                self._entries[name] = {
+                    "file": file,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "hash": digest,
+                }
+                changed.append(name)
+
+            for name in removed:
+                self._entries.pop(name, None)
+                self.templates.pop(name, None)
+            if changed or dirty:
+                try:
+                    self._write_bundle()
+                except OSError as e:
+                    self.log_message(f"Could not write template cache: {e}", "WARNING")
+            return changed, removed
+
+    # --- Writing ---
+    def _write_bundle(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._generation += 1
+        bundle_name = f"bundle-{self._generation}.bin"
+        offset = 0
+        with open(os.path.join(self.cache_dir, bundle_name), "wb") as f:
+            for name, template in self.templates.items():
+                specs = []
+                for array in [template.image] + template.pyramid:
+                    padding = -offset % ALIGNMENT
+                    f.write(b"\0" * padding)
+                    offset += padding
+                    array = np.ascontiguousarray(array)
+                    f.write(memoryview(array).cast("B"))
+                    specs.append([offset, list(array.shape), array.dtype.str])
+                    offset += array.nbytes
+                entry = self._entries[name]
+                entry.update(arrays=specs, norm=template.norm)
+
+        index = {
+            "version": BUNDLE_VERSION,
+            "params": self.params,
+            "generation": self._generation,
+            "bundle": bundle_name,
+            "entries": self._entries,
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        self._remove_stale_bundles(bundle_name)
+
+    def _remove_stale_bundles(self, current):
+        for path in glob.glob(os.path.join(self.cache_dir, "bundle-*.bin")):
+            if os.path.basename(path) == current:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Still memory-mapped (Windows), removed on a later run
+
+    # --- Watching ---
+    def watch(self, callback, interval=1.0):
+        """
+        Poll the folder every interval seconds and call
+        callback(changed, removed) from the watcher thread on changes.
+        """
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    if not os.path.isdir(self.folder):
+                        continue
+                    changed, removed = self.load()
+                except Exception as e:
+                    self.log_message(f"Template watcher error: {e}", "ERROR")
+                    continue
+                if changed or removed:
+                    callback(changed, removed)
+
+        self._watch_thread = threading.Thread(target=run, daemon=True)
+        self._watch_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watch_thread:
+            self._watch_thread.join(timeout=2.0)
+            self._watch_thread = None
@@ -0,0 +1,295 @@
+import io
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Keep Windows from flashing a console window for every tesseract run
+_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+class _Request:
+    __slots__ = ("image", "deadline", "future")
+
+    def __init__(self, image, deadline):
+        self.image = image
+        self.deadline = deadline
+        self.future = Future()
+
+
+def _parse_config(config):
+    """
+    Split a tesseract command-line config into (psm, oem, variables) for
+    the in-process API. Supports --psm/-psm N, --oem N and -c name=value;
+    anything else raises ValueError.
+    """
+    psm = oem = None
+    variables = {}
+    tokens = config.split()
+    i = 0
+    while i < len(tokens):
+        option = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if option in ("--psm", "-psm", "--oem", "-c") and value is None:
+            raise ValueError(f"Tesseract option {option} needs a value")
+        if option in ("--psm", "-psm"):
+            psm = int(value)
+        elif option == "--oem":
+            oem = int(value)
+        elif option == "-c" and "=" in value:
+            name, _, setting = value.partition("=")
+            variables[name] = setting
+        else:
+            raise ValueError(f"Unsupported Tesseract option '{option}'")
+        i += 2
+    return psm, oem, variables
+
+
+class _APIBackend:
+    """
+    Tesseract loaded in-process through tesserocr; the language model stays
+    loaded for the life of the worker and recognition releases the GIL.
+    Each image is recognized with the time left before the batch deadline;
+    once it has passed the rest of the batch is not run.
+    """
+
+    def __init__(self, cmd, lang, config):
+        psm, oem, variables = _parse_config(config)
+        tessdata = os.path.join(os.path.dirname(cmd), "tessdata")
+        kwargs = {"lang": lang}
+        if os.path.isdir(tessdata):
+            kwargs["path"] = tessdata
+        if oem is not None:
+            kwargs["oem"] = tesserocr.OEM(oem)
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        if psm is not None:
+            self.api.SetPageSegMode(tesserocr.PSM(psm))
+        for name, setting in variables.items():
+            if not self.api.SetVariable(name, setting):
+                raise ValueError(f"Unknown Tesseract variable '{name}'")
+
+    def read(self, images, timeout):
+        """
+        Texts of the images recognized before the deadline, in order; the
+        list is short when time ran out.
+        """
+        deadline = time.monotonic() + timeout
+        texts = []
+        for image in images:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.api.SetImage(Image.fromarray(image))
+            # Recognize() gives up (returns False) past its timeout in ms
+            if not self.api.Recognize(timeout=max(1, int(remaining * 1000))):
+                break
+            texts.append(self.api.GetUTF8Text())
+        return texts
+
+    def close(self):
+        self.api.End()
+
+
+class _CLIBackend:
+    """
+    The tesseract executable, fed a batch as one multi-page TIFF over stdin
+    and read back from stdout (pages are separated by form feeds), with no
+    temporary files. The CLI has no persistent mode, so unlike the API
+    backend this starts one tesseract process per batch: batching is what
+    amortizes the process start, not a long-lived worker.
+    """
+
+    def __init__(self, cmd, lang, config):
+        self.args = [cmd, "stdin", "stdout", "-l", lang] + config.split()
+
+    def read(self, images, timeout):
+        pages = [Image.fromarray(image) for image in images]
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format="TIFF", save_all=True, append_images=pages[1:])
+        try:
+            result = subprocess.run(
+                self.args,
+                input=buffer.getvalue(),
+                capture_output=True,
+                timeout=timeout,
+                creationflags=_NO_WINDOW,
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"tesseract took longer than {timeout:.1f}s")
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors="replace").strip())
+        texts = result.stdout.decode("utf-8", errors="replace").split("\f")
+        if len(texts) < len(images):
+            raise RuntimeError("tesseract returned fewer pages than it was given")
+        return texts[: len(images)]
+
+    def close(self):
+        pass
+
+
+class TesseractPool:
+    """
+    Long-lived Tesseract workers behind a request queue.
+
+    Each worker thread owns a backend: the in-process tesserocr API when it
+    is installed (models loaded once per worker), otherwise the tesseract
+    executable fed over pipes, which starts one process per batch. A worker takes up to batch_size waiting
+    requests at a time and recognizes them in one go. Every request has a
+    deadline; requests that expire while queued are failed with
+    TimeoutError without being run.
+
+    get_cmd() returns the configured tesseract executable and is checked
+    before every batch, so changing the path takes effect immediately.
+    """
+
+    def __init__(
+        self,
+        get_cmd,
+        workers=2,
+        lang="eng",
+        config="",
+        timeout=10.0,
+        batch_size=8,
+        log_message=None,
+    ):
+        self.get_cmd = get_cmd
+        self.workers = workers
+        self.lang = lang
+        self.config = config
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.log_message = log_message
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def available(self):
+        cmd = self.get_cmd()
+        return bool(cmd) and (
+            tesserocr is not None or os.path.isfile(cmd) or bool(shutil.which(cmd))
+        )
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Tesseract pool is closed")
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name="tesseract", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, image, timeout=None):
+        """
+        Queue a gray or RGB image; returns a Future of its text.
+        """
+        self._ensure_workers()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        request = _Request(image, deadline)
+        self._queue.put(request)
+        return request.future
+
+    def read(self, image, timeout=None):
+        timeout = timeout or self.timeout
+        return self.submit(image, timeout).result(timeout)
+
+    def read_batch(self, images, timeout=None):
+        """
+        Text of every image; the requests are queued together so the
+        workers can batch them.
+        """
+        timeout = timeout or self.timeout
+        futures = [self.submit(image, timeout) for image in images]
+        deadline = time.monotonic() + timeout
+        return [f.result(max(0.0, deadline - time.monotonic())) for f in futures]
+
+    def _backend(self, cmd):
+        if tesserocr is not None:
+            return _APIBackend(cmd, self.lang, self.config)
+        return _CLIBackend(cmd, self.lang, self.config)
+
+    def _take_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # Leave the stop signal for later
+                break
+            batch.append(request)
+        return batch
+
+    def _work(self):
+        backend, backend_cmd = None, None
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                break
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                if request.deadline <= now:
+                    request.future.set_exception(
+                        TimeoutError("OCR request expired in the queue")
+                    )
+                elif request.future.set_running_or_notify_cancel():
+                    live.append(request)
+            if not live:
+                continue
+
+            try:
+                cmd = self.get_cmd()
+                if backend is None or cmd != backend_cmd:
+                    if backend is not None:
+                        backend.close()
+                    backend, backend_cmd = self._backend(cmd), cmd
+                timeout = max(r.deadline for r in live) - now
+                texts = backend.read([r.image for r in live], timeout)
+            except Exception as e:
+                for request in live:
+                    request.future.set_exception(e)
+                if backend is not None and not isinstance(e, TimeoutError):
+                    backend.close()
+                    backend = None  # Start over with a fresh backend
+                continue
+            with self._lock:
+                self.batches += 1
+                self.requests += len(live)
+            for request, text in zip(live, texts):
+                request.future.set_result(text)
+            for request in live[len(texts) :]:
+                # The backend ran out of time before reaching these
+                request.future.set_exception(
+                    TimeoutError("OCR request timed out in tesseract")
+                )
+        if backend is not None:
+            backend.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=1.0)
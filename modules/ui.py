@@ -195,6 +195,10 @@ def setup_ui(self):
     ttk.Checkbutton(
         repeat_frame, text="Infinitely", variable=self.repeat_infinite_var
     ).grid(row=0, column=2, sticky="w", padx=5)
+    self.optimize_macro_btn = ttk.Button(
+        repeat_frame, text="Optimize Macro", command=self.optimize_selected_macro
+    )
+    self.optimize_macro_btn.grid(row=0, column=3, sticky="e", padx=5)
 
     # Define automation_ctrl_frame
     automation_ctrl_frame = ttk.LabelFrame(
@@ -209,6 +213,23 @@ def setup_ui(self):
         command=self.auto_farm_macro,
     ).grid(row=0, column=0, padx=5, pady=5, sticky="ew")
 
+    # Sessions run on the selected window alongside those on other windows
+    ttk.Button(
+        automation_ctrl_frame,
+        text="Farm in Session",
+        command=self.start_farm_session,
+    ).grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+    ttk.Button(
+        automation_ctrl_frame,
+        text="Play Macro in Session",
+        command=self.start_macro_session,
+    ).grid(row=1, column=0, padx=5, pady=5, sticky="ew")
+    ttk.Button(
+        automation_ctrl_frame,
+        text="Stop Sessions",
+        command=self.stop_sessions,
+    ).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
     # Macro Library Frame
     lib_frame = ttk.Frame(macro_frame)
     lib_frame.grid(row=3, column=0, columnspan=4, sticky="ew", pady=5)  # Move to row 3
@@ -243,6 +264,16 @@ def setup_ui(self):
     self.tesseract_entry.grid(row=0, column=1, sticky="ew", padx=5)
     ocr_frame.columnconfigure(1, weight=1)
 
+    capture_frame = ttk.LabelFrame(self.config_tab, text="Capture Settings", padding=5)
+    capture_frame.grid(row=2, column=0, sticky="ew", padx=5, pady=5)
+    self.roi_capture_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(
+        capture_frame,
+        text="Capture only ROIs and search windows",
+        variable=self.roi_capture_var,
+        command=self.toggle_roi_capture,
+    ).grid(row=0, column=0, sticky="w")
+
     # --- About Tab Layout ---
     about_frame = ttk.Frame(self.about_tab, padding=5)
     about_frame.grid(row=0, column=0, sticky="nsew")